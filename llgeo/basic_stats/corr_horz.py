@@ -75,22 +75,18 @@ def get_dist_and_angl(data):
 
 def get_pairings(data, dist_matrix, angl_matrix):
 
-    # Get all possible combinations of CPTs
+    # Get all possible combinations of CPTs (upper triangle, including A = B)
     names = np.unique(data['name'])
-    pairs = []
+    iA, iB = np.triu_indices(len(names))
 
-    for i, one_name in enumerate(names):
+    # Look up all distances and angles at once
+    dists = dist_matrix.loc[names, names].values
+    angls = angl_matrix.loc[names, names].values
 
-        pairB = np.array(names[i:])
-        pairA = np.array([one_name] * len(pairB))
-
-        dist  = [float(dist_matrix.loc[A, B]) for A, B  in zip(pairA, pairB)] 
-        angl  = [float(angl_matrix.loc[A, B]) for A, B  in zip(pairA, pairB)]
-
-        pairs += [np.stack([pairA, pairB, dist, angl], axis = 1)]
-
-    pairs = np.concatenate(pairs, axis=0)
-    pairs = pd.DataFrame(pairs, columns=['A','B','dist','angl'])
+    pairs = pd.DataFrame({'A'   : names[iA],
+                          'B'   : names[iB],
+                          'dist': dists[iA, iB].astype(float),
+                          'angl': angls[iA, iB].astype(float)})
 
     return pairs
 
@@ -138,47 +134,40 @@ def calc_coeffs(pairs, resampled, min_pts, glob_mean = None, glob_stdv = None):
     # Initialize output
     all_corr_coeffs = pairs.copy()
 
-    # Calculate correlation coefficient between all test pairs
-    for pair_idx, pair_row in pairs.iterrows():
-
-        # Print progress
-        if (pair_idx) % 500 == 0:
-            print('{:4.2f}%'.format(100*(pair_idx+1)/len(pairs)))
-
-        # Extract names
-        nameA, nameB = pair_row['A'], pair_row['B']
-    
-        # Extract available data for this pair
-        pair_data = resampled.loc[:, ['mean', 'stdv', nameA, nameB]]
-        pair_data.dropna(inplace = True)
-        num_pts = len(pair_data)
-
-        if num_pts > min_pts:
-
-            if nameA == nameB:
-                vA = pair_data[nameA].values[:, 0]
-                vB = pair_data[nameB].values[:, 1]
-            else:
-                vA = pair_data[nameA].values 
-                vB = pair_data[nameB].values
-
-            # if glob_mean is None:
-            #     mean = pair_data['mean'].values
-            # else:
-            #     mean = glob_mean
-            
-            # if glob_stdv is None:
-            #     stdv = pair_data['stdv'].values
-            # else:
-            #     stdv = glob_stdv
-
-            corr_coeff = np.average((vA - np.mean(vA)) * (vB - np.mean(vB)) / (np.std(vA, ddof = 1) * np.std(vB, ddof = 1)))
-
-        else:
-            corr_coeff = np.nan
-
-        all_corr_coeffs.loc[pair_idx, 'corr_coeff'] = corr_coeff
-        all_corr_coeffs.loc[pair_idx, 'num_pts'] = num_pts
+    # Soundings x depth-bins as a masked array: a value is only used if it
+    # exists, and if the depth bin has a mean and stdv (as in dropna before)
+    names = np.unique(np.concatenate([pairs['A'].values, pairs['B'].values]))
+    V = resampled.loc[:, names].values.astype(float)
+    ok_bins = resampled[['mean', 'stdv']].notna().values.all(axis = 1)
+    M = ~np.isnan(V) & ok_bins[:, None]
+
+    # Center values (doesn't change coefficients, but avoids round-off errors)
+    V = np.where(M, V, np.nan)
+    with np.errstate(invalid = 'ignore'):
+        V = np.where(M, V - np.nanmean(V, axis = 0), 0)
+    M = M.astype(float)
+
+    # Sums over depth bins where both soundings have data (for all pairs)
+    N    = M.T @ M             # number of points
+    S    = V.T @ M             # S[a, b] = sum of a values (where b exists)
+    SS   = (V**2).T @ M        # sum of squared a values (where b exists)
+    SAB  = V.T @ V             # sum of products of a and b values
+
+    # Correlation coefficients for the requested pairs
+    a = pd.Index(names).get_indexer(pairs['A'])
+    b = pd.Index(names).get_indexer(pairs['B'])
+    n = N[a, b]
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        cov   = (SAB[a, b] - S[a, b] * S[b, a] / n) / n
+        var_A = (SS[a, b] - S[a, b]**2 / n) / (n - 1)
+        var_B = (SS[b, a] - S[b, a]**2 / n) / (n - 1)
+        corr_coeff = cov / np.sqrt(var_A * var_B)
+
+    corr_coeff[n <= min_pts] = np.nan
+
+    all_corr_coeffs['corr_coeff'] = corr_coeff
+    all_corr_coeffs['num_pts'] = n
         
     return all_corr_coeffs
 
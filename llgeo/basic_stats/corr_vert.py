@@ -8,9 +8,18 @@ TODO: - add proper references to dr. fenton's books including formulas
 
 '''
 
+import hashlib
 import numpy as np
 import pandas as pd
 import scipy.optimize as op
+from concurrent.futures import ProcessPoolExecutor
+
+# Results of many_corr_fun_nonequisp for each process, keyed by a hash of the
+# data and options (see process_key), so that re-runs skip repeated work. Only
+# used if cache = True, and only the CORR_CACHE_SIZE most recently used results
+# are kept (they include all pairwise coefficients). Clear with .clear()
+CORR_CACHE = {}
+CORR_CACHE_SIZE = 64
 
 # ------------------------------------------------------------------------------
 # Functions for Single Process with Equispaced Data
@@ -27,6 +36,10 @@ def corr_fun_equisp(data, mean, std):
 
     IMPORTANT: THIS FUNCTION ASSUMES EQUISPACED DATA
 
+    The sums of products at each lag are calculated as an autocorrelation with
+    FFTs (zero-padded to avoid wrap-around), which takes O(n log n) time and
+    O(n) memory instead of building the full n x n matrix of products.
+
     Parameters
     ----------
     data : numpy array
@@ -56,13 +69,12 @@ def corr_fun_equisp(data, mean, std):
     n     = len(data)
     lag   = np.arange(0, n)
     
-    # Calculate correlation coefficients (see Fenton's notes)
-    R     = data.reshape(n, 1) - mean
-    M     = R * R.T / std**2
-    rho   = np.array([np.sum(np.diag(M, k = j)) / (n-j) for j in range(0, n)])
-    
-    # For debugging mostly... (or messing around)
-    nonavg_rho = np.array([np.sum(np.diag(M, k = j)) for j in range(0, n)])
+    # Calculate correlation coefficients (see Fenton's notes), where the sum
+    # of R[i] * R[i + j] for each lag j is the (linear) autocorrelation of R
+    R     = np.reshape(data, -1) - mean
+    F     = np.fft.rfft(R, n = 2 * n)
+    nonavg_rho = np.fft.irfft(F * np.conj(F), n = 2 * n)[:n] / std**2
+    rho   = nonavg_rho / (n - lag)
     
     return(lag, rho, nonavg_rho)
 
@@ -114,19 +126,12 @@ def corr_coeffs_1D(x, y):
     miu = np.mean(y)
     std = np.std(y) # (Note that DDOF = 0)
 
-    # Get distance matrix and all possible ij pairs
-    dist_matrix = np.abs(x.reshape(n, 1) - x.reshape(1, n))
-    ij_pairs = [(i, j) for i in range(n) for j in np.arange(i, n)]
+    # Get all possible ij pairs (upper triangle, including i = j)
+    i, j = np.triu_indices(n)
 
     # Get distance and correlation vectors
-    dist, corr = [], []
-    for (i, j) in ij_pairs:
-        dist += [ dist_matrix [i, j]]
-        corr += [ (y[i] - miu) * (y[j] - miu) / (std ** 2) ]
-
-    # Return as np arrays
-    dist = np.array(dist)
-    corr = np.array(corr)
+    dist = np.abs(x[i] - x[j])
+    corr = (y[i] - miu) * (y[j] - miu) / (std ** 2)
 
     return dist, corr
 
@@ -181,42 +186,110 @@ def corr_fun_nonequisp(sep_dist, corr_coeff, intv, min_pts):
         mssg += '   Instead, it is: ' + str(type(corr_coeff))
         raise Exception(mssg)
 
-    # Initalize output
-    corr_fun = []
+    # Get separation distance bins in which to calculate correlation func.
+    edges = get_edges(intv, np.max(sep_dist))
 
-    # Start with zero distance
-    mask_0 = (sep_dist == 0)
-    corr_fun = [ [0, 0, 0, np.sum(mask_0), np.average(corr_coeff[mask_0])] ]
+    # Number of points and sum of coefficients in each bin (zero dist first)
+    n, sums = bin_coeffs(sep_dist, corr_coeff, edges)
 
-    # Get separation distance bins in which to calculate correlation func.
-    edges = np.arange(intv/2, np.max(sep_dist) + intv/2, intv) # Target loc of bins
+    return binned_corr_fun(n, sums, edges, min_pts)
+
+
+def get_edges(intv, max_dist, extra = 0):
+    ''' Separation distance bin edges used by corr_fun_nonequisp.
+
+    Purpose
+    -------
+    Returns edges at (1/2*intv, 3/2*intv, ...) up to max_dist (see
+    corr_fun_nonequisp), plus "extra" edges. Since numpy's arange calculates
+    each value as start + i * step, the edges for a smaller max_dist are always
+    exactly the first entries of those for a larger one, so binned statistics
+    from different processes can be added bin by bin.
+
+    Parameters
+    ----------
+    intv : float
+        Separation distance interval (see corr_fun_nonequisp)
+
+    max_dist : float
+        Maximum separation distance
+
+    extra : int (optional)
+        Number of additional edges after the last one. Defaults to 0.
+
+    Returns
+    -------
+    edges : numpy array
+        Bin edges.
+    '''
+
+    return np.arange(intv/2, max_dist + intv/2 + extra * intv, intv)
+
+
+def bin_coeffs(sep_dist, corr_coeff, edges):
+    ''' Binned sufficient statistics of correlation coefficients.
+
+    Purpose
+    -------
+    Counts the number of correlation coefficients, and adds them up, at zero
+    distance and in each separation distance bin [edges[k], edges[k+1]).
+    Values that fall outside of all bins are ignored. These sums and counts are
+    all that is needed for corr_fun_nonequisp, and they can be added across
+    processes (see many_corr_fun_nonequisp).
+
+    Parameters
+    ----------
+    sep_dist : numpy array
+        Separation distance between the calculated correlation coefficients.
+
+    corr_coeff : numpy array
+        Calculated correlation coefficient at a given sep_dist
+
+    edges : numpy array
+        Bin edges (see get_edges)
 
-    # Iterate through each separtion distance "bin"
-    for d_from, d_to in zip(edges[:-1], edges[1:]):
+    Returns
+    -------
+    n : numpy array
+        Number of points at zero distance (first entry) and in each bin
+
+    sums : numpy array
+        Sum of correlation coefficients at zero distance (first entry) and in
+        each bin
+    '''
+
+    nbins = max(len(edges) - 1, 0)
 
-        # Determine center of interval
-        d_center = np.average([d_from, d_to])
+    # Bin index of each value (-1 is zero distance, -2 is everything else that
+    # falls outside of the bins), such that edges[k] <= sep_dist < edges[k+1]
+    k = np.searchsorted(edges, sep_dist, side = 'right') - 1
+    k[(k < 0) | (k >= nbins)] = -2
+    k[sep_dist == 0] = -1
 
-        # Determine which values are within this distance "bin"
-        mask = (sep_dist >= d_from) & (sep_dist < d_to)
-        binned_coeff = corr_coeff[mask]
+    keep = (k > -2)
+    n    = np.bincount(k[keep] + 1, minlength = nbins + 1)
+    sums = np.bincount(k[keep] + 1, weights = corr_coeff[keep],
+                       minlength = nbins + 1)
 
-        # Determine number of datapoints within this "bin"
-        n = np.sum(mask)
+    return n, sums
 
-        # If there are less points that required, return NaNs
-        if n <= min_pts:
-            corr_fun += [ [d_from, d_to, d_center, n, np.nan] ]
 
-        # Otherwise, return correlation function parameters
-        else:
-            # mean = np.average(binned_coeff) # Talk to Fenton
-            mean = np.sum(binned_coeff) / (np.sum(mask))
-            corr_fun += [ [d_from, d_to, d_center, n, mean] ]
+def binned_corr_fun(n, sums, edges, min_pts):
+    ''' Correlation function (dataframe) from binned sufficient statistics
+        (see bin_coeffs and corr_fun_nonequisp) '''
+
+    # Mean of coefficients; NaNs where there are less points than required
+    # (except for zero distance, which is always returned)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean = sums / n                 # mean = np.average(...) # Talk to Fenton
+    mean[1:][n[1:] <= min_pts] = np.nan
 
     # Turn result into a pandas dataframe to make columns more clear
-    cols = ['dist_from', 'dist_to', 'dist_mid', 'num_pts', 'corr_fun']
-    corr_fun = pd.DataFrame(corr_fun, columns = cols)
+    corr_fun = pd.DataFrame({'dist_from': np.r_[0, edges[:-1]],
+                             'dist_to'  : np.r_[0, edges[1:]],
+                             'dist_mid' : np.r_[0, (edges[:-1] + edges[1:])/2],
+                             'num_pts'  : n,
+                             'corr_fun' : mean})
     
     return corr_fun
 
@@ -226,7 +299,8 @@ def corr_fun_nonequisp(sep_dist, corr_coeff, intv, min_pts):
 # ------------------------------------------------------------------------------
 
 def many_corr_fun_nonequisp(df, xcol, ycol, icol, logT = False, min_result = 5,
-                            fun_opts = {}):
+                            fun_opts = {}, fits = {}, nworkers = None,
+                            cache = False):
     ''' Estim. of correl. coeffs. and funct. for *many* nonequispaced processes
         
     Purpose
@@ -245,6 +319,12 @@ def many_corr_fun_nonequisp(df, xcol, ycol, icol, logT = False, min_result = 5,
     correlation structure. The applicability of that assumption is left up to
     the user.)
 
+    Each process is handled separately (coefficients, local function, and fits)
+    on a process pool. The global function is assembled from the binned sums
+    and counts of each process (see bin_coeffs), which gives the same result
+    as binning all of the coefficients together. Optionally, results for each
+    process are cached in CORR_CACHE by a hash of its data and the options used.
+
     Parameters
     ----------
     df : dataframe
@@ -273,6 +353,20 @@ def many_corr_fun_nonequisp(df, xcol, ycol, icol, logT = False, min_result = 5,
         Contains keyword arguments to be passed to "corr_fun_nonequisp", which
         estimates the correlation funciton from correlation coefficients.
         It defaults to: {'intv' : 1, 'min_pts' : 10, 'min_result':5}
+
+    fits : dict (optional)
+        Theoretical correlation functions to fit to each local correlation
+        function, as {name : theta_guess}, where name is 'markov' (markov_fun)
+        or 'gaussian' (gaussian_fun). Fitted thetas are added to local_funs as
+        columns 'theta_' + name. Defaults to {} (no fits).
+
+    nworkers : int (optional)
+        Number of processes to use. Defaults to None, so that all cores are
+        used. If nworkers = 1, everything is run in this process.
+
+    cache : bool (optional)
+        Whether to use (and store) cached results in CORR_CACHE, which keeps
+        the CORR_CACHE_SIZE most recently used processes. Defaults to False.
         
     Returns
     -------
@@ -283,7 +377,7 @@ def many_corr_fun_nonequisp(df, xcol, ycol, icol, logT = False, min_result = 5,
         
     local_funs : dataframe
         Estimated correlation function calculated separately for each observed
-        process and then concatenated together.
+        process and then concatenated together (with fitted thetas, if any).
 
     global_fun : dataframe
         Estimated correlation function calculated based on corr_coeffs, but 
@@ -296,53 +390,149 @@ def many_corr_fun_nonequisp(df, xcol, ycol, icol, logT = False, min_result = 5,
     * This isn't the traditional way of doing this, but... ¯|_(ツ)_|¯
     '''
     
-    # Initalize outputs
-    corr_coeffs = []
-    local_funs = []
-
     # Update to user-defined options for correlation function
     opts = {'intv' : 1, 'min_pts' : 10}
     opts.update(fun_opts)
 
-    # Iterate through grouped dataframes
+    # Inputs for each process, and their keys in the cache
+    ids, args, keys = [], [], []
     for id, data in df.groupby(icol):
+        x = data[xcol].values.astype(float)
+        y = data[ycol].values.astype(float)
+        ids  += [ id ]
+        args += [ (x, y, logT, min_result, opts, fits) ]
+        keys += [ process_key(*args[-1]) ]
+
+    # Get cached results first (so they can't be evicted by new ones), moving
+    # them to the end of the cache as most recently used
+    results = [None] * len(ids)
+    if cache:
+        for i, key in enumerate(keys):
+            if key in CORR_CACHE:
+                results[i] = CORR_CACHE.pop(key)
+                CORR_CACHE[key] = results[i]
+
+    # Run processes that are not cached yet
+    todo = [i for i, result in enumerate(results) if result is None]
+    todo_args = [args[i] for i in todo]
+
+    if nworkers == 1 or len(todo) < 2:
+        new = list(map(process_corr, todo_args))
+    else:
+        with ProcessPoolExecutor(max_workers = nworkers) as pool:
+            new = list(pool.map(process_corr, todo_args))
+
+    for i, result in zip(todo, new):
+        results[i] = result
+        if cache: cache_result(keys[i], result)
 
-        # Get values (transform to logarithmic scale if needed)
-        yvals = data[ycol].values.astype(float)
-        if logT: yvals = np.log(yvals)
-
-        # Get correlation coefficients
-        kwargs = {'x' : data[xcol].values.astype(float),
-                  'y' : yvals} 
-        dist_array, coeff_array = corr_coeffs_1D(**kwargs)
+    # Initalize outputs
+    corr_coeffs = []
+    local_funs = []
+    ns, sums, max_dist = [], [], 0
 
-        if np.sum(~np.isnan(coeff_array)) < min_result:
+    for id, result in zip(ids, results):
+        if result is False:
             continue
 
         # Summarize correlation coefficient results in dataframe
-        coeff = pd.DataFrame({icol : [id] * len(coeff_array),
-                              'sep_dist' : dist_array,
-                              'corr_coeff' : coeff_array, })
+        coeff = pd.DataFrame({icol : [id] * len(result['corr_coeff']),
+                              'sep_dist' : result['sep_dist'],
+                              'corr_coeff' : result['corr_coeff'], })
 
-        # Get the correlation function
-        fun = corr_fun_nonequisp(dist_array, coeff_array, **opts)
+        fun = result['corr_fun'].copy()
         fun[icol]  = [id] * len(fun)
 
         # Append to outputs
         corr_coeffs += [ coeff ]
         local_funs += [ fun ]
+        ns   += [ result['n'] ]
+        sums += [ result['sums'] ]
+        max_dist = max(max_dist, result['max_dist'])
 
     # Concatenate results into output dataframes
     corr_coeffs = pd.concat(corr_coeffs, axis = 0, ignore_index = True)
     local_funs  = pd.concat(local_funs,  axis = 0, ignore_index = True)
 
-    # Estimate a "global" correlation function
-    glob_fun = corr_fun_nonequisp(corr_coeffs['sep_dist'].values, 
-                                  corr_coeffs['corr_coeff'].values, **opts)
+    # Estimate a "global" correlation function by adding up binned statistics
+    # (bins of each process are the first bins of the global ones, and any
+    # bins beyond the global ones are dropped; see get_edges)
+    edges = get_edges(opts['intv'], max_dist)
+    nbins = max(len(edges) - 1, 0)
+    glob_n, glob_sums = np.zeros(nbins + 1, dtype = int), np.zeros(nbins + 1)
+    for n, s in zip(ns, sums):
+        m = min(len(n), nbins + 1)
+        glob_n[:m] += n[:m]
+        glob_sums[:m] += s[:m]
+
+    glob_fun = binned_corr_fun(glob_n, glob_sums, edges, opts['min_pts'])
                 
     return corr_coeffs, local_funs, glob_fun
 
 
+def process_corr(args):
+    ''' Correlation coefficients, local correlation function, fits, and binned
+        statistics of one process (runs in the worker processes; see
+        many_corr_fun_nonequisp). Returns False if the process is skipped. '''
+
+    x, y, logT, min_result, opts, fits = args
+
+    # Get values (transform to logarithmic scale if needed)
+    if logT: y = np.log(y)
+
+    # Get correlation coefficients
+    dist_array, coeff_array = corr_coeffs_1D(x, y)
+
+    if np.sum(~np.isnan(coeff_array)) < min_result:
+        return False
+
+    # Get the correlation function
+    fun = corr_fun_nonequisp(dist_array, coeff_array, **opts)
+
+    # Fit theoretical correlation functions to it
+    valid = fun['corr_fun'].notna()
+    tau, rho = fun.loc[valid, 'dist_mid'].values, fun.loc[valid, 'corr_fun'].values
+    fit_funs = {'markov' : markov_fun, 'gaussian' : gaussian_fun}
+    for name, theta_guess in fits.items():
+        fun['theta_' + name] = fit_funs[name](tau, rho, theta_guess)[0]
+
+    # Binned statistics, with one more bin than needed locally so that every
+    # coefficient falls in a bin that could be used by the global function
+    max_dist = np.max(dist_array)
+    n, sums = bin_coeffs(dist_array, coeff_array,
+                         get_edges(opts['intv'], max_dist, extra = 1))
+
+    result = {'sep_dist'   : dist_array,
+              'corr_coeff' : coeff_array,
+              'corr_fun'   : fun,
+              'n'          : n,
+              'sums'       : sums,
+              'max_dist'   : max_dist}
+
+    return result
+
+
+def cache_result(key, result):
+    ''' Stores result in CORR_CACHE, removing the least recently used results
+        if there are more than CORR_CACHE_SIZE '''
+
+    CORR_CACHE[key] = result
+    while len(CORR_CACHE) > CORR_CACHE_SIZE:
+        del CORR_CACHE[next(iter(CORR_CACHE))]
+
+
+def process_key(x, y, logT, min_result, opts, fits):
+    ''' Hash of the data and options of one process (key for CORR_CACHE) '''
+
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(x).tobytes())
+    h.update(np.ascontiguousarray(y).tobytes())
+    h.update(repr((len(x), logT, min_result, sorted(opts.items()),
+                   sorted(fits.items()))).encode())
+
+    return h.hexdigest()
+
+
 # ------------------------------------------------------------------------------
 # Theoretical Correlation Functions
 # ------------------------------------------------------------------------------
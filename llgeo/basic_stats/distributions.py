@@ -13,35 +13,110 @@ import numpy as np
 import pandas as pd
 import scipy as sp
 import scipy.stats as stats
+from concurrent.futures import ProcessPoolExecutor
 
 # ------------------------------------------------------------------------------
 # Main Functions
 # ------------------------------------------------------------------------------
-def sample_PMF(num_samples, pmf, x = False):
+def sample_PMF(num_samples, pmf, x = False, rng = None):
     ''' Sample from a probability mass function 
         num_samples = number of samples
         x = value of random variable (array same size as pmf)
         pmf = probability mass that X = x (array same size as x)
+        rng = numpy Generator (defaults to None, which uses np.random)
+
+        Wrapper around get_sampler and draw_samples; if sampling repeatedly 
+        from the same pmf, get the sampler once and use draw_samples instead.
+    '''
+
+    sampler = get_sampler(pmf, x)
+    sim = draw_samples(sampler, num_samples, rng)
+
+    if num_samples == 1:
+        sim = sim[0]
+
+    return sim
+
+
+def get_sampler(pmf, x = False):
+    ''' Precomputes what is needed to sample from a probability mass function
+        
+    Purpose
+    -------
+    Checks the probability mass function and computes its CDF once, so that
+    many batches of samples can be drawn with draw_samples without repeating
+    the setup (ex. in loops).
+        
+    Parameters
+    ----------
+    pmf : array
+        probability mass that X = x (must add up to 1, within round-off)
+
+    x : array (optional)
+        values of the random variable (same size as pmf). Defaults to False, so
+        that x = 0, 1, ..., len(pmf) - 1
+        
+    Returns
+    -------
+    sampler : dict
+        Contains 'cdf' (CDF at each x value) and 'x' (values of the random 
+        variable)
     '''
-    if (x) and (len(x) != len(pmf)):
+
+    pmf = np.asarray(pmf, dtype = float)
+
+    if x is False or x is None:
+        x = np.arange(len(pmf))
+
+    if len(x) != len(pmf):
         raise Exception('x and pmf must be same size')
 
-    if np.sum(pmf) != 1:
+    if not np.isclose(np.sum(pmf), 1):
         raise Exception('sum of pmf must equal 1')
 
-    if not x:
-        x = range(len(pmf))
+    # CDF, scaled by the sum of pmf and with the last value set to exactly 1
+    # (the division alone can still end slightly below 1 due to round-off)
+    cdf = np.cumsum(pmf) / np.sum(pmf)
+    cdf[-1] = 1.0
+    sampler = {'cdf' : cdf, 'x' : np.asarray(x)}
 
-    sim = np.empty(num_samples)
-    U = np.random.uniform(size = num_samples)
-    cdf = np.append([0], np.cumsum(pmf)) # CDF starting at zero
-    
-    for x_val, u_from, u_to in zip(x, cdf[:-1], cdf[1:]):
-        mask = (U >= u_from) & (U < u_to)
-        sim[mask] = x_val
+    return sampler
 
-    if num_samples == 1:
-        sim = sim[0]
+
+def draw_samples(sampler, num_samples, rng = None):
+    ''' Draws samples from a probability mass function (see get_sampler)
+        
+    Purpose
+    -------
+    Inverse CDF sampling: each uniform random number U is mapped to the value x
+    such that CDF(x-) <= U < CDF(x), found with a single searchsorted for the 
+    whole batch of samples.
+        
+    Parameters
+    ----------
+    sampler : dict
+        output of get_sampler
+        
+    num_samples : int
+        number of samples
+
+    rng : numpy Generator (optional)
+        Generator used for random numbers. Defaults to None, which uses the 
+        global np.random (so that np.random.seed applies)
+        
+    Returns
+    -------
+    sim : numpy array
+        Array of size num_samples with the sampled values (as floats)
+    '''
+
+    if rng is None: rng = np.random
+    U = rng.random(num_samples)
+
+    # Clip, in case a sampler's cdf ends slightly below 1 (U can be above it)
+    i = np.searchsorted(sampler['cdf'], U, side = 'right')
+    i = np.minimum(i, len(sampler['cdf']) - 1)
+    sim = sampler['x'][i].astype(float)
 
     return sim
 
@@ -97,7 +172,12 @@ def dist_profile(depth: np.array, values: np.array,
     bin_numbers : array
         Array of size equal to depth and values, which indicates the bin number
         of that measurement. If bin_number = 0, then not enough datapoints were
-        available to fit a distribution.
+        available to fit a distribution (or the value is outside of the bins).
+
+    Notes
+    -----
+    * All bins are processed at once: bin assignment with np.digitize, bin
+      statistics with np.bincount, and closed-form MLEs for both distributions.
     '''
 
     # Determine bins for data based on depth and intv
@@ -110,13 +190,6 @@ def dist_profile(depth: np.array, values: np.array,
     profile['to']     = bins_e[1:]
     profile['center'] = ( bins_e[1:] + bins_e[:-1] ) / 2
  
-    # Initialize a guess for mean and stdev to be used in distribution fit
-    guess_mean = np.mean(values)
-    guess_stdv = np.std(values)
-
-    # Initalize storage of added outputs
-    bin_numbers = np.empty(len(depth))
-
     # Initalize columns for outputs (and check dist is a match)
     cols = ['num_pts']
     if dist == 'norm':
@@ -128,45 +201,55 @@ def dist_profile(depth: np.array, values: np.array,
         raise Exception('dist not recognized. Change to "norm" or "lognorm"')
 
     cols += [dist + '_perc_{:d}'.format(int((100*p))) for p in perc]
-    results = np.empty((len(profile), len(cols)))
 
-    # Iterate through profile
-    bin_count = 1
-    for i, row in profile.iterrows():
-        
-        # Interval mask: determine which values are in this interval
-        imask = (depth >= row['from']) & (depth < row['to'])
-        results[i, 0] = np.sum(imask)
-       
-        # If there are not enough points, return NaN row
-        if sum(imask) < min_pts:
-            results[i, 1:] = ( len(cols) - 1 ) * [np.nan]
-            
-        # Normal distribution fit
-        elif dist == 'norm':
-            kwargs = {'loc': guess_mean, 'scale': guess_stdv}
-            mean_x, stdv_x = stats.norm.fit(values[imask], **kwargs)
-            ppf = stats.norm.ppf(perc, loc = mean_x, scale = stdv_x)
-            results[i, 1:] = np.append(np.array([mean_x, stdv_x]), ppf)
-                    
-        # Lognormal distribution fit
-        elif dist == 'lognorm':
-            kwargs = {'floc':0, 'scale' : np.exp(guess_mean)}
-            mean_lnx, stdv_lnx = lognorm_MLE(values[imask])
-            ppf = stats.lognorm.ppf(perc, s = stdv_lnx, scale = np.exp(mean_lnx))
-            mean_x,stdv_x = lognorm_to_norm(mean_lnx, stdv_lnx)
-            average = np.average(values[imask]) # for comparison to mean_x
-            results[i, 1:] = np.append(np.array([average, mean_x, stdv_x,
-                                                mean_lnx, stdv_lnx]), ppf)
-
-        # Determine bin number
-        if sum(imask) < min_pts:
-            bin_numbers[imask] = 0
-            profile.loc[i, 'bin'] = 0
-        else:
-            bin_numbers[imask] = bin_count
-            profile.loc[i, 'bin'] = bin_count
-            bin_count += 1
+    # Determine the bin of each value at once (from <= depth < to); values 
+    # outside of all bins get k = -1 and are ignored
+    nbins = len(profile)
+    k = np.digitize(depth, bins_e) - 1
+    k[(k < 0) | (k >= nbins)] = -1
+    inbin = (k >= 0)
+
+    # Number of points in each bin, and bins with enough points to fit
+    num_pts = np.bincount(k[inbin], minlength = nbins)
+    fitted = (num_pts >= min_pts)
+
+    # Mean and (MLE) standard deviation of values in each bin
+    def bin_mean_stdv(x):
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            mean = np.bincount(k[inbin], weights = x[inbin],
+                               minlength = nbins) / num_pts
+            squared = (x[inbin] - mean[k[inbin]]) ** 2
+            stdv = (np.bincount(k[inbin], weights = squared,
+                                minlength = nbins) / num_pts) ** 0.5
+        return mean, stdv
+
+    # Normal distribution fit (closed-form MLE, same as stats.norm.fit)
+    values = np.asarray(values, dtype = float)
+    if dist == 'norm':
+        mean_x, stdv_x = bin_mean_stdv(values)
+        ppf = stats.norm.ppf(np.reshape(perc, (1, -1)), loc = mean_x[:, None],
+                             scale = stdv_x[:, None])
+        params = [mean_x, stdv_x]
+
+    # Lognormal distribution fit (closed-form MLE, same as lognorm_MLE)
+    elif dist == 'lognorm':
+        average, _ = bin_mean_stdv(values) # for comparison to mean_x
+        mean_lnx, stdv_lnx = bin_mean_stdv(np.log(values))
+        ppf = stats.lognorm.ppf(np.reshape(perc, (1, -1)), s = stdv_lnx[:, None],
+                                scale = np.exp(mean_lnx)[:, None])
+        mean_x, stdv_x = lognorm_to_norm(mean_lnx, stdv_lnx)
+        params = [average, mean_x, stdv_x, mean_lnx, stdv_lnx]
+
+    results = np.column_stack([num_pts] + params + [ppf.reshape(nbins, -1)])
+
+    # If there are not enough points, return NaN row
+    results[~fitted, 1:] = np.nan
+
+    # Determine bin number (only count bins with enough points)
+    bin_count = np.where(fitted, np.cumsum(fitted), 0)
+    profile['bin'] = bin_count
+    bin_numbers = np.zeros(len(depth))
+    bin_numbers[inbin] = bin_count[k[inbin]]
     
     # Add results to profile dataframe (final output)
     profile.loc[:, cols] = results
@@ -349,3 +432,106 @@ def get_all_fits(data):
     fits_df = pd.DataFrame.from_dict(fits_dict)
     return(fits_df)
 
+
+# ------------------------------------------------------------------------------
+# Fits for Many Groups
+# ------------------------------------------------------------------------------
+
+def get_group_fits(df, vcol, gcol, nworkers = None):
+    ''' Fits distributions to many groups of data at once (see get_all_fits)
+        
+    Purpose
+    -------
+    Same estimators as get_all_fits (lognormal MME, MLE, and scipy's generic 
+    fit), plus the normal MLE, for every group in a long-format dataframe 
+    (ex. per layer, per site, per depth bin). Closed-form estimators are
+    calculated for all groups at once from grouped sums. Only scipy's generic
+    fit (pyMLE), which has no closed form, is run one group at a time, spread
+    over a process pool. Kolmogorov-Smirnov statistics and p-values of each fit
+    are returned in the same table.
+        
+    Parameters
+    ----------
+    df : dataframe
+        Long-format data, with at least columns [vcol, gcol]. Rows with NaNs
+        are ignored.
+        
+    vcol : str
+        Name of the column with the values to be fitted (must be positive)
+
+    gcol : str
+        Name of the column with the group key
+
+    nworkers : int (optional)
+        Number of processes to use for pyMLE. Defaults to None, so that all 
+        cores are used. If nworkers = 1, everything is run in this process.
+        
+    Returns
+    -------
+    fits : dataframe
+        One row per group (index is the group key), with columns:
+            num_pts
+            MME_*, MLE_*, pyMLE_* (same as get_all_fits), where * is: 
+                mu, std, mu_lnx, stdv_lnx
+            norm_mu, norm_std : normal MLE (std with ddof = 0)
+            ks_*, ks_p_* : K-S statistic and p-value, where * is: 
+                MME, MLE, pyMLE, norm
+    '''
+
+    # Sort values within each group (needed for K-S statistic)
+    data = df[[gcol, vcol]].dropna().sort_values([gcol, vcol], kind = 'stable')
+    codes, groups = pd.factorize(data[gcol], sort = True)
+    x = data[vcol].values.astype(float)
+    lnx = np.log(x)
+
+    # Grouped sums
+    sums = lambda w: np.bincount(codes, weights = w, minlength = len(groups))
+    n = np.bincount(codes, minlength = len(groups))
+    starts = np.r_[0, np.cumsum(n)[:-1]]
+
+    # Lognormal method of moments (same as lognorm_MME)
+    S1, S2 = sums(x), sums(x ** 2)
+    var_lnx = np.log(S2) - 2 * np.log(S1) + np.log(n)
+    params = {'MME' : (- np.log(S2)/2 + 2*np.log(S1) - 3/2*np.log(n),
+                       var_lnx ** .5)}
+
+    # Lognormal and normal maximum likelihood (same as lognorm_MLE)
+    mean_lnx = sums(lnx) / n
+    params['MLE'] = (mean_lnx, (sums((lnx - mean_lnx[codes]) ** 2) / n) ** .5)
+
+    mean_x = S1 / n
+    stdv_x = (sums((x - mean_x[codes]) ** 2) / n) ** .5
+
+    # Scipy's generic fit, one group per call, on a process pool
+    samples = np.split(x, starts[1:])
+    if nworkers == 1:
+        py_fits = list(map(py_lognorm_MLE, samples))
+    else:
+        chunk = max(1, len(samples) // (4 * (nworkers or 8)))
+        with ProcessPoolExecutor(max_workers = nworkers) as pool:
+            py_fits = list(pool.map(py_lognorm_MLE, samples, chunksize = chunk))
+    params['pyMLE'] = tuple(np.array(py_fits).reshape(-1, 2).T)
+
+    # Organize fitted parameters
+    fits = pd.DataFrame({'num_pts' : n}, index = pd.Index(groups, name = gcol))
+    for method, (mu_lnx, stdv_lnx) in params.items():
+        mu, std = lognorm_to_norm(mu_lnx, stdv_lnx)
+        for p, val in zip(['mu', 'std', 'mu_lnx', 'stdv_lnx'],
+                          [mu, std, mu_lnx, stdv_lnx]):
+            fits[method + '_' + p] = val
+    fits['norm_mu'] = mean_x
+    fits['norm_std'] = stdv_x
+
+    # Kolmogorov-Smirnov statistic of each fit, from the sorted values
+    i = np.arange(len(x)) - starts[codes] + 1 # position within group
+    cdfs = {m : stats.norm.cdf((lnx - mu[codes]) / std[codes])
+                for m, (mu, std) in params.items()}
+    cdfs['norm'] = stats.norm.cdf((x - mean_x[codes]) / stdv_x[codes])
+
+    for method, F in cdfs.items():
+        d = np.maximum(i / n[codes] - F, F - (i - 1) / n[codes])
+        D = np.maximum.reduceat(d, starts) if len(d) else d
+        fits['ks_' + method] = D
+        fits['ks_p_' + method] = stats.kstwo.sf(D, n)
+
+    return fits
@@ -10,7 +10,6 @@ This module contains the following (main) functions:
 
 '''
 import numpy as np
-import llgeo.basic_stats.distributions as llgeo_dist
 # ------------------------------------------------------------------------------
 # Main Functions
 # ------------------------------------------------------------------------------
@@ -63,24 +62,25 @@ def fit_MC(processes, return_counts = False):
     if np.min(all_states) > 0:
         print('WARNING! States must be zero-indexed.')
     
-    # Initialize matrices 
-    states = np.zeros(num_states) # uncond. prob of starting trans. at state
-    transitions = np.zeros((num_states, num_states)) # transition prob.
-    initial = np.zeros(num_states) # prob. of being in state at process[0]
-
-    # Iterate through each observed process
-    for process in processes:
-        # Get rid of nans and sure that process is int and not float
-        mask = ~np.isnan(process)
-        process = np.array(process[mask], dtype = int)
-
-        # Update inital state count
-        initial[process[0]]+= 1
-
-        # Iterate through subsequent pairs of observations in process
-        for previous, nextt in zip(process[:-1], process[1:]):
-            states[previous] += 1 
-            transitions[previous, nextt] += 1
+    # Label each observation with its process, then get rid of nans and make
+    # sure that processes are int and not float
+    lengths = [len(process) for process in processes]
+    labels = np.repeat(np.arange(len(processes)), lengths)
+    mask = ~np.isnan(all_states)
+    all_states = np.array(all_states[mask], dtype = int)
+    labels = labels[mask]
+
+    # Initial state of each process, and subsequent pairs of observations
+    # (pairs that would join two different processes are excluded)
+    first = np.r_[True, labels[1:] != labels[:-1]]
+    same = ~first[1:]
+    previous, nextt = all_states[:-1][same], all_states[1:][same]
+
+    # Count initial states, and transitions from each state (and to each state)
+    initial = np.bincount(all_states[first], minlength = num_states) * 1.
+    states = np.bincount(previous, minlength = num_states) * 1.
+    transitions = np.zeros((num_states, num_states))
+    np.add.at(transitions, (previous, nextt), 1)
 
     # Turn counts to probabilites
     P = transitions / states.reshape(-1, 1)
@@ -100,7 +100,7 @@ def fit_MC(processes, return_counts = False):
 
     return outputs
 
-def sim_MC(num_sims, sims_length, P, I):
+def sim_MC(num_sims, sims_length, P, I, seed = None):
     ''' Returns realizations of a random process using a simple Markov Chain.
         
     Purpose
@@ -123,6 +123,10 @@ def sim_MC(num_sims, sims_length, P, I):
     I : numpy array
         Vector of size (num_states) where element I(i) is the unconditional 
         probability that the process starts at state i.     
+
+    seed : int or numpy Generator (optional)
+        Seed (or generator) passed to np.random.default_rng. Defaults to None,
+        which uses the global np.random (so that np.random.seed applies).
         
     Returns
     -------
@@ -132,40 +136,78 @@ def sim_MC(num_sims, sims_length, P, I):
     Notes
     -----
     * Not the most sophisticated model... ¯|_(ツ)_|¯
+    * All chains are advanced together, one step at a time, by inverse CDF
+      sampling (see trans_cdf) from one block of uniform random numbers.
+      With np.random.seed, results are reproducible but not the same numbers
+      as in earlier versions (which drew one sample at a time).
     '''
 
-    xs = [] # List to store all simulated processes
-    
-    for _ in range(num_sims):
-        x = np.empty(sims_length) # Array to store random process
+    P = np.asarray(P, dtype = float)
+    num_states = len(I)
+
+    # Uniform random numbers for all chains and steps at once
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    U = rng.random((num_sims, sims_length))
 
-        # Determine the value of the first element 
-        x[0] = llgeo_dist.sample_PMF(num_samples = 1, pmf = I)
+    # Determine the value of the first element 
+    x = np.empty((num_sims, sims_length), dtype = int)
+    x[:, 0] = np.searchsorted(np.cumsum(I), U[:, 0], side = 'right')
+    x[:, 0] = np.minimum(x[:, 0], num_states - 1)
 
-        # Iterate through the length of the random process
-        for i in range(len(x) - 1):
+    # Iterate through the length of the random process (all chains at once)
+    cdf, valid = trans_cdf(P)
 
-            # Determine probabity mass function based on "previous" state
-            trans_pmf = P[int(x[i]), :]
+    for i in range(sims_length - 1):
 
-            # Determine the next state
-            x[i + 1] = llgeo_dist.sample_PMF(num_samples = 1, pmf = trans_pmf)
+        # Transition probabilites must exist for the "previous" state
+        if not np.all(valid[x[:, i]]):
+            raise Exception('sum of pmf must equal 1')
 
-        # Add result to outputs
-        xs += [x]
+        # Determine the next state
+        j = np.searchsorted(cdf, U[:, i + 1] + x[:, i], side = 'right')
+        x[:, i + 1] = np.minimum(j - x[:, i] * num_states, num_states - 1)
+
+    # Return as a list of (float) arrays, as before
+    xs = list(x.astype(float))
 
     return xs
 
-    
 
 
+# ------------------------------------------------------------------------------
+# Helper Functions
+# ------------------------------------------------------------------------------
 
+def trans_cdf(P):
+    ''' Cumulative transition probabilities of all states, in one sorted array.
 
-        
+    Purpose
+    -------
+    Returns the cumulative sum of each row of P, offset by the row number, and
+    flattened. Since each row goes from i to i + 1, the result is sorted, and
+    the next state of a chain in state i is found with a single searchsorted of
+    (i + u) for a uniform u, followed by subtracting i * num_states.
+
+    Parameters
+    ----------
+    P : numpy array
+        Transition matrix of size (num_states x num_states)
 
+    Returns
+    -------
+    cdf : numpy array
+        Flattened cumulative transition probabilities, of size num_states**2
+
+    valid : numpy array
+        Boolean array of size num_states; False for states where the transition
+        probabilities do not add up to 1 (ex. NaNs for states that were never
+        left in the observed processes). These rows are replaced by zeros.
+    '''
 
+    num_states = len(P)
+    valid = np.isclose(np.sum(P, axis = 1), 1)
 
+    C = np.cumsum(np.where(valid[:, None], P, 0), axis = 1)
+    C = np.minimum(C, 1) + np.arange(num_states).reshape(-1, 1)
 
-# ------------------------------------------------------------------------------
-# Helper Functions
-# ------------------------------------------------------------------------------
\ No newline at end of file
+    return C.flatten(), valid
\ No newline at end of file
@@ -18,6 +18,9 @@ The workflow is as follows:
    paired data with a range of "mid_depth" are considered. A minimum number of 
    points (min_pts) may be specified as a requirement to calculate corr coeffs.
    (see function: get_IL_corr_coeffs).
+4. Realizations of the first order auto-regressive model are generated for
+   given interlayer correlation coefficients, either one at a time or in
+   batches of many profiles (see functions: gen_toro_realization(s)).
 '''
 
 import numpy as np
@@ -38,17 +41,58 @@ def gen_toro_realization(u_lnvs, corr_coeffs, sigma_lnvs):
     sigma_lnvs = float with standard deviation
     '''
 
-    Z = np.empty_like(u_lnvs)
-    Z[0] = np.random.normal(0, 1)
-
-    for i, rho in enumerate(corr_coeffs):
-        epsilon = np.random.normal(0, 1)
-        Z[i + 1] = rho * Z[i] + epsilon * (1 - rho**2) ** 0.5
+    # Same random draws (in the same order) as one at a time
+    epsilon = np.random.normal(0, 1, size = (1, len(u_lnvs)))
+    Z = toro_recurrence(epsilon, corr_coeffs)[0]
     
     Vs = np.exp(u_lnvs + Z * sigma_lnvs)
     return Z, Vs
 
 
+def gen_toro_realizations(u_lnvs, corr_coeffs, sigma_lnvs, nsims, seed = None):
+    ''' Generates many realizations of Toro's model at once
+        
+    Purpose
+    -------
+    Same as gen_toro_realization, but generates nsims profiles at once. The
+    recurrence goes through the layers, but each step is vectorized over all
+    realizations, so thousands of profiles take a few milliseconds.
+        
+    Parameters
+    ----------
+    u_lnvs : numpy array
+        Array of length n with mean of ln(Vs) for each layer
+
+    corr_coeffs : numpy array
+        Array of length (n-1) with interlayer correlations
+
+    sigma_lnvs : float or numpy array
+        Standard deviation of ln(Vs) (float, or one for each layer)
+
+    nsims : int
+        Number of realizations to generate
+
+    seed : int or numpy Generator (optional)
+        Seed (or generator) passed to np.random.default_rng. Defaults to None,
+        so that results are random.
+        
+    Returns
+    -------
+    Z : numpy array
+        Array of size (nsims x n) with standard normal realizations
+
+    Vs : numpy array
+        Array of size (nsims x n) with shear wave velocity realizations
+    '''
+
+    rng = np.random.default_rng(seed)
+    epsilon = rng.standard_normal((nsims, len(u_lnvs)))
+    Z = toro_recurrence(epsilon, corr_coeffs)
+
+    Vs = np.exp(u_lnvs + Z * sigma_lnvs)
+    return Z, Vs
+
+
 def get_IL_corr(all_data:pd.DataFrame , dbin_edges:np.array,
                 dintv_max:float = 1, min_pts:float = 10) -> pd.DataFrame:
     ''' Calculates interlayer correlation coefficients for paired data
@@ -97,34 +141,39 @@ def get_IL_corr(all_data:pd.DataFrame , dbin_edges:np.array,
     # First, get paired data
     paired_data = get_paired_data(all_data, dintv_max)
 
-    # Initalize output dataframe
-    out_cols = ['mid_depth', 'IL_corr_coeff', 'num_pts']
-    IL_corr_coeffs = pd.DataFrame({}, columns = out_cols)
+    # Depth bin of each pair, such that d_from <= mid_depth < d_to (-1 = none)
+    dbin_edges = np.asarray(dbin_edges, dtype = float)
+    nbins = len(dbin_edges) - 1
+    k = np.searchsorted(dbin_edges, paired_data['mid_depth'].values,
+                        side = 'right') - 1
+    k[(k < 0) | (k >= nbins)] = -1
+    keep = (k >= 0)
+    k = k[keep]
 
-    # Iterate through the depth bins
-    for d_from, d_to in zip(dbin_edges[:-1], dbin_edges[1:]):
+    # Paired data (centered, to avoid round-off errors in the sums)
+    prev_vs = paired_data['prev_vs'].values[keep].astype(float)
+    next_vs = paired_data['next_vs'].values[keep].astype(float)
+    prev_vs = prev_vs - np.mean(prev_vs) if len(k) else prev_vs
+    next_vs = next_vs - np.mean(next_vs) if len(k) else next_vs
 
-        # Get the middle depth of this bin and establish a mask
-        mid_depth = (d_from + d_to) / 2
-        mask = (paired_data['mid_depth'] >= d_from) & \
-               (paired_data['mid_depth'] <  d_to)
+    # Sums in each depth bin, and the correlation coefficient from them
+    # (same as np.corrcoef in each bin; checked by hand and it look good :)
+    sums = lambda w: np.bincount(k, weights = w, minlength = nbins)
+    n = np.bincount(k, minlength = nbins)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        S_p, S_n = sums(prev_vs), sums(next_vs)
+        cov   = sums(prev_vs * next_vs) - S_p * S_n / n
+        var_p = sums(prev_vs ** 2) - S_p ** 2 / n
+        var_n = sums(next_vs ** 2) - S_n ** 2 / n
+        rho   = cov / np.sqrt(var_p * var_n)
 
-        # Get the number of datapoints and paired data
-        n = np.sum(mask)
-        prev_vs = paired_data.loc[mask, 'prev_vs'].values
-        next_vs = paired_data.loc[mask, 'next_vs'].values
+    # If there are less than min_pts data points, don't report correlations
+    rho[n < min_pts] = np.nan
 
-        # If there are less than min_pts data points, don't report correlations
-        if n < min_pts:
-            rho = np.nan
-
-        # Othewise, calculate it (checked by hand and it look good :)
-        else: 
-            rho = np.corrcoef(np.stack([prev_vs, next_vs], axis = 0))[0,1]
-
-        # Append outputs to correlation coefficient dataframe
-        outputs = {'mid_depth': mid_depth, 'IL_corr_coeff':rho, 'num_pts':n}
-        IL_corr_coeffs = IL_corr_coeffs.append(outputs, ignore_index = True)
+    IL_corr_coeffs = pd.DataFrame({
+                        'mid_depth'     : (dbin_edges[:-1] + dbin_edges[1:]) / 2,
+                        'IL_corr_coeff' : rho,
+                        'num_pts'       : n})
 
     return paired_data, IL_corr_coeffs
 
@@ -165,10 +214,9 @@ def get_paired_data(all_data:pd.DataFrame, dintv_max:float = 1) -> pd.DataFrame:
         
     Notes
     -----
-    * Not the most efficient!! Because it iterates through each row in all_data.
-      Couldn't figure out a way to do without a loop, and still check that the
-      d_intv requirements are met and that we're not comibining different 
-      soundings. Might be worth to try again.
+    * Data is sorted by depth within each sounding before pairing (a stable
+      sort, so data that is already sorted is paired as before). Pairs are
+      returned in the original row order of their deeper measurement.
     '''
 
     # Check that the necessary columns exist in df_data
@@ -176,30 +224,41 @@ def get_paired_data(all_data:pd.DataFrame, dintv_max:float = 1) -> pd.DataFrame:
         if req_col not in list(all_data):
             raise Exception('df_data is missing column: ' + req_col)
     
-    # First, generate depth interval column for all SCPTS (or similar)
-    for _, one_cpt_data in all_data.groupby('name'):
-        depth = one_cpt_data['depth'].values
-        dintv = np.concatenate([[np.nan], depth[1:] - depth[:-1] ], axis = 0)
-        all_data.loc[one_cpt_data.index, 'dintv'] = dintv
-   
-    # Initialize output dataframe
-    paired_data = pd.DataFrame({}, columns=['mid_depth', 'prev_vs', 'next_vs'])
-
-    # Iterate through each row in the dataset
-    for row_idx, row in all_data.iterrows():
-
-        # If the interval is too long or invalid, skip this pair
-        invalid_row = np.isnan(row['dintv']) | (row['dintv'] > dintv_max)
-        if invalid_row: continue
-
-        # Otherwise, get paired data
-        prev_d = all_data.loc[row_idx - 1, 'depth']
-        next_d = all_data.loc[row_idx,     'depth']
-        new_row = {'mid_depth' : (prev_d + next_d) / 2,
-                   'prev_vs'   : all_data.loc[row_idx - 1, 'vs'],
-                   'next_vs'   : all_data.loc[row_idx,     'vs']}
-
-        # Add to output dataframe
-        paired_data = paired_data.append(new_row, ignore_index = True)
+    # Sort by depth (stable), and get the previous measurement in each sounding
+    order = np.argsort(all_data['depth'].values, kind = 'stable')
+    data  = all_data.iloc[order]
+    prev  = data.groupby('name', sort = False)[['depth', 'vs']].shift(1)
+
+    # Back to original row order
+    undo    = np.argsort(order)
+    next_d  = data['depth'].values[undo].astype(float)
+    next_vs = data['vs'].values[undo].astype(float)
+    prev_d  = prev['depth'].values[undo].astype(float)
+    prev_vs = prev['vs'].values[undo].astype(float)
+
+    # Generate depth interval column for all SCPTS (or similar)
+    dintv = next_d - prev_d
+    all_data['dintv'] = dintv
+
+    # If the interval is too long or invalid, skip this pair
+    valid = ~np.isnan(dintv) & (dintv <= dintv_max)
+
+    paired_data = pd.DataFrame({'mid_depth' : (prev_d + next_d)[valid] / 2,
+                                'prev_vs'   : prev_vs[valid],
+                                'next_vs'   : next_vs[valid]})
     
-    return paired_data
\ No newline at end of file
+    return paired_data
+
+
+def toro_recurrence(epsilon, corr_coeffs):
+    ''' First order auto-regressive recurrence of Toro's model, where epsilon is
+        an array of size (nsims x n) of independent standard normal values and
+        corr_coeffs has length (n-1). Returns Z of size (nsims x n). '''
+
+    Z = np.empty_like(epsilon)
+    Z[:, 0] = epsilon[:, 0]
+
+    for i, rho in enumerate(corr_coeffs):
+        Z[:, i + 1] = rho * Z[:, i] + epsilon[:, i + 1] * (1 - rho**2) ** 0.5
+
+    return Z
\ No newline at end of file
@@ -0,0 +1,267 @@
+''' Batch interpretation of CPT files into a single long-format table
+
+DESCRIPTION:
+This module interprets whole directories of CPT files (one file per sounding).
+Files are read and interpreted in chunks of soundings on a process pool (see
+robertson2015_interp_many and robertson2016_type in cpt_interp.py), and the
+results are streamed into a single long-format table with one row per reading
+and a "name" column for the sounding. Optionally, each chunk is also written
+to a Parquet dataset partitioned by sounding, so that later statistics runs
+(corr_vert, corr_horz, dist_profile) can read only the soundings and columns
+they need (requires pyarrow).
+
+MAIN FUNCTIONS:
+This module contains the following functions:
+    * interp_cpt_dir : interprets all CPT files in a directory
+    * read_cpt_parquet : reads (some columns/soundings of) interpreted CPTs
+    * iter_cpt_dir : streams CPT files in a directory, one at a time
+'''
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import pandas as pd
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+# LLGEO
+import llgeo.cpt_interp.cpt_interp as cpt_interp
+
+# Columns needed for interpretation (and their default names in the files)
+CPT_COLS = {'d' : 'd', 'qc' : 'qc', 'fs' : 'fs', 'u2' : 'u2'}
+
+# ------------------------------------------------------------------------------
+# Main Functions
+# ------------------------------------------------------------------------------
+
+def interp_cpt_dir(path, Pa, Ww, WTD, a, A, ext = '.csv', cols = {},
+                   read_opts = {}, nworkers = None, chunk = 50, out_path = None):
+    ''' Interprets all CPT files in a directory into a long-format table.
+
+    Purpose
+    -------
+    Reads every file in "path" that ends in "ext" (one sounding per file, name
+    of the sounding is the file name without extension), and interprets them
+    with robertson2015_interp_many and robertson2016_type. Soundings are
+    processed in chunks of size "chunk" on a process pool: each worker reads
+    and interprets the files of one chunk at a time, so memory use is bounded
+    by the chunk size (and the output table). If out_path is given, results of
+    each chunk are appended to a Parquet dataset partitioned by sounding as
+    soon as they are ready.
+
+    Parameters
+    ----------
+    path : str
+        Directory containing CPT files (ending in "/")
+
+    Pa, Ww, a, A : float
+        Atmospheric pressure, unit weight of water, area ratio and sleeve area
+        ratio (see robertson2015_interp). Units must match those of the files.
+
+    WTD : float or dict
+        Depth to water table. Either one value for all soundings, or a dict
+        of {sounding_name : WTD}.
+
+    ext : str (optional)
+        Extension of the CPT files. Defaults to '.csv'
+
+    cols : dict (optional)
+        Names of the columns in the files for each of the keys in CPT_COLS
+        (d, qc, fs, u2), if they are different. Defaults to {}.
+
+    read_opts : dict (optional)
+        Keyword arguments for pd.read_csv (ex. {'sep' : '\\t', 'skiprows' : 2})
+
+    nworkers : int (optional)
+        Number of processes to use. Defaults to None, so that all cores are
+        used. If nworkers = 1, everything is run in this process.
+
+    chunk : int (optional)
+        Number of soundings per chunk. Defaults to 50.
+
+    out_path : str (optional)
+        Directory of Parquet dataset where results are written, partitioned by
+        sounding name (requires pyarrow). It must not exist or be empty, since
+        files are only added to the dataset (a re-run would duplicate rows).
+        Defaults to None (nothing written).
+
+    Returns
+    -------
+    results : dataframe
+        Long-format table with one row per reading, with column 'name' for the
+        sounding, the input columns (d, qc, fs, u2), the outputs of
+        robertson2015_interp and those of robertson2016_type.
+    '''
+
+    # Fail before interpreting anything if results can't be written
+    if out_path is not None:
+        check_pyarrow()
+        check_out_path(out_path)
+
+    # CPT files in the directory, in chunks
+    files = sorted([f for f in os.listdir(path) if f.endswith(ext)])
+    if len(files) == 0:
+        raise Exception('No files ending in ' + ext + ' found in ' + path)
+
+    names = [f[:-len(ext)] for f in files]
+    WTDs  = [WTD[n] if isinstance(WTD, dict) else WTD for n in names]
+    args  = [([path + f for f in files[i : i + chunk]], WTDs[i : i + chunk],
+              names[i : i + chunk], Pa, Ww, a, A, cols, read_opts)
+             for i in range(0, len(files), chunk)]
+
+    # Pool is shut down on exit (also if a chunk fails)
+    pool = nullcontext() if nworkers == 1 else \
+           ProcessPoolExecutor(max_workers = nworkers)
+
+    with pool:
+        results = map(interp_chunk, args) if nworkers == 1 else \
+                  pool.map(interp_chunk, args)
+
+        # Collect results in order (and write them) as chunks are finished
+        tables = []
+        for table in results:
+            if out_path is not None:
+                write_parquet(table, out_path)
+            tables += [table]
+
+    return pd.concat(tables, axis = 0, ignore_index = True)
+
+
+def read_cpt_parquet(in_path, columns = None, names = None):
+    ''' Reads interpreted CPTs from the Parquet dataset of interp_cpt_dir
+
+    Purpose
+    -------
+    Reads only the requested columns of the requested soundings (partitions),
+    without loading the rest of the dataset. Requires pyarrow.
+
+    Parameters
+    ----------
+    in_path : str
+        Directory of Parquet dataset (out_path in interp_cpt_dir)
+
+    columns : list of str (optional)
+        Columns to read ('name' is always included). Defaults to None (all).
+
+    names : list of str (optional)
+        Soundings to read. Defaults to None (all).
+
+    Returns
+    -------
+    results : dataframe
+        Long-format table (see interp_cpt_dir)
+    '''
+
+    check_pyarrow()
+
+    if columns is not None:
+        columns = ['name'] + [c for c in columns if c != 'name']
+
+    # Sounding names are read as strings (otherwise "001" would become 1)
+    filters = None if names is None else [('name', 'in', [str(n) for n in names])]
+    results = pd.read_parquet(in_path, columns = columns, filters = filters,
+                              partitioning = name_partitioning())
+    results['name'] = results['name'].astype(str)
+
+    return results
+
+
+def iter_cpt_dir(path, ext = '.csv', cols = {}, read_opts = {}):
+    ''' Streams CPT files in a directory, yielding (name, data) one at a time,
+        where data is a dataframe with columns d, qc, fs, u2 (see CPT_COLS) '''
+
+    for f in sorted([f for f in os.listdir(path) if f.endswith(ext)]):
+        yield f[:-len(ext)], read_cpt(path + f, cols, read_opts)
+
+
+# ------------------------------------------------------------------------------
+# Helper Functions
+# ------------------------------------------------------------------------------
+
+def read_cpt(fpath, cols = {}, read_opts = {}):
+    ''' Reads one CPT file into a dataframe with columns d, qc, fs, u2 '''
+
+    names = dict(CPT_COLS, **cols)
+    data  = pd.read_csv(fpath, **read_opts)
+
+    for key, col in names.items():
+        if col not in list(data):
+            raise Exception('CPT file ' + fpath + ' is missing column: ' + col)
+
+    data = data[list(names.values())].astype(float)
+    data.columns = list(names.keys())
+
+    return data
+
+
+def interp_chunk(args):
+    ''' Reads and interprets one chunk of CPT files (runs in the worker
+        processes), and returns their results in one long-format table '''
+
+    fpaths, WTDs, names, Pa, Ww, a, A, cols, read_opts = args
+
+    data = [read_cpt(f, cols, read_opts) for f in fpaths]
+    interp = cpt_interp.robertson2015_interp_many(
+                                [x['d'].values  for x in data],
+                                [x['qc'].values for x in data],
+                                [x['fs'].values for x in data],
+                                [x['u2'].values for x in data],
+                                Pa, Ww, WTDs, a, A)
+
+    tables = []
+    for name, x, res in zip(names, data, interp):
+        types = cpt_interp.robertson2016_type(res['qn'].values,
+                                              res['Qtn'].values,
+                                              res['Fr'].values,
+                                              res['Go'].values)
+        types[['Ig', 'Kgs']] = types[['Ig', 'Kgs']].astype(float)
+        types[['Struct', 'Soil_Type']] = types[['Struct', 'Soil_Type']].astype(str)
+
+        table = pd.concat([x, res, types], axis = 1)
+        table.insert(0, 'name', name)
+        tables += [table]
+
+    return pd.concat(tables, axis = 0, ignore_index = True)
+
+
+def write_parquet(table, out_path):
+    ''' Appends a table to the Parquet dataset in out_path, partitioned by
+        sounding name (new files are added for each call) '''
+
+    check_pyarrow()
+    table.to_parquet(out_path, engine = 'pyarrow', partition_cols = ['name'],
+                     index = False)
+
+
+def check_out_path(out_path):
+    ''' Raises an error if out_path already has files (from a previous run) '''
+
+    if os.path.isdir(out_path) and len(os.listdir(out_path)) > 0:
+        mssg = 'Output directory is not empty: ' + out_path + '\n'
+        mssg+= '   Results would be added to those of a previous run. Remove it'
+        mssg+= ' or use another out_path.'
+        raise Exception(mssg)
+
+    if os.path.exists(out_path) and not os.path.isdir(out_path):
+        raise Exception('Output path is not a directory: ' + out_path)
+
+
+def name_partitioning():
+    ''' Partitioning of the Parquet dataset, with names always as strings '''
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([('name', pa.string())]), flavor = 'hive')
+
+
+def check_pyarrow():
+    ''' Raises an error if pyarrow (optional, for Parquet files) is missing '''
+
+    try:
+        import pyarrow
+    except ImportError:
+        mssg = 'Parquet files require pyarrow, which is not installed.\n'
+        mssg+= '   Install it (pip install pyarrow), or use out_path = None.'
+        raise Exception(mssg)
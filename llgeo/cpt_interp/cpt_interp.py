@@ -8,38 +8,52 @@ TO BE USED AGAIN. I WAS LAZY-CODING WHEN I FIRST DID THIS.
 FUNCTIONS:
 This module contains the following (main) functions:
     * robertson2015_interp
+    * robertson2015_interp_many
     * robertson2016_type
     * robertson2016_SBTchart
     * robertson2016_structchart
 
 '''
-import matplotlib.pyplot as plt
+import math
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib import rcParams
-from matplotlib.ticker import FuncFormatter
-rcParams.update({'figure.autolayout': True})
-sns.set()
-plt.style.use('seaborn-bright')
+from concurrent.futures import ProcessPoolExecutor
 
 # ------------------------------------------------------------------------------
 # Main Functions
 # ------------------------------------------------------------------------------
 def robertson2015_interp(d,qc,fs,u2,Pa,Ww,WTD,a,A):
     qt = qc + u2*(1-a)   # Corrected resistance (Pg.22)
-    ft = fs - u2*A       # Corrected friction (Pg.23)
-    Rf = 100*fs/qt       # Friction ratio (Pg. 36)
 
-    Ws,s_tot,u,s_eff,Ic,n,Fr,qn,Qtn = iter(d,qt,fs,WTD,Ww,Pa) # Iterative calculations (Pg.108)
-    Qt = qn/s_eff                                             # Normalized resistance (Pg.29)
-    alpha_vs = 10**(0.88*Ic+1.68) 
-    Vs = (alpha_vs*qn/Pa)**(0.5)
-    Go = Ws/9.81*Vs**2
+    iters   = iter(d,qt,fs,WTD,Ww,Pa)                  # Iterative calculations (Pg.108)
+    results = interp_results(qt,fs,u2,Pa,A,iters)
+    return(results)
 
-    results = pd.DataFrame(np.stack([Ws,s_tot,u,s_eff,Ic,n,ft,Rf,Fr,qt,qn,Qt,Qtn,Vs,Go],axis=1),
-                           columns=['gamma','s_tot','pore_press','s_eff','Ic','n','ft','Rf','Fr',
-                                    'qt','qn','Qt','Qtn','Vs','Go'])
+
+def robertson2015_interp_many(d,qc,fs,u2,Pa,Ww,WTD,a,A,nworkers=1):
+    ''' Same as robertson2015_interp, for many soundings at once.
+        d, qc, fs, u2 are lists of arrays (one per sounding), and WTD is a
+        float or a list of floats. The iterative calculations are vectorized
+        across soundings (see iter_many), and chunks of soundings are run on
+        a process pool if nworkers != 1 (None uses all cores).
+        Returns a list of dataframes (one per sounding). '''
+
+    WTD = WTD if np.ndim(WTD) else [WTD]*len(d)
+    qt  = [qc_i + u2_i*(1-a) for qc_i,u2_i in zip(qc,u2)]
+
+    # Iterative calculations (Pg.108), on chunks of soundings
+    if nworkers == 1:
+        iters = iter_many(d,qt,fs,WTD,Ww,Pa)
+    else:
+        nchunks = min(len(d), 4*(nworkers or 8))
+        chunks  = np.array_split(np.arange(len(d)), nchunks)
+        args    = [([d[i] for i in c],[qt[i] for i in c],[fs[i] for i in c],
+                    [WTD[i] for i in c],Ww,Pa) for c in chunks]
+        with ProcessPoolExecutor(max_workers=nworkers) as pool:
+            iters = [r for rs in pool.map(iter_many_args,args) for r in rs]
+
+    results = [interp_results(qt_i,fs_i,u2_i,Pa,A,it)
+               for qt_i,fs_i,u2_i,it in zip(qt,fs,u2,iters)]
     return(results)
 
 
@@ -69,10 +83,13 @@ def robertson2016_type(qn,Qtn,Fr,Go):
     return(results)
 
 
- def robertson2016_SBTchart(fig,ax):
+def robertson2016_SBTchart(fig,ax):
     ''' Plots Robertson's proposed Soil Behavior Type charts.
         Returns figure and axis handles '''
 
+    # Matplotlib is only needed for plotting, so it isn't imported with module
+    from matplotlib.ticker import FuncFormatter
+
     # Calculate zone boundaries defined by Robertson
     Qtn_CD = lambda Fr,CD: CD/(1+0.06*Fr)**17 + 11
     Fr_Ib  = lambda Qtn,Ib: (1/Qtn)*(100*(Qtn+10)/Ib-70)
@@ -112,6 +129,9 @@ def robertson2016_structchart(fig,ax):
     ''' Plots Robertson's proposed microstructure chart.
         Returns figure and axis handles '''
 
+    # Matplotlib is only needed for plotting, so it isn't imported with module
+    from matplotlib.ticker import FuncFormatter
+
     # Calculate zone boundaries defined by Robertson
     Qtn_Kg = lambda Ig,Kg: (Kg/Ig)**(1/0.75)
     Kg_low  = Qtn_Kg(np.logspace(0,3),100)
@@ -150,52 +170,174 @@ def robertson2016_structchart(fig,ax):
 # Helper Functions
 # ------------------------------------------------------------------------------
 def iter(d_arr,qt_arr,fs_arr,WTD,Ww,Pa):
+    ''' Iterative calculations (Pg.108) for one sounding (see iter_many) '''
+    return(iter_many([d_arr],[qt_arr],[fs_arr],[WTD],Ww,Pa)[0])
+
+
+def iter_many(d_list,qt_list,fs_list,WTDs,Ww,Pa,block=200):
+    ''' Iterative calculations (Pg.108) for many soundings at once.
+        Each reading starts from the total and effective stress of the reading
+        above it, which only depend on the unit weights (Ws) of all readings
+        above it. So, given a guess of Ws for a block of readings, stresses
+        come from a cumulative sum, and the iterations on the exponent n run
+        for all readings in the block (of all soundings) at once (see
+        iter_readings). This is repeated with the new Ws until they stop
+        changing, at which point every reading was calculated from the same
+        stresses as when going one reading at a time (so results are identical).
+        Readings above the first change in Ws are not recalculated, and blocks
+        keep changes in Ws from forcing recalculations all the way down.
+        Returns a list of tuples (one per sounding) with:
+        (Ws,s_tot,u,s_eff,Ic,n,Fr,qn,Qtn) '''
+
+    # Pad soundings to the same number of readings (NaN where missing)
+    lens = np.array([len(d) for d in d_list])
+    pad  = lambda arrs: np.array([np.append(np.asarray(x,dtype=float),
+                                  np.full(lens.max()-len(x),np.nan)) for x in arrs])
+    d,qt,fs = pad(d_list),pad(qt_list),pad(fs_list)
+    valid = np.arange(lens.max())<lens.reshape(-1,1)
+
+    # Calc. depth diff and pore pressures
+    delta = np.diff(d,axis=1,prepend=0)
+    u     = py_max(0,Ww*(d-np.reshape(WTDs,(-1,1))))
+
+    # Initialize stresses (above first reading) and results
+    s_tot0 = np.full(len(d),1e-5); s_eff0 = np.full(len(d),1e-5); Ws0 = 19.
+    keys = ['Ws','s_tot','s_eff','Ic','n','Fr','qn','Qtn']
+    res  = {k:np.full(d.shape,np.nan) for k in keys}
+
+    for i in range(0,lens.max(),block):
+        c = slice(i,i+block)
+
+        # Iterate on unit weights of this block until they don't change
+        # (starting from the unit weight of the reading above)
+        Ws   = np.zeros(d[:,c].shape) + np.reshape(Ws0,(-1,1))
+        todo = valid[:,c].copy()            # Readings to (re)calculate
+        while np.any(todo):
+
+            # Stresses from the reading above
+            s_tot = np.cumsum(np.column_stack([s_tot0,delta[:,c]*Ws]),axis=1)
+            s_eff = np.column_stack([s_eff0,(s_tot[:,1:]-u[:,c])[:,:-1]])
+            s_tot = s_tot[:,:-1]
+
+            new = iter_readings(qt[:,c][todo],fs[:,c][todo],s_tot[todo],
+                                s_eff[todo],delta[:,c][todo],u[:,c][todo],Pa)
+            for k in keys:
+                res[k][:,c][todo] = new[k]
+
+            # Recalculate readings below (and including) the first change in Ws
+            changed = np.zeros(Ws.shape,dtype=bool)
+            changed[todo] = (new['Ws']!=Ws[todo])
+            Ws[todo] = new['Ws']
+            todo = valid[:,c] & (np.cumsum(changed,axis=1)>0)
+
+        # Update stresses above the next block
+        s_tot0,s_eff0,Ws0 = [res[k][:,c][:,-1] for k in ['s_tot','s_eff','Ws']]
+
+    # Organize outputs per sounding
+    res['u'] = u
+    keys = ['Ws','s_tot','u','s_eff','Ic','n','Fr','qn','Qtn']
+    return([tuple(res[k][j,:lens[j]] for k in keys) for j in range(len(lens))])
+
+
+def iter_readings(qt,fs,s_tot,s_eff,delta,u,Pa,max_iter=5000):
+    ''' Iterations on the exponent n (Pg.108) for many readings at once, given
+        the total and effective stress that each one starts from. Each reading
+        iterates until it converges (same calculations as one at a time).
+        Readings that never converge often end up alternating between two
+        states (n, s_eff); since each iteration only depends on that state,
+        these skip straight to the result of the last iteration (max_iter).
+        Returns dict with (final) Ws,s_tot,s_eff,Ic,n,Fr,qn,Qtn. '''
+
+    keys  = ['Ws','s_tot','s_eff','Ic','n','Fr','qn','Qtn']
+    res   = np.empty((len(keys),len(qt)))        # Outputs of last iteration
+    prev  = np.empty((len(keys),len(qt)))        # Outputs of the one before
+    n_new = np.ones(len(qt)); e = 1              # Reset iteration controls
+    s_eff = s_eff.copy()
+    state = np.full((2,2,len(qt)),np.nan)        # (n,s_eff) 1 and 2 iters ago
+    it    = np.arange(len(qt))                   # Readings still iterating
+
+    while len(it) and (e<max_iter):
+        e     += 1
+        n      = n_new[it]
+        qn     = py_max(0.01,qt[it] - s_tot[it])                       # Net resistance (Pg.28)
+        Fr     = 100*fs[it]/qn                                         # Normalized friction ratio (Pg.29)
+        Qtn    = qn/Pa*pow_(Pa/s_eff[it],n)                            # Normalized resistance (Pg.108)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            Ic = pow_(pow_(3.47-np.log(Qtn),2) + pow_(1.22+np.log(Fr),2),0.5) # Soil index (Pg.108)
+        n_new[it] = py_max(0,py_min(1,0.381*Ic+0.05*(s_eff[it]/Pa)-0.15)) # Norm exponent (Pg.108)
+        Ws     = Ws_lookup(Ic)
+        s_temp = s_tot[it] + delta[it]*Ws
+        s_eff[it] = s_temp - u[it]
+        prev[:,it] = res[:,it]
+        res[:,it]  = [Ws,s_temp,s_eff[it],Ic,n,Fr,qn,Qtn]
+
+        # Readings back to the state of two iterations ago repeat the last two
+        # iterations until max_iter (if not converged): keep the right one
+        diff  = np.abs(n-n_new[it])
+        now   = np.stack([n_new[it],s_eff[it]])
+        cycle = np.all(now==state[1][:,it],axis=0) & (diff>0.01) & (e<max_iter)
+        odd   = it[cycle & ((max_iter-e)%2==1)]
+        res[:,odd] = prev[:,odd]
+        state[1][:,it] = state[0][:,it]
+        state[0][:,it] = now
+
+        it     = it[(diff>0.01) & ~cycle]       # Continue if diff>0.01
+
+    return(dict(zip(keys,res)))
+
+
+def iter_many_args(args):
+    ''' iter_many with packed arguments (runs in the worker processes) '''
+    return(iter_many(*args))
+
+
+def interp_results(qt,fs,u2,Pa,A,iters):
+    ''' Results dataframe of robertson2015_interp for one sounding, given the
+        outputs of the iterative calculations (iters) '''
+    ft = fs - u2*A       # Corrected friction (Pg.23)
+    Rf = 100*fs/qt       # Friction ratio (Pg. 36)
+
+    Ws,s_tot,u,s_eff,Ic,n,Fr,qn,Qtn = iters
+    Qt = qn/s_eff                                             # Normalized resistance (Pg.29)
+    alpha_vs = 10**(0.88*Ic+1.68) 
+    Vs = (alpha_vs*qn/Pa)**(0.5)
+    Go = Ws/9.81*Vs**2
+
+    results = pd.DataFrame(np.stack([Ws,s_tot,u,s_eff,Ic,n,ft,Rf,Fr,qt,qn,Qt,Qtn,Vs,Go],axis=1),
+                           columns=['gamma','s_tot','pore_press','s_eff','Ic','n','ft','Rf','Fr',
+                                    'qt','qn','Qt','Qtn','Vs','Go'])
+    return(results)
+
+
+def pow_(x,y):
+    ''' Elementwise x**y with the C library's pow, as for scalars. (Numpy's
+        vectorized power can differ in the last digit, and results of the
+        iterations must be identical to the original scalar calculations).
+        NaNs and infs (where math.pow would raise errors) come from numpy. '''
+    x,y = np.broadcast_arrays(np.asarray(x,dtype=float),np.asarray(y,dtype=float))
+    with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+        out = np.power(x,y)
+    ok = np.isfinite(out)
+    out[ok] = np.frompyfunc(math.pow,2,1)(x[ok],y[ok]).astype(float)
+    return(out)
+
+
+def py_max(a,x):
+    ''' Elementwise max(a,x) with Python's semantics (a is returned unless x>a,
+        so NaNs give a), as used in the original scalar calculations '''
+    return(np.where(x>a,x,a))
+
 
-    # Initialize empty result arrays
-    Ws_arr=np.empty(np.shape(d_arr));   n_arr=np.empty(np.shape(d_arr))
-    Ic_arr=np.empty(np.shape(d_arr));   qn_arr=np.empty(np.shape(d_arr))
-    u_arr=np.empty(np.shape(d_arr));    Qtn_arr=np.empty(np.shape(d_arr))
-    Fr_arr=np.empty(np.shape(d_arr));   s_tot_arr=np.empty(np.shape(d_arr))
-    s_eff_arr=np.empty(np.shape(d_arr))
-
-    # Initialize stresses and calc. depth diff
-    delta_arr = np.append(d_arr[0],d_arr[1:]-d_arr[:-1])
-    s_tot = s_eff = 1e-5
-
-    # Go through each row and do iterative calculations (Pg.108)
-    for i,(d,qt,fs,delta) in enumerate(zip(d_arr,qt_arr,fs_arr,delta_arr)):
-        n_new = diff = e = 1   # Reset iteration controls
-        u = max(0,Ww*(d-WTD))  # Calculate pore pressures
-        while(diff>0.01)&(e<5000):
-            e     += 1
-            n      = n_new
-            qn     = max(0.01,qt - s_tot)                                  # Net resistance (Pg.28)
-            Fr     = 100*fs/qn                                             # Normalized friction ratio (Pg.29)
-            Qtn    = qn/Pa*(Pa/s_eff)**n                                   # Normalized resistance (Pg.108)
-            Ic     = ((3.47-np.log(Qtn))**2 + (1.22+np.log(Fr))**2)**0.5   # Soil index (Pg.108)
-            n_new  = max(0,min(1,0.381*Ic+0.05*(s_eff/Pa)-0.15))           # Norm exponent (Pg.108)
-            Ws     = Ws_lookup(Ic)
-            s_temp = s_tot + delta*Ws
-            s_eff  = s_temp - u
-            diff   = np.abs(n-n_new)
-        s_tot = s_temp         # Update total stress
-        Ws_arr[i]=Ws; s_tot_arr[i]=s_tot; u_arr[i]=u
-        s_eff_arr[i]=s_eff; Ic_arr[i]=Ic; n_arr[i]=n
-        Fr_arr[i]=Fr; qn_arr[i]=qn; Qtn_arr[i]=Qtn
-
-    return(Ws_arr,s_tot_arr,u_arr,s_eff_arr,Ic_arr,n_arr,Fr_arr,qn_arr,Qtn_arr)
+def py_min(a,x):
+    ''' Elementwise min(a,x) with Python's semantics (see py_max) '''
+    return(np.where(x<a,x,a))
 
 
 def Ws_lookup(Ic):
     ''' Assumed soil unit weight
-        based on calculated Ic'''
-    Ws = 19
-    if np.isnan(Ic):  Ws = 19
-    if 0.00<Ic<=1.31: Ws = 20
-    if 1.31<Ic<=2.05: Ws = 19
-    if 2.04<Ic<=2.30: Ws = 18.5
-    if 2.30<Ic<=2.60: Ws = 18.0
-    if 2.60<Ic<=2.95: Ws = 17.5
-    if 2.95<Ic<=3.60: Ws = 16.6
-    if 3.60<Ic<=6.00: Ws = 11.0
-    return(Ws)
\ No newline at end of file
+        based on calculated Ic (float or array). Ranges used to overlap at
+        2.04-2.05 (where 18.5 applied), and NaNs or Ic out of range give 19'''
+    edges = [0.00, 1.31, 2.04, 2.30, 2.60, 2.95, 3.60, 6.00]  # Ic ranges: (a,b]
+    vals  = np.array([19, 20, 19, 18.5, 18.0, 17.5, 16.6, 11.0, 19])
+    Ws = vals[np.digitize(Ic,edges,right=True)]
+    return(Ws)
@@ -34,13 +34,13 @@ def params(PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
 
     Parameters
     -----------
-    PI (%) : float
+    PI (%) : float or array
         Soil Plasticity Index
 
-    OCR (-) : float
+    OCR (-) : float or array
         Overconsolidation Ratio
 
-    sigp_o (atm) : float
+    sigp_o (atm) : float or array
         In-situ mean effective confining stress (sigma'o)
 
     N (-) : float, optional
@@ -57,11 +57,11 @@ def params(PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
     b (-) : float
         Scaling coefficient on material damping curve 
 
-    D_min (dec) : float
+    D_min (dec) : float or array
         Small strain damping. Ignores effect of high-amplitude cycling on Dmin
         (see Section 6.3 and Pg 144 in Ref_1)
 
-    sstrn_r (dec) : float
+    sstrn_r (dec) : float or array
         Reference strain, corresponds to the strain amplitude when shear modulus
         reduced to one half of Gmax (key characteristic of the hyperbolic model
         employed in Darendeli's research). See Section 6.2, Pg. 132 in Ref_1.
@@ -70,6 +70,8 @@ def params(PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
     ----
     * This is done separately to explore the dependence of the model parameters
       on the soil properties.
+    * PI, OCR, and sigp_o may be arrays of soil states (they are broadcast
+      against each other), in which case D_min and sstrn_r are arrays too.
 
     References
     ----------
@@ -78,6 +80,9 @@ def params(PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
         See : Section 7.4.1 Page 172, in Ref(1) 
               Table 8.12, Page 214, in Ref(1)
     '''
+    # Allow for arrays of soil states
+    PI, OCR, sigp_o = np.asarray(PI), np.asarray(OCR), np.asarray(sigp_o)
+
     # Phi constants (1-indexed to match equation notations)
     # These are calibrated to all credible data from Darendeli
     if type == 'mean':
@@ -114,6 +119,10 @@ def curves(sstrn, PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
         Shearing strains of interest (in %, not dec)
         Any numpy array will work, but should probably be log-spaced!
 
+    PI, OCR, sigp_o : float or array
+        Soil properties (see params). If any of these is an array of soil
+        states, curves are returned for every state (see Returns).
+
     a (-) : float
         Curvature coefficient (set as constant Phi_5)
 
@@ -134,11 +143,14 @@ def curves(sstrn, PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
     G_red (dec) : array
         MEAN modulus reduction curve for material properties.
         Each value corresponds to shear strain levels given by sstrn
+        If arrays of soil states are given, this is of size (n_states x
+        n_strains), where each row is the curve for one soil state.
 
     D_adj (dec) : array
         MEAN damping curve for given properties.
         Each value corresponds to shear strain levels given by sstrn
         Note that these  are percentage values (not dec)
+        Same size as G_red.
 
     Notes
     -----
@@ -154,6 +166,12 @@ def curves(sstrn, PI, OCR, sigp_o, N = 10, load_freq = 1, type = 'mean'):
     '''
     a, b, D_min, sstrn_r = params(PI, OCR, sigp_o, N, load_freq, type)
 
+    # If there are many soil states, get one row per state (strains in cols)
+    if np.ndim(sstrn_r) > 0:
+        sstrn   = np.reshape(sstrn, (1, -1))
+        sstrn_r = np.reshape(sstrn_r, (-1, 1))
+        D_min   = np.reshape(D_min, (-1, 1))
+
     # Normalized modulus reduction curve (Eq. 7.25)
     G_red = 1 / (1 + (sstrn / sstrn_r)**a)
 
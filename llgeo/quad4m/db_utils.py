@@ -11,7 +11,8 @@ This module helps create and manage "databases" of:
 MAIN FUNCTIONS:
 This module contains the following functions:
     * uptdate_db_geoms
-    * 
+    * update_db_rfs
+    * read_rfs
     
 '''
 
@@ -26,6 +27,11 @@ import warnings
 # LLGEO
 import llgeo.quad4m.geometry as q4m_geom
 import llgeo.utilities.files as llgeo_fls
+import llgeo.rand_fields.parallel as llgeo_rfs
+
+# Parameters that identify a random field entry in db_rfs (see update_db_rfs)
+RF_KEYS = ['backend', 'fnc', 'n1', 'n2', 'xl', 'yl', 'zm', 'pa', 'pb',
+           'thx', 'thy', 'seed', 'block']
 
 # ------------------------------------------------------------------------------
 # Main Functions
@@ -179,6 +185,137 @@ def update_db_geoms(path_db, file_db, path_DXF, new_DXF_files, path_check):
     return db_geoms, geom_dicts
 
 
+def update_db_rfs(path_db, file_db, rf_params, nsims, nworkers = None):
+    ''' Gets random fields from database, generating (and adding) them if needed
+        
+    Purpose
+    -------
+    Looks for an entry in the database of random fields that matches rf_params
+    (covariance function and parameters, grid, backend, and seed) and has at
+    least nsims realizations. If there is one, it is read as a memory-mapped
+    array (nothing is loaded until used). Otherwise, realizations are generated
+    with llgeo/rand_fields/parallel.py straight into a new memory-mapped .npy
+    file, and the summary file "file_db" is updated.
+
+    Each entry in the summary file contains the following columns:
+       id     | entry id
+       fname  | name of .npy file with realizations, of size (nsims, n1, n2)
+       nsims  | number of realizations in the file
+       + all RF_KEYS (see rf_params below)
+
+    Parameters
+    ----------
+    path_db : str
+        directory containing random field "database".
+        
+    file_db : str
+        name of "database" summary file (usually ending in .pkl).
+
+    rf_params : dict
+        parameters of the random field, with keys:
+            fnc, n1, xl, zm, pa, thx, seed : required (see sim2d_parallel)
+            n2, yl, thy : required for 2D fields. Default to 1, 0, 0 for 1D.
+            pb : defaults to 0
+            backend : 'FFT' (default) or 'LAS'
+            block : number of realizations per seed (see sim2d_parallel).
+                    Defaults to 100.
+
+    nsims : int
+        number of realizations needed.
+
+    nworkers : int (optional)
+        number of processes used to generate new realizations (see
+        sim2d_parallel). Defaults to None, so that all cores are used.
+
+    Returns
+    -------
+    db_rfs : dataframe
+        "database" summary file, which now includes the requested fields.
+
+    Zs : numpy memmap
+        read-only memory-mapped array of size (nsims, n1, n2). Realization k is
+        Zs[k], which is read from disk without copying the whole file.
+
+    Notes
+    -----
+    * Entries are matched by exact equality of the parameters in RF_KEYS.
+    * If an entry matches but has less than nsims realizations, it is re-
+      generated with nsims (previous realizations are the same if nsims is
+      a multiple of block) into a new .npy file. The old file is left in place
+      (arrays from earlier calls may still map it), and can be deleted once
+      they are no longer used.
+    '''
+
+    # Fill in defaults for optional parameters
+    params = {'n2': 1, 'yl': 0, 'thy': 0, 'pb': 0, 'backend': 'FFT',
+              'block': 100}
+    params.update(rf_params)
+
+    missing = [k for k in RF_KEYS if k not in params]
+    if len(missing) > 0:
+        raise Exception('Missing random field parameters: ' + ', '.join(missing))
+
+    # Get the current database, and look for a matching entry
+    db_rfs = get_db(path_db, file_db, db_type = 'rfs')
+    conditions = {k: params[k] for k in RF_KEYS}
+
+    if len(db_rfs) > 0:
+        match = search(db_rfs, conditions)
+    else:
+        match = db_rfs
+
+    # If the entry exists and is large enough, read it (memory-mapped)
+    if (len(match) > 0) and (match['nsims'].max() >= nsims):
+        fname = match.loc[match['nsims'].idxmax(), 'fname']
+        Zs = read_rfs(path_db, fname)[:nsims]
+        return db_rfs, Zs
+
+    # Otherwise, (re)use entry id and generate straight into a .npy memmap
+    if len(match) > 0:
+        i = match['id'].iloc[0]
+        db_rfs = db_rfs.loc[db_rfs['id'] != i]
+    elif len(db_rfs) > 0:
+        i = np.max(db_rfs['id']) + 1
+    else:
+        i = 1
+
+    # New file name for each size, so that arrays already returned for an
+    # entry (memory-mapped, read-only) are never truncated or rewritten
+    fname = '{i:03d}_{n:d}_rfs.npy'.format(i = i, n = nsims)
+    shape = (nsims, params['n1'], params['n2'])
+    Zs = np.lib.format.open_memmap(path_db + fname, mode = 'w+',
+                                   dtype = np.float64, shape = shape)
+
+    p = params
+    if p['n2'] == 1 and p['yl'] == 0:
+        llgeo_rfs.sim1d_parallel(p['n1'], p['xl'], p['zm'], p['pa'], p['thx'],
+                                 p['fnc'], p['pa'], p['pb'], nsims, p['seed'],
+                                 nworkers, p['block'], p['backend'],
+                                 out = Zs[:, :, 0])
+    else:
+        llgeo_rfs.sim2d_parallel(p['n1'], p['n2'], p['xl'], p['yl'], p['zm'],
+                                 p['pa'], p['thx'], p['thy'], p['fnc'], p['pa'],
+                                 p['pb'], nsims, 'rfs.stats', p['seed'],
+                                 nworkers, p['block'], p['backend'], out = Zs)
+    Zs.flush()
+    del Zs
+
+    # Add summary info to db_rfs (only once the file is complete)
+    new_row = pd.DataFrame([{'id': i, 'fname': fname, 'nsims': nsims,
+                             **conditions}], columns = list(db_rfs))
+    db_rfs = pd.concat([db_rfs, new_row], ignore_index = True)
+    db_rfs.to_pickle(path_db + file_db)
+
+    return db_rfs, read_rfs(path_db, fname)
+
+
+def read_rfs(path_db, fname):
+    ''' Reads realizations of a random field (from update_db_rfs) as a read-only
+        memory-mapped array, so that slicing a realization does not copy data'''
+
+    return np.load(path_db + fname, mmap_mode = 'r')
+
+
 def get_unique_accs(db_accs, cols = ['T', 'type', 'name']):
     ''' Sometimes, acceleration database contains duplicate earthquakes
         (same earhquake and return period, but different orientation).
@@ -317,7 +454,7 @@ def get_db(path_db, file_db, db_type = False, reset = False):
             pass
 
         elif db_type == 'rfs':
-            pass
+            cols = ['id', 'fname', 'nsims'] + RF_KEYS
 
         else:
             raise Exception('type of db not recognized.')
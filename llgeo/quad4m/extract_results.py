@@ -4,6 +4,15 @@ DESCRIPTION:
 These functions read the pickle fiels of post-processed results from QUAD4M 
 analyses (see post_process.py) and extracts specific sections of those results 
 for plotting or presentation purposes.
+
+Results are streamed model by model: summary statistics across models (mean,
+stdv, min, max, and optionally quantiles) are updated with running statistics
+(see init_stats and update_stats), so that memory doesn't grow with the number
+of models unless the result of each model is requested (keep_models = True).
+Running statistics from different workers or stages can be merged exactly
+(see merge_stats). Optionally, fixed-bin histograms are also kept for each row
+(node or element), which merge exactly and are used for percentiles and
+exceedance probabilities across models (ex. P(PGA > x), see exceedance).
 '''
 
 import numpy as np
@@ -11,11 +20,17 @@ import pandas as pd
 import llgeo.utilities.files as llgeo_fls
 import llgeo.motions.spectra as llgeo_spc
 
+# Keys of kargs in extract_results that are used when finishing an extraction
+# (the rest are passed to the add_* functions)
+FINISH_KEYS = ['verbose', 'summ_stats', 'keep_models', 'stats_opts',
+               'return_stats']
+
 # ------------------------------------------------------------------------------
 # Functions that extract results from elems dataframes or results dictionary
 # ------------------------------------------------------------------------------
 def get_elems_prop(elem_dfs, names, target_col, target_val, return_col,
-                   summ_stats = True, verbose = True):
+                   summ_stats = True, verbose = True, keep_models = True,
+                   stats_opts = {}, return_stats = False):
     ''' Extract information from elements dataframe.
         
     Purpose
@@ -26,13 +41,14 @@ def get_elems_prop(elem_dfs, names, target_col, target_val, return_col,
 
     Parameters
     ----------
-    elems_dfs : list of dataframes
+    elems_dfs : list (or iterable) of dataframes
         List of dfs containting the element information for the model (order 
         with results_dicts must match!!). Must contain at least the columns
         ['target_col' and 'return_col'] as well as ['n', 'i', 'j', 'xc', 'yc'.
         THESE MUST BE SAVED AHEAD OF TIME IN  THE MODEL GENERATION SCRIPTS!
+        Can be a generator, so that models are read one at a time.
 
-    names : list of str
+    names : list (or iterable) of str
         Each string identifies which model the elements are coming from
 
     target_col : str
@@ -50,6 +66,21 @@ def get_elems_prop(elem_dfs, names, target_col, target_val, return_col,
 
     verbose : bool (optional)
         If true (default), will print out progress to console.
+
+    keep_models : bool (optional)
+        If true (default), the output includes a column for each model. If
+        false, only summary statistics are kept, so that memory doesn't grow
+        with the number of models.
+
+    stats_opts : dict (optional)
+        Options for running statistics across models (see init_stats), such as
+        {'edges' : np.linspace(0, 2, 201), 'quantiles' : [0.16, 0.5, 0.84]}.
+        Defaults to {}.
+
+    return_stats : bool (optional)
+        If true, the running statistics are also returned, so that they can be
+        merged with those of other workers or stages (see merge_stats) or used
+        for exceedance probabilities (see exceedance). Defaults to False.
         
     Returns
     -------
@@ -64,52 +95,29 @@ def get_elems_prop(elem_dfs, names, target_col, target_val, return_col,
     * ALL MODELS IN RESULT_DICTS MUST HAVE THE SAME GEOMETRY
     '''
 
-     # Initialize outputs
+    # Initialize outputs
     if verbose: print('Now getting element property ' + return_col)
-    dfs = []
+    extraction = init_extraction(keep_models, stats_opts)
 
     # Iterate through provided result files
     for i, (elems, name) in enumerate(zip(elem_dfs, names)):
 
         # Print progress
         if verbose:
-            prog = '({:d}/{:d})'.format(i+1, len(elem_dfs))
+            prog = progress(i, elem_dfs)
             print('\t Processing element ' + prog, flush = True)
 
-        # Find location to return
-        mask = (elems[target_col] == target_val)
+        # Update statistics with this model
+        add_elems_prop(extraction, elems, name, target_col, target_val,
+                       return_col)
 
-        # Create new dataframe and add to outputs
-        if i == 0:
-            cols = ['n', 'i', 'j', 'xc', 'yc', return_col] 
-        else:
-            cols = ['n', return_col] 
-
-        # Extract only the necessary data
-        new_df = elems.loc[mask, cols]
-
-        # Rename, re-index and add to outputs
-        col_name = name + '_' + return_col
-        new_df.rename(columns = {return_col: col_name}, inplace = True)
-        new_df.set_index('n', inplace = True)
-        dfs += [new_df]
-    
-    # Combine into single df
-    out_df = pd.concat(dfs, axis = 1)
-
-    # If necessary, add summary statistics
-    if summ_stats:
-        cols = [c for c in list(out_df) if return_col in c]
-        out_df['mean'] = out_df[cols].mean(axis = 1)
-        out_df['stdv'] = out_df[cols].std(axis = 1)
-        out_df['min']  = out_df[cols].min(axis = 1)
-        out_df['max']  = out_df[cols].max(axis = 1)
-
-    return out_df
+    # Combine into single df (with summary statistics if required)
+    return finish_extraction(extraction, summ_stats, return_stats)
 
 
 def get_peak_acc(result_dicts, x_loc = None, verbose = True,
-                 check_success = False , summ_stats = True):
+                 check_success = False , summ_stats = True, keep_models = True,
+                 stats_opts = {}, return_stats = False):
     ''' Extract peak acceleration values for nodes in QUAD4M model results
         
     Purpose
@@ -120,9 +128,10 @@ def get_peak_acc(result_dicts, x_loc = None, verbose = True,
         
     Parameters
     ----------
-    result_dicts : list of dict
+    result_dicts : list (or iterable) of dict
         List of dictionaries containting the analysis results, which must
-        contain the key "peak_acc" and "model" (see post-process.py).
+        contain the key "peak_acc" and "model" (see post-process.py). Can be a
+        generator, so that models are read one at a time (see read_models).
 
     x_loc : float or bool (optional)
         Specifies x-coordinate of interest, so that only nodes at this 
@@ -141,6 +150,21 @@ def get_peak_acc(result_dicts, x_loc = None, verbose = True,
     summ_stats : bool (optinal)
         If true, will include summary statistics across models in the output
         dataframe. Will include: mean, stdv, min, and max. Defaults to true.
+
+    keep_models : bool (optional)
+        If true (default), the output includes a column for each model. If
+        false, only summary statistics are kept, so that memory doesn't grow
+        with the number of models.
+
+    stats_opts : dict (optional)
+        Options for running statistics across models (see init_stats), such as
+        {'edges' : np.linspace(0, 2, 201), 'quantiles' : [0.16, 0.5, 0.84]}.
+        Defaults to {}.
+
+    return_stats : bool (optional)
+        If true, the running statistics are also returned, so that they can be
+        merged with those of other workers or stages (see merge_stats) or used
+        for exceedance probabilities (see exceedance). Defaults to False.
         
     Returns
     -------
@@ -156,75 +180,26 @@ def get_peak_acc(result_dicts, x_loc = None, verbose = True,
 
     # Initialize outputs
     if verbose: print('Now getting peak accelerations')
-    dfs = []
+    extraction = init_extraction(keep_models, stats_opts)
 
     # Iterate through provided result files
-    model_counter = 0
     for i, result in enumerate(result_dicts):
 
-        # Check if model has failed
-        if (check_success) & (not result['run_success']):
-            print('Uh oh... ' + result['model'] + 'failed', flush = True)
-            continue
-        else:
-            model_counter += 1
-
         # Print progress
         if verbose:
-            prog = '({:d}/{:d})'.format(i+1, len(result_dicts))
+            prog = progress(i, result_dicts)
             print('\t' + result['model'] + prog, flush = True)
 
-        # Read results
-        acc_df = result['peak_acc']
-
-        # Double check that acc_df is a dataframe
-        # (will not be if model failed or wasnt processed correctly)
-        if not isinstance(acc_df, pd.DataFrame):
-            model_counter -= 1
-            msg = 'Watch out: model {:s} did not '.format(result['model'])
-            msg+= 'run or process correctly because "peak_acc" key in result'
-            msg+= ' dict does not contain  a dataframe'
-            msg+= '\n Will skip this model but check what happened!'
-            print(msg)
-            continue
-    
-        # Determine data to extract if a specific x is given
-        if x_loc is None:
-            mask = np.ones(len(acc_df))            
-        else:
-            mask = (acc_df['x'] == x_loc)
-
-        # Determine columns that are needed
-        if model_counter == 1:
-            cols = ['node_n', 'x', 'y', 'x_acc']
-        else:
-            cols = ['node_n', 'x_acc']
-
-        # Extract only the necessary data
-        acc_df = acc_df.loc[mask, cols]
-
-        # Rename, re-index and add to outputs
-        col_name = result['model'] + '_pga'
-        acc_df.rename(columns = {'x_acc': col_name}, inplace = True)
-        acc_df.set_index('node_n', inplace = True)
-        dfs += [acc_df]
+        # Update statistics with this model (unless it failed)
+        add_peak_acc(extraction, result, x_loc, check_success)
     
-    # Combine into single df
-    peak_acc = pd.concat(dfs, axis = 1)
-
-    # If necessary, add summary statistics
-    if summ_stats:
-        pga_cols = [c for c in list(peak_acc) if '_pga' in c]
-        peak_acc['mean'] = peak_acc[pga_cols].mean(axis = 1)
-        peak_acc['stdv'] = peak_acc[pga_cols].std(axis = 1)
-        peak_acc['min']  = peak_acc[pga_cols].min(axis = 1)
-        peak_acc['max']  = peak_acc[pga_cols].max(axis = 1)
-
-    return peak_acc
+    # Combine into single df (with summary statistics if required)
+    return finish_extraction(extraction, summ_stats, return_stats)
 
 
 def get_peak_csr(result_dicts, elems_dfs, target_i = False,
-                 verbose = True, check_success = False, summ_stats = True):
+                 verbose = True, check_success = False, summ_stats = True,
+                 keep_models = True, stats_opts = {}, return_stats = False):
     ''' Extract cyclic stress ratio for a elements in QUAD4M model results
         
     Purpose
@@ -237,11 +212,12 @@ def get_peak_csr(result_dicts, elems_dfs, target_i = False,
         
     Parameters
     ----------
-    result_dicts : list of dict
+    result_dicts : list (or iterable) of dict
         List of dictionaries containting the analysis results, which must
-        contain the key "peak_str" and "model" (see post-process.py).
+        contain the key "peak_str" and "model" (see post-process.py). Can be a
+        generator, so that models are read one at a time (see read_models).
         
-    elems_dfs : list of dataframes
+    elems_dfs : list (or iterable) of dataframes
         List of dfs containting the element information for the model (order 
         with results_dicts must match!!). Must contain at least the columns
         ['n', 'xc', 'yc', 'sigma_v']. THESE MUST BE SAVED AHEAD OF TIME IN THE 
@@ -264,6 +240,21 @@ def get_peak_csr(result_dicts, elems_dfs, target_i = False,
     summ_stats : bool (optinal)
         If true, will include summary statistics across models in the output
         dataframe. Will include: mean, stdv, min, and max. Defaults to true.
+
+    keep_models : bool (optional)
+        If true (default), the output includes a column for each model. If
+        false, only summary statistics are kept, so that memory doesn't grow
+        with the number of models.
+
+    stats_opts : dict (optional)
+        Options for running statistics across models (see init_stats), such as
+        {'edges' : np.linspace(0, 2, 201), 'quantiles' : [0.16, 0.5, 0.84]}.
+        Defaults to {}.
+
+    return_stats : bool (optional)
+        If true, the running statistics are also returned, so that they can be
+        merged with those of other workers or stages (see merge_stats) or used
+        for exceedance probabilities (see exceedance). Defaults to False.
         
     Returns
     -------
@@ -279,81 +270,26 @@ def get_peak_csr(result_dicts, elems_dfs, target_i = False,
 
     # Initalize outputs
     if verbose: print('Now getting peak CSR')
-    dfs = []
+    extraction = init_extraction(keep_models, stats_opts)
 
     # Iterate through pairs of element and results files
-    model_counter = 0
     for i, (elems, result) in enumerate(zip(elems_dfs, result_dicts)):
 
-        # Check if model failed
-        if (check_success) & (not result['run_success']):
-            print('Uh oh... ' + result['model'] + 'failed', flush = True)
-            continue
-        else:
-            model_counter += 1
-
         # Print progress
         if verbose:
-            prog = '({:d}/{:d})'.format(i+1, len(result_dicts))
+            prog = progress(i, result_dicts)
             print('\t' + result['model'] + prog, flush = True)
 
-        # Read peak stresses and get model name
-        strs = result['peak_str']
-
-        # Double check that strs is a dataframe
-        # (will not be if model failed or wasnt processed correctly)
-        if not isinstance(strs, pd.DataFrame):
-            model_counter -= 1
-            msg = 'Watch out: model {:s} did not '.format(result['model'])
-            msg+= 'run or process correctly because "peak_str" key in result'
-            msg+= ' dict does not contain  a dataframe'
-            msg+= '\n Will skip this model but check what happened!'
-            print(msg, flush = True)
-            continue
-
-        # Get locations of interest
-        if target_i:
-            i_mask = (elems['i'] == target_i)
-        else:
-            i_mask = np.ones(len(elems))
-
-        # Extract needed information from elements dataframe
-        ns = elems.loc[i_mask, 'n'].values
-        xs = elems.loc[i_mask, 'xc'].values
-        ys = elems.loc[i_mask, 'yc'].values
-        sv = elems.loc[i_mask, 'sigma_v'].values
-
-        # Get cyclic stress ratio 
-        sigxy = np.array([float(strs.loc[strs['n'] == n, 'sigxy']) for n in ns])
-        CSR = sigxy / sv # THIS IS MISSING 0.65 YOU GOTTA ADD IT LATER
-
-        # Create new dataframe and add to outputs
-        col_name = result['model'] + '_csr'
-        if model_counter == 1:
-            new_df = pd.DataFrame({'n':ns, 'x':xs, 'y': ys, col_name:CSR})
-        else:
-            new_df = pd.DataFrame({'n':ns, col_name:CSR})
-
-        # Re-index and add to outputs
-        new_df.set_index('n', inplace = True)
-        dfs += [new_df]
-
-    # Combine into a single df
-    csr = pd.concat(dfs, axis = 1)
-
-    # If necessary, add summary statistics
-    if summ_stats:
-        csr_cols = [c for c in list(csr) if '_csr' in c]
-        csr['mean'] = csr[csr_cols].mean(axis = 1)
-        csr['stdv'] = csr[csr_cols].std(axis = 1)
-        csr['min']  = csr[csr_cols].min(axis = 1)
-        csr['max']  = csr[csr_cols].max(axis = 1)
+        # Update statistics with this model (unless it failed)
+        add_peak_csr(extraction, result, elems, target_i, check_success)
 
-    return csr
+    # Combine into a single df (with summary statistics if required)
+    return finish_extraction(extraction, summ_stats, return_stats)
 
 
 def get_SAspectra(result_dicts, n, Ts,  zeta = 0.05, verbose = True,
-                  check_success = False, summ_stats = True):
+                  check_success = False, summ_stats = True, keep_models = True,
+                  stats_opts = {}, return_stats = False):
     ''' Returns acc response spectra for a given node and natural periods
         
     Purpose
@@ -364,9 +300,10 @@ def get_SAspectra(result_dicts, n, Ts,  zeta = 0.05, verbose = True,
         
     Parameters
     ----------
-    result_dicts : list of dict
+    result_dicts : list (or iterable) of dict
         List of dictionaries containting the analysis results, which must
-        contain the key "acc_hist" and "model" (see post-process.py).
+        contain the key "acc_hist" and "model" (see post-process.py). Can be a
+        generator, so that models are read one at a time (see read_models).
 
     n : int
         Node number for which to extract acceleration history. You must ensure
@@ -393,6 +330,21 @@ def get_SAspectra(result_dicts, n, Ts,  zeta = 0.05, verbose = True,
     summ_stats : bool (optinal)
         If true, will include summary statistics across models in the output
         dataframe. Will include: mean, stdv, min, and max. Defaults to true.
+
+    keep_models : bool (optional)
+        If true (default), the output includes a column for each model. If
+        false, only summary statistics are kept, so that memory doesn't grow
+        with the number of models.
+
+    stats_opts : dict (optional)
+        Options for running statistics across models (see init_stats), such as
+        {'edges' : np.linspace(0, 2, 201), 'quantiles' : [0.16, 0.5, 0.84]}.
+        Defaults to {}.
+
+    return_stats : bool (optional)
+        If true, the running statistics are also returned, so that they can be
+        merged with those of other workers or stages (see merge_stats) or used
+        for exceedance probabilities (see exceedance). Defaults to False.
         
     Returns
     -------
@@ -408,58 +360,579 @@ def get_SAspectra(result_dicts, n, Ts,  zeta = 0.05, verbose = True,
     
     # Initalize outputs
     if verbose: print('Now getting acc spectra')
-    dfs = []
+    extraction = init_extraction(keep_models, stats_opts)
 
     # Iterate through provided result files
     for i, result in enumerate(result_dicts):
 
-        # Check if model has failed
-        if (check_success) & (not result['run_success']):
-            print('Uh oh... ' + result['model'] + 'failed', flush = True)
-            continue
-
         # Print progress
         if verbose:
-            prog = '({:d}/{:d})'.format(i+1, len(result_dicts))
+            prog = progress(i, result_dicts)
             print('\t' + result['model'] + prog, flush = True)
 
-        # Extract time history of interest
-        acc_df = result['acc_hist']
-
-        # Double check that acc_df is a dataframe
-        # (will not be if model failed or wasnt processed correctly)
-        if not isinstance(acc_df, pd.DataFrame):
-            msg = 'Watch out: model {:s} did not '.format(result['model'])
-            msg+= 'run or process correctly because "acc_hist" key in result'
-            msg+= ' dict does not contain  a dataframe'
-            msg+= '\n Will skip this model but check what happened!'
-            print(msg)
-            continue
-
-        # Get response spectra
-        node_lbl  = ' Node{:4d}X'.format(n)
-        dt = acc_df.iloc[1, 0] - acc_df.iloc[0, 0]
-        acc_hist = acc_df.loc[:, node_lbl].values
-        _, _, _, SA, _, _ = llgeo_spc.resp_spectra_wang(acc_hist, dt, Ts, zeta)
-
-        # Create new dataframe and add to outputs
-        col_name = result['model'] + '_SA'
-        new_df = pd.DataFrame({'Ts': Ts, col_name: SA})
-        new_df.set_index('Ts', inplace = True)
-        dfs += [new_df]
-
-    # Combine into a single df
-    SAspectra = pd.concat(dfs, axis = 1)
-
-    # If necessary, add summary statistics
+        # Update statistics with this model (unless it failed)
+        add_SAspectra(extraction, result, n, Ts, zeta, check_success)
+
+    # Combine into a single df (with summary statistics if required)
+    return finish_extraction(extraction, summ_stats, return_stats)
+
+
+# ------------------------------------------------------------------------------
+# Extraction steps (one model at a time)
+# ------------------------------------------------------------------------------
+# The get_* functions above (and extract_results, which does all extractions in
+# a single pass over the models) add models one at a time with these functions.
+
+def init_extraction(keep_models = True, stats_opts = {}):
+    ''' Initializes an extraction (running statistics are created when the
+        first model is added, since rows are taken from its geometry) '''
+
+    extraction = {'stats'       : None,
+                  'info'        : None,
+                  'keep_models' : keep_models,
+                  'stats_opts'  : stats_opts}
+
+    return extraction
+
+
+def finish_extraction(extraction, summ_stats = True, return_stats = False):
+    ''' Dataframe of an extraction (and running statistics, if requested) '''
+
+    stats = extraction['stats']
+
+    if stats is None:
+        mssg = 'Error in extracting results \n'
+        mssg+= 'no models were extracted (all failed or were skipped)'
+        raise Exception(mssg)
+
+    out_df = stats_df(stats, extraction['info'], summ_stats)
+
+    if return_stats:
+        return out_df, stats
+
+    return out_df
+
+
+def add_model(extraction, index, info, vals, name):
+    ''' Adds values of one model to an extraction (rows and info columns are
+        taken from the first model, since all must have the same geometry) '''
+
+    if extraction['stats'] is None:
+        extraction['stats'] = init_stats(index, extraction['keep_models'],
+                                         **extraction['stats_opts'])
+        extraction['info'] = info
+
+    update_stats(extraction['stats'], vals, name)
+
+
+def add_elems_prop(extraction, elems, name, target_col, target_val,
+                   return_col):
+    ''' Adds element property of one model (see get_elems_prop) '''
+
+    # Find location to return, and extract only the necessary data
+    mask = (elems[target_col] == target_val)
+    cols = ['n', 'i', 'j', 'xc', 'yc', return_col]
+    new_df = elems.loc[mask, cols].set_index('n')
+
+    add_model(extraction, new_df.index, new_df[['i', 'j', 'xc', 'yc']],
+              new_df[return_col], name + '_' + return_col)
+
+
+def add_peak_acc(extraction, result, x_loc = None, check_success = False):
+    ''' Adds peak accelerations of one model (see get_peak_acc) '''
+
+    # Check if model has failed
+    if (check_success) & (not result['run_success']):
+        print('Uh oh... ' + result['model'] + 'failed', flush = True)
+        return
+
+    # Read results
+    acc_df = result['peak_acc']
+
+    # Double check that acc_df is a dataframe
+    # (will not be if model failed or wasnt processed correctly)
+    if not isinstance(acc_df, pd.DataFrame):
+        msg = 'Watch out: model {:s} did not '.format(result['model'])
+        msg+= 'run or process correctly because "peak_acc" key in result'
+        msg+= ' dict does not contain  a dataframe'
+        msg+= '\n Will skip this model but check what happened!'
+        print(msg)
+        return
+
+    # Determine data to extract if a specific x is given
+    if x_loc is None:
+        mask = np.ones(len(acc_df), dtype = bool)
+    else:
+        mask = (acc_df['x'] == x_loc)
+
+    # Extract only the necessary data
+    acc_df = acc_df.loc[mask, ['node_n', 'x', 'y', 'x_acc']]
+    acc_df = acc_df.set_index('node_n')
+
+    add_model(extraction, acc_df.index, acc_df[['x', 'y']], acc_df['x_acc'],
+              result['model'] + '_pga')
+
+
+def add_peak_csr(extraction, result, elems, target_i = False,
+                 check_success = False):
+    ''' Adds peak cyclic stress ratios of one model (see get_peak_csr) '''
+
+    # Check if model failed
+    if (check_success) & (not result['run_success']):
+        print('Uh oh... ' + result['model'] + 'failed', flush = True)
+        return
+
+    # Read peak stresses
+    strs = result['peak_str']
+
+    # Double check that strs is a dataframe
+    # (will not be if model failed or wasnt processed correctly)
+    if not isinstance(strs, pd.DataFrame):
+        msg = 'Watch out: model {:s} did not '.format(result['model'])
+        msg+= 'run or process correctly because "peak_str" key in result'
+        msg+= ' dict does not contain  a dataframe'
+        msg+= '\n Will skip this model but check what happened!'
+        print(msg, flush = True)
+        return
+
+    # Get locations of interest
+    if target_i:
+        i_mask = (elems['i'] == target_i)
+    else:
+        i_mask = np.ones(len(elems), dtype = bool)
+
+    # Extract needed information from elements dataframe
+    new_df = elems.loc[i_mask, ['n', 'xc', 'yc', 'sigma_v']].set_index('n')
+
+    # Get cyclic stress ratio (looking up stresses of all elements at once)
+    sigxy = strs.set_index('n')['sigxy'].reindex(new_df.index).values
+    sv = new_df['sigma_v'].values
+    CSR = sigxy / sv # THIS IS MISSING 0.65 YOU GOTTA ADD IT LATER
+
+    info = new_df[['xc', 'yc']].rename(columns = {'xc' : 'x', 'yc' : 'y'})
+    add_model(extraction, new_df.index, info,
+              pd.Series(CSR, index = new_df.index), result['model'] + '_csr')
+
+
+def add_SAspectra(extraction, result, n, Ts, zeta = 0.05,
+                  check_success = False):
+    ''' Adds response spectra of one model (see get_SAspectra) '''
+
+    # Check if model has failed
+    if (check_success) & (not result['run_success']):
+        print('Uh oh... ' + result['model'] + 'failed', flush = True)
+        return
+
+    # Extract time history of interest
+    acc_df = result['acc_hist']
+
+    # Double check that acc_df is a dataframe
+    # (will not be if model failed or wasnt processed correctly)
+    if not isinstance(acc_df, pd.DataFrame):
+        msg = 'Watch out: model {:s} did not '.format(result['model'])
+        msg+= 'run or process correctly because "acc_hist" key in result'
+        msg+= ' dict does not contain  a dataframe'
+        msg+= '\n Will skip this model but check what happened!'
+        print(msg)
+        return
+
+    # Get response spectra
+    node_lbl  = ' Node{:4d}X'.format(n)
+    dt = acc_df.iloc[1, 0] - acc_df.iloc[0, 0]
+    acc_hist = acc_df.loc[:, node_lbl].values
+    _, _, _, SA, _, _ = llgeo_spc.resp_spectra_wang(acc_hist, dt, Ts, zeta)
+
+    add_model(extraction, pd.Index(Ts, name = 'Ts'), None, SA,
+              result['model'] + '_SA')
+
+
+# ------------------------------------------------------------------------------
+# Running statistics across models
+# ------------------------------------------------------------------------------
+
+def init_stats(index, keep_cols = False, nsample = 0, quantiles = [],
+               seed = None, edges = None):
+    ''' Initializes running statistics across models (one set per row)
+        
+    Purpose
+    -------
+    Summary statistics across models are updated one model at a time (see
+    update_stats), so that memory doesn't depend on the number of models. Each
+    row (node, element, period, etc.) keeps its count, mean and sum of squared
+    deviations (Welford's algorithm), min and max. Quantiles are estimated
+    either from a fixed-bin histogram of each row (if "edges" are given), or
+    from a reservoir sample of "nsample" models (uniformly sampled from all
+    the models seen). Either way memory is constant, but quantiles are
+    approximate. Histograms merge exactly (see merge_stats) and also give
+    exceedance probabilities (see exceedance), so they are preferred for
+    fragility-type outputs.
+
+    Parameters
+    ----------
+    index : array or pandas index
+        Labels of the rows (ex. node_n). Values given to update_stats as pandas
+        series are aligned to these labels.
+
+    keep_cols : bool (optional)
+        If true, the values of each model are also kept (one column per model).
+        Defaults to False.
+
+    nsample : int (optional)
+        Number of models in the reservoir sample (for quantiles). Defaults to 0.
+
+    quantiles : list of floats (optional)
+        Quantiles (between 0 and 1) to include in the output of stats_df, as
+        columns 'p' + percentile (ex. 'p50'). Requires edges or nsample > 0
+        (histograms are used if both are given).
+
+    seed : int (optional)
+        Seed for the reservoir sample. Defaults to None.
+
+    edges : numpy array (optional)
+        Edges of histogram bins (increasing), the same for all rows. Bins are
+        closed on the right (a value on an edge counts in the bin below it).
+        Values outside of the edges are counted in two extra bins (at or below
+        the first edge, and above the last one).
+        Defaults to None (no histograms).
+        
+    Returns
+    -------
+    stats : dict
+        Running statistics, to be updated with update_stats (or combined with
+        merge_stats) and summarized with stats_df.
+    '''
+
+    if len(quantiles) > 0 and nsample < 1 and edges is None:
+        mssg = 'Error in initializing running statistics \n'
+        mssg+= 'quantiles require histograms (edges) or a reservoir sample '
+        mssg+= '(nsample > 0)'
+        raise Exception(mssg)
+
+    if edges is not None:
+        edges = np.asarray(edges, dtype = float)
+        if (len(edges) < 2) or np.any(np.diff(edges) <= 0):
+            mssg = 'Error in initializing running statistics \n'
+            mssg+= 'histogram edges must be increasing (at least 2 edges)'
+            raise Exception(mssg)
+
+    nrows = len(index)
+    stats = {'index'     : pd.Index(index),
+             'nmodels'   : 0,
+             'count'     : np.zeros(nrows),
+             'mean'      : np.zeros(nrows),
+             'M2'        : np.zeros(nrows),
+             'min'       : np.full(nrows,  np.inf),
+             'max'       : np.full(nrows, -np.inf),
+             'cols'      : {} if keep_cols else None,
+             'sample'    : np.full((nsample, nrows), np.nan),
+             'quantiles' : list(quantiles),
+             'rng'       : np.random.default_rng(seed),
+             'edges'     : edges,
+             'hist'      : None}
+
+    # Counts in each bin, plus one bin below and one above the edges
+    if edges is not None:
+        stats['hist'] = np.zeros((nrows, len(edges) + 1), dtype = np.int64)
+
+    return stats
+
+
+def update_stats(stats, vals, name = None):
+    ''' Updates running statistics (see init_stats) with the values of one model
+
+    Parameters
+    ----------
+    stats : dict
+        Running statistics (see init_stats). Updated in place.
+
+    vals : pandas series or numpy array
+        Values of the model. Series are aligned to stats['index'] (missing rows
+        are NaN, and rows that aren't in stats['index'] raise an error); arrays
+        must already be in the same order. NaNs are skipped.
+
+    name : str (optional)
+        Name of the column for this model (only used if stats keeps columns)
+        
+    Returns
+    -------
+    stats : dict
+        Same running statistics, updated.
+    '''
+
+    if isinstance(vals, pd.Series):
+
+        # Rows that aren't in stats would be lost (all models must have the
+        # same geometry, or a subset of the rows of the first one)
+        extra = ~vals.index.isin(stats['index'])
+        if np.any(extra):
+            mssg = 'Error in updating running statistics \n'
+            mssg+= 'model has rows that are not in the statistics (the first '
+            mssg+= 'model): ' + str(list(vals.index[extra][:10]))
+            raise Exception(mssg)
+
+        x = vals.reindex(stats['index']).values.astype(float)
+    else:
+        x = np.asarray(vals, dtype = float)
+
+    if len(x) != len(stats['index']):
+        mssg = 'Error in updating running statistics \n'
+        mssg+= 'model has {:d} values, expected {:d}'.format(len(x),
+                                                            len(stats['index']))
+        raise Exception(mssg)
+
+    # Welford's update of mean and sum of squared deviations (skipping NaNs)
+    ok = ~np.isnan(x)
+    stats['count'][ok] += 1
+    delta = x[ok] - stats['mean'][ok]
+    stats['mean'][ok] += delta / stats['count'][ok]
+    stats['M2'][ok]   += delta * (x[ok] - stats['mean'][ok])
+    stats['min'] = np.fmin(stats['min'], x)
+    stats['max'] = np.fmax(stats['max'], x)
+
+    stats['nmodels'] += 1
+    if stats['cols'] is not None:
+        stats['cols'][name] = x
+
+    # Histograms: bin i has edges[i-1] < x <= edges[i] (bin 0 is at or below
+    # the first edge, bin -1 above the last one), so that cdf_at_edges gives
+    # P(X <= edge) and exceedance gives P(X > x) also for values on the edges
+    if stats['hist'] is not None:
+        ibin = np.searchsorted(stats['edges'], x[ok], side = 'left')
+        stats['hist'][np.flatnonzero(ok), ibin] += 1
+
+    # Reservoir sample: model k replaces a random sample with prob. nsample/k
+    k, nsample = stats['nmodels'], len(stats['sample'])
+    if k <= nsample:
+        stats['sample'][k - 1] = x
+    elif nsample > 0:
+        j = stats['rng'].integers(0, k)
+        if j < nsample:
+            stats['sample'][j] = x
+
+    return stats
+
+
+def merge_stats(stats_a, stats_b):
+    ''' Combines running statistics of two sets of models (ex. from different
+        workers or stages), as if all models had been added to one of them.
+        Moments are combined with Chan et al.'s formulas, and min, max and
+        model columns are exact, and so are histograms (counts are added).
+        Reservoir samples are subsampled so that the result is still a uniform
+        sample of all the models. '''
+
+    if not stats_a['index'].equals(stats_b['index']):
+        raise Exception('Cannot merge running statistics with different rows')
+
+    if len(stats_a['sample']) != len(stats_b['sample']):
+        mssg = 'Cannot merge running statistics with different nsample'
+        raise Exception(mssg)
+
+    if (stats_a['edges'] is None) != (stats_b['edges'] is None) or \
+       (stats_a['edges'] is not None and \
+        not np.array_equal(stats_a['edges'], stats_b['edges'])):
+        mssg = 'Cannot merge running statistics with different histogram edges'
+        raise Exception(mssg)
+
+    na, nb = stats_a['count'], stats_b['count']
+    n = na + nb
+
+    # Combined moments (rows with no values in either set stay at zero)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        delta = stats_b['mean'] - stats_a['mean']
+        mean = np.where(n > 0, stats_a['mean'] + delta * nb / n, 0)
+        M2 = np.where(n > 0, stats_a['M2'] + stats_b['M2'] + \
+                             delta**2 * na * nb / n, 0)
+
+    # Model columns are only kept if both sets have them
+    if (stats_a['cols'] is None) or (stats_b['cols'] is None):
+        cols = None
+    else:
+        cols = dict(stats_a['cols'], **stats_b['cols'])
+
+    # Number of models in the reservoir that come from each set
+    ma, mb = stats_a['nmodels'], stats_b['nmodels']
+    nsample = len(stats_a['sample'])
+    size = min(nsample, ma + mb)
+    rng = stats_a['rng']
+    ka = rng.hypergeometric(ma, mb, size) if size > 0 else 0
+
+    sample = np.full((nsample, len(n)), np.nan)
+    ia = rng.choice(min(ma, nsample), ka, replace = False)
+    ib = rng.choice(min(mb, nsample), size - ka, replace = False)
+    sample[:ka] = stats_a['sample'][ia]
+    sample[ka : size] = stats_b['sample'][ib]
+
+    stats = {'index'     : stats_a['index'],
+             'nmodels'   : ma + mb,
+             'count'     : n,
+             'mean'      : mean,
+             'M2'        : M2,
+             'min'       : np.fmin(stats_a['min'], stats_b['min']),
+             'max'       : np.fmax(stats_a['max'], stats_b['max']),
+             'cols'      : cols,
+             'sample'    : sample,
+             'quantiles' : stats_a['quantiles'],
+             'rng'       : rng,
+             'edges'     : stats_a['edges'],
+             'hist'      : None}
+
+    if stats_a['hist'] is not None:
+        stats['hist'] = stats_a['hist'] + stats_b['hist']
+
+    return stats
+
+
+def stats_df(stats, info = None, summ_stats = True):
+    ''' Dataframe with running statistics: columns in "info" (ex. x, y), one
+        column per model (if kept), and summary statistics (if summ_stats):
+        mean, stdv (with ddof = 1), min, max and quantiles (if any) '''
+
+    out = {}
+    if stats['cols'] is not None:
+        out.update(stats['cols'])
+
     if summ_stats:
-        spectra_cols = [c for c in list(SAspectra) if 'SA' in c]
-        SAspectra['mean'] = SAspectra[spectra_cols].mean(axis = 1)
-        SAspectra['stdv'] = SAspectra[spectra_cols].std(axis = 1)
-        SAspectra['min']  = SAspectra[spectra_cols].min(axis = 1)
-        SAspectra['max']  = SAspectra[spectra_cols].max(axis = 1)
+        n = stats['count']
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            out['mean'] = np.where(n > 0, stats['mean'], np.nan)
+            stdv = np.sqrt(stats['M2'] / (n - 1))
+            out['stdv'] = np.where(n > 1, stdv, np.nan)
+        out['min'] = np.where(n > 0, stats['min'], np.nan)
+        out['max'] = np.where(n > 0, stats['max'], np.nan)
+
+        # Quantiles from histograms if available, otherwise from reservoir
+        # sample (rows with no values are NaN)
+        sample = stats['sample'][:min(stats['nmodels'], len(stats['sample']))]
+        for q in stats['quantiles']:
+            if stats['hist'] is not None:
+                out['p{:g}'.format(100 * q)] = hist_quantile(stats, q)
+            else:
+                out['p{:g}'.format(100 * q)] = nanquantile(sample, q)
+
+    out_df = pd.DataFrame(out, index = stats['index'])
+    if info is not None:
+        out_df = pd.concat([info, out_df], axis = 1)
+
+    return out_df
+
+
+def exceedance(stats, thresholds):
+    ''' Probability of exceeding each threshold across models, for each row
+        
+    Purpose
+    -------
+    Uses the histograms of running statistics (see init_stats with "edges") to
+    get P(X > x) for many thresholds at once (ex. fragility-type outputs such
+    as P(CSR > x) for each element). Probabilities are exact for thresholds
+    that fall on bin edges, and are linearly interpolated within bins
+    otherwise (values are assumed to be uniform within each bin).
+
+    Parameters
+    ----------
+    stats : dict
+        Running statistics with histograms (see init_stats)
+
+    thresholds : list or numpy array
+        Values of x, which must be within the histogram edges (values outside
+        of the edges are only known to be below the first or above the last).
+        
+    Returns
+    -------
+    P_exceed : dataframe
+        Probability of exceedance, with one row per row of stats (NaN if it has
+        no values) and one column per threshold.
+    '''
+
+    if stats['hist'] is None:
+        raise Exception('Exceedance probabilities require histograms (edges)')
+
+    edges = stats['edges']
+    x = np.asarray(thresholds, dtype = float).ravel()
+
+    if np.any(x < edges[0]) or np.any(x > edges[-1]):
+        mssg = 'Error in exceedance probabilities \n'
+        mssg+= 'thresholds must be within histogram edges '
+        mssg+= '[{:g}, {:g}]'.format(edges[0], edges[-1])
+        raise Exception(mssg)
+
+    # Non-exceedance at each edge, then interpolated at the thresholds
+    F = cdf_at_edges(stats)
+    j = np.searchsorted(edges, x, side = 'right') - 1
+    j = np.clip(j, 0, len(edges) - 2)
+    w = (x - edges[j]) / (edges[j + 1] - edges[j])
+    P_exceed = 1 - (F[:, j] + w * (F[:, j + 1] - F[:, j]))
+
+    return pd.DataFrame(P_exceed, index = stats['index'], columns = x)
+
+
+def hist_quantile(stats, q):
+    ''' Quantile q of each row from its histogram (linear interpolation within
+        the bin where the cdf reaches q). Values below the first or above the
+        last edge can't be located, so those quantiles are the edges. '''
+
+    edges = stats['edges']
+    F = cdf_at_edges(stats)
+
+    # First edge where cdf >= q, and interpolation from the previous edge
+    k = np.sum(F < q, axis = 1)
+    k_hi = np.clip(k, 1, len(edges) - 1)
+    rows = np.arange(len(F))
+    F_lo, F_hi = F[rows, k_hi - 1], F[rows, k_hi]
 
-    return SAspectra
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        w = np.clip((q - F_lo) / (F_hi - F_lo), 0, 1)
+    Q = edges[k_hi - 1] + w * (edges[k_hi] - edges[k_hi - 1])
+
+    Q[k == 0] = edges[0]
+    Q[k == len(edges)] = edges[-1]
+    Q[np.isnan(F[:, -1])] = np.nan
+
+    return Q
+
+
+# ------------------------------------------------------------------------------
+# Helper Functions
+# ------------------------------------------------------------------------------
+
+def cdf_at_edges(stats):
+    ''' Fraction of values of each row at or below each histogram edge (NaN
+        for rows without values), size (nrows, nedges) '''
+
+    counts = stats['hist']
+    total = np.sum(counts, axis = 1, keepdims = True)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        F = np.cumsum(counts[:, :-1], axis = 1) / total
+
+    return F
+
+
+def read_models(in_path, files):
+    ''' Reads pickle files one at a time (generator), so that only one model is
+        in memory at a time '''
+
+    for f in files:
+        yield llgeo_fls.read_pkl(in_path, f)
+
+
+def progress(i, models):
+    ''' Progress string for model i (total is only known for lists) '''
+
+    if hasattr(models, '__len__'):
+        return '({:d}/{:d})'.format(i + 1, len(models))
+
+    return '({:d})'.format(i + 1)
+
+
+def nanquantile(sample, q):
+    ''' Quantile of each column of sample, ignoring NaNs (NaN if no values) '''
+
+    out = np.full(sample.shape[1], np.nan)
+    ok = np.any(~np.isnan(sample), axis = 0)
+    if np.any(ok):
+        out[ok] = np.nanquantile(sample[:, ok], q, axis = 0)
+
+    return out
 
 # ------------------------------------------------------------------------------
 # For doing all these extractions on a set of files
@@ -474,16 +947,50 @@ def extract_results(in_path, result_files, elem_files, out_path, out_id,
     # TODO - document
  
     # --------------------------------------------------------------------------
-    # Read files and basic set-up
+    # Extract results in a single pass over the models
     # --------------------------------------------------------------------------
     
-    # TODO - this kills memory for large stages. Do better.
-    # Read all the result files
-    result_dicts = [llgeo_fls.read_pkl(in_path, f) for f in result_files]
+    # Result and element files are read once, one model at a time, and every
+    # requested extraction is updated with each model, so memory doesn't grow
+    # with the number of models. Use keep_models = False in the kargs to only
+    # keep summary statistics, and return_stats = True to also save running
+    # statistics (ex. histograms for exceedance probabilities, which can be
+    # merged across stages).
+    kargs = [karg_elem_prop, karg_peak_acc, karg_peak_csr, karg_SAspectra]
+    exts  = [init_extraction(karg.get('keep_models', True),
+                             karg.get('stats_opts', {})) if karg else None
+             for karg in kargs]
+    opts  = [step_kargs(karg) if karg else None for karg in kargs]
+    ext_elem_prop, ext_peak_acc, ext_peak_csr, ext_SAspectra = exts
+    opt_elem_prop, opt_peak_acc, opt_peak_csr, opt_SAspectra = opts
+
+    verbose = any(karg.get('verbose', True) for karg in kargs if karg)
+    result_dicts = read_models(in_path, result_files)
 
-    # If necessary, read all the element files
     if (karg_elem_prop) or (karg_peak_csr):
-        elem_dfs = [llgeo_fls.read_pkl(in_path, f) for f in elem_files]
+        elem_dfs = read_models(in_path, elem_files)
+    else:
+        elem_dfs = (None for _ in result_files)
+
+    for i, (result, elems) in enumerate(zip(result_dicts, elem_dfs)):
+
+        # Print progress
+        if verbose:
+            prog = progress(i, result_files)
+            print('\t' + result['model'] + prog, flush = True)
+
+        if karg_elem_prop:
+            add_elems_prop(ext_elem_prop, elems, result['model'],
+                           **opt_elem_prop)
+
+        if karg_peak_acc:
+            add_peak_acc(ext_peak_acc, result, **opt_peak_acc)
+
+        if karg_peak_csr:
+            add_peak_csr(ext_peak_csr, result, elems, **opt_peak_csr)
+
+        if karg_SAspectra:
+            add_SAspectra(ext_SAspectra, result, **opt_SAspectra)
 
     # --------------------------------------------------------------------------
     # Element property
@@ -491,14 +998,14 @@ def extract_results(in_path, result_files, elem_files, out_path, out_id,
     if karg_elem_prop:
 
         # Get element property dataframe
-        names = [result['model'] for result in result_dicts]
-        extracted_props = get_elems_prop(elem_dfs, names, **karg_elem_prop)
+        extracted_props, stats = finish_karg(ext_elem_prop, karg_elem_prop)
         
         # Save outputs
         return_col = karg_elem_prop['return_col']
         out_file = return_col + '_' + out_id + '.pkl' 
         outputs = {return_col: extracted_props,
                    'description': ' Contains summary of elements ' + return_col}
+        if stats is not None: outputs['stats'] = stats
         llgeo_fls.save_outputs(out_path, out_file, outputs, src_name)
 
     # --------------------------------------------------------------------------
@@ -506,13 +1013,14 @@ def extract_results(in_path, result_files, elem_files, out_path, out_id,
     # --------------------------------------------------------------------------
     if karg_peak_acc:
 
-        # Get element property dataframe
-        peak_acc = get_peak_acc(result_dicts, **karg_peak_acc)
+        # Get peak acceleration dataframe
+        peak_acc, stats = finish_karg(ext_peak_acc, karg_peak_acc)
         
         # Save outputs
         out_file = 'PGA_' + out_id + '.pkl' 
         outputs = {'peak_acc': peak_acc,
                    'description': ' Contains peak accelerations'}
+        if stats is not None: outputs['stats'] = stats
         llgeo_fls.save_outputs(out_path, out_file, outputs, src_name)
 
     # --------------------------------------------------------------------------
@@ -520,13 +1028,14 @@ def extract_results(in_path, result_files, elem_files, out_path, out_id,
     # --------------------------------------------------------------------------
     if karg_peak_csr:
 
-        # Get element property dataframe
-        peak_csr = get_peak_csr(result_dicts, elem_dfs, **karg_peak_csr)
+        # Get peak CSR dataframe
+        peak_csr, stats = finish_karg(ext_peak_csr, karg_peak_csr)
 
         # Save outputs
         out_file = 'CSR_' + out_id + '.pkl' 
         outputs = {'peak_csr': peak_csr,
                    'description': ' Contains peak CSRs'}
+        if stats is not None: outputs['stats'] = stats
         llgeo_fls.save_outputs(out_path, out_file, outputs, src_name)
 
     # --------------------------------------------------------------------------
@@ -534,13 +1043,34 @@ def extract_results(in_path, result_files, elem_files, out_path, out_id,
     # --------------------------------------------------------------------------
     if karg_SAspectra:
 
-        # Get element property dataframe0
-        spectra = get_SAspectra(result_dicts, **karg_SAspectra)
+        # Get spectra dataframe
+        spectra, stats = finish_karg(ext_SAspectra, karg_SAspectra)
 
         # Save outputs
         out_file = 'SPECTRA_' + out_id + '.pkl' 
         outputs = {'spectra': spectra,
                    'description': ' Contains acceleration spectra'}
+        if stats is not None: outputs['stats'] = stats
         llgeo_fls.save_outputs(out_path, out_file, outputs, src_name)
    
-    return True
\ No newline at end of file
+    return True
+
+
+def step_kargs(karg):
+    ''' Options in karg (see extract_results) for the add_* functions '''
+
+    return {k : v for k, v in karg.items() if k not in FINISH_KEYS}
+
+
+def finish_karg(extraction, karg):
+    ''' Finishes an extraction with the options in karg (extract_results), and
+        returns (dataframe, running statistics or None) '''
+
+    summ_stats   = karg.get('summ_stats', True)
+    return_stats = karg.get('return_stats', False)
+    out = finish_extraction(extraction, summ_stats, return_stats)
+
+    if return_stats:
+        return out
+
+    return out, None
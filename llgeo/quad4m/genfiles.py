@@ -11,11 +11,22 @@ import pandas as pd
 import os
 import llgeo.utilities.formatters as fff
 
+# Column formats (Fortran edit descriptors) for the elem and node tables of .q4r
+Q4R_ELEM_FMTS = {'n'   : 'I5',    'N1'    : 'I5',    'N2'     : 'I5',
+                 'N3'  : 'I5',    'N4'    : 'I5',    's_num'  : 'I5',
+                 'unit_w' : 'F10.0', 'po' : 'F10.2', 'Gmax'   : 'E10.3',
+                 'G'   : 'E10.3', 'XL'    : 'F10.4', 'LSTR'   : 'I5'}
+
+Q4R_NODE_FMTS = {'node_n': 'I5',    'x'   : 'F10.4', 'y'   : 'F10.4',
+                 'BC'    : 'I5',    'OUT' : 'I5',    'X2IH': 'F13.7',
+                 'X1IH'  : 'F13.7', 'XIH' : 'F13.7', 'X2IV': 'F13.7',
+                 'X1IV'  : 'F13.7', 'XIV' : 'F13.7'}
+
 # ------------------------------------------------------------------------------
 # Main Functions
 # ------------------------------------------------------------------------------
 
-def gen_q4r(Q, elems, nodes, out_path, out_file):
+def gen_q4r(Q, elems, nodes, out_path, out_file, template = None):
     ''' generates QUAD4M input file (.q4r) from given settings, elems, and nodes
     
     Purpose
@@ -23,6 +34,11 @@ def gen_q4r(Q, elems, nodes, out_path, out_file):
     Given a dictionary of QUAD4M settings (q), and dataframe with element and 
     node information (nodes), this creates a file (out_path+out_file) that can
     be used as input for the ground response analysis software QUAD4M (REF 1).
+
+    If a "template" is given (see gen_q4r_template), only the header lines and
+    the element columns that were left variable in the template are formatted.
+    Everything else (node table, element connectivity, etc.) is copied from the
+    template as is, and lines are streamed straight to the output file.
     
     Parameters
     ----------
@@ -33,11 +49,14 @@ def gen_q4r(Q, elems, nodes, out_path, out_file):
         DataFrame with information for elements (initialized in geometry module)
         Minimum required columns are:
             [ n, N1, N2, N3, N4, s_num, unit_w, po, Gmax, G, XL, LSTR ]
+        If a template is given, only the template's variable columns are needed
+        (order of rows must match the elems used to create the template!)
 
     nodes : pandas DataFrame
         DataFrame with information for nodes (initialized in geometry module)
         Minimum required columns are:
             [ node_n, x, y, BC, OUT, X2IH, X1IH, XIH, X2IV, X1IV, XIV ]
+        Not used if a template is given (can be None).
 
     out_path : str
         path to directory where output will be saved
@@ -45,11 +64,16 @@ def gen_q4r(Q, elems, nodes, out_path, out_file):
     out_file : str
         name of text file to store outputs
 
+    template : dict (optional)
+        precompiled static parts of the file, created by gen_q4r_template.
+        Defaults to None, so that the whole file is formatted from scratch.
+
     Returns
     -------
     L : list of str
         List of strings corresponding to QUAD4M input file that was printed
         If error checking catchers error, returns FALSE instead.
+        If a template is given, lines are not kept and TRUE is returned instead.
         
     Notes
     -----
@@ -68,151 +92,161 @@ def gen_q4r(Q, elems, nodes, out_path, out_file):
     # --------------------------------------------------------------------------
     # TODO-wishlist: maybe switch to proper logging instead?
 
-    # Check that all required node and element information is present
-    req_elem_cols = ['n', 'N1', 'N2', 'N3', 'N4',
-                     's_num', 'unit_w','po', 'Gmax', 'G', 'XL', 'LSTR']
-
-    req_node_cols = ['node_n', 'x', 'y', 'BC', 'OUT',
-                     'X2IH', 'X1IH', 'XIH', 'X2IV', 'X1IV', 'XIV'] 
-
-    elems_check = check_cols(req_elem_cols, list(elems), err_subtitle = 'elems') 
-    nodes_check = check_cols(req_node_cols, list(nodes), err_subtitle = 'nodes') 
-
-    if not all([elems_check, nodes_check]):
-        print('Cannot create QUAD4M input file')
-        return False
+    # If no template was given, render everything now (nothing is variable)
+    keep_lines = template is None
+    if keep_lines:
+        template = gen_q4r_template(Q, elems, nodes, var_cols = [])
 
-    # Ensure proper data types for some columns in nodes and elements tables
-    etypes = 6*[int] + 5*[float] + [int]
-    elems = elems.astype({col:t for col, t in zip(req_elem_cols, etypes)})
+        if not template:
+            return False
 
-    ntypes = [int] + 2*[float] + 2*[int] + 6*[float]
-    nodes = nodes.astype({col:t for col, t in zip(req_node_cols, ntypes)})
-
-    # Check that number of nodes,elements, and earthquake steps are within lims
-    if len(elems) > 99999:
-        print('Too many elements. Must be less than 99,999')
+    # Check that variable element columns exist and that the mesh matches
+    if not check_cols(template['var_cols'], list(elems), err_subtitle = 'elems'):
         print('Cannot create QUAD4M input file')
         return False
 
-    if len(nodes) > 99999:
-        print('Too many nodal points. Must be less than 99,999')
+    if len(elems) != template['nelm']:
+        print('Number of elements does not match the q4r template')
         print('Cannot create QUAD4M input file')
         return False
 
+    # Check that number of earthquake steps is within limits
     if Q['KGMAX'] > 99999:
         print('Too many earthquake time steos. KGMAX must be less than 99,999')
         print('Cannot create QUAD4M input file')
         return False
 
-    # Prepare numeric outputs (formatting)
+    # Create header lines (these depend on Q, so are never in the template)
     # --------------------------------------------------------------------------
-    # Damping settings and rock properties
-    N = [Q[s] for s in ['DRF','PRM','ROCKVP','ROCKVS','ROCKRHO']]
-    L_05 = format_line(N, 5*['{:10f}'])
+    L_head = q4r_header_lines(Q)
 
-    # Number of elements, nodes, and seismic coefficient lines
-    N = [Q[s] for s in ['NELM','NDPT','NSLP']]
-    L_07 = format_line(N, 3*['{:5d}'])
+    if not L_head:
+        return False
 
-    # Computational switches
-    N = [Q[s] for s in ['KGMAX','KGEQ','N1EQ','N2EQ','N3EQ','NUMB','KV','KSAV']]
-    L_09 = format_line(N,  8*['{:5d}'])
+    # Fill in the variable element columns
+    # --------------------------------------------------------------------------
+    Ls_40 = fill_elem_lines(template, elems)
 
-    # Earthquake file descriptors
-    N = [Q[s] for s in ['DTEQ','EQMUL1','EQMUL2','UGMAX1','UGMAX2','HDRX',
-                        'HDRY','NPLX','NPLY','PRINPUT']]
-    L_11 = format_line(N, 5*['{:10f}'] + 4*['{:5d}'] + 1*['{:10f}'])
+    # Print lines to a file and return 
+    # --------------------------------------------------------------------------
+    with open(out_path+out_file, 'w') as q4r_file:
+        q4r_file.writelines(line + '\r\n' for line in L_head)
+        q4r_file.write(template['elem_header'] + '\r\n')                 #C(L39)
+        q4r_file.writelines(line + '\r\n' for line in Ls_40)             #V(L40)
+        q4r_file.write(template['node_block'])                     #C(L41) V(L42)
+        q4r_file.close()
 
-    # Output flags
-    N = [Q[s] for s in ['SOUT','AOUT','KOUT']]
-    L_18 = format_line(N, 3*['{:5d}'])
+    if not keep_lines:
+        return True
 
-    # Element table
-    out_elems = elems[req_elem_cols].astype('O')
-    Fs = 6*['{:5d}']+['{:10.0f}','{:10.2f}']+2*['{:10.3e}']+['{:10.4f}','{:5d}']
-    Ls_40 = [format_line(N, Fs) for _, N in out_elems.iterrows()]
+    L = L_head + [template['elem_header']] + Ls_40
+    L += template['node_block'].split('\r\n')[:-1]
 
-    # Node table
-    out_nodes = nodes[req_node_cols].astype('O')
-    Fs = ['{:5d}']+2*['{:10.4f}']+2*['{:5d}']+6*['{:>13.7f}']
-    Ls_42 = [format_line(N, Fs) for _, N in out_nodes.iterrows()]
+    return L
 
-    # Create list of file lines 
-    # --------------------------------------------------------------------------
-    L = []
-    L += ['MODEL:' + Q['FTITLE'] + '  |  ' + Q['STITLE']]                #C(L01)
-    L += ['UNITS (E for English, S for SI): (A1)']                       #C(L02)
-    L += [Q['UNITS']]                                                    #V(L03)
-    L += ['       DRF       PRM    ROCKVP    ROCKVS   ROCKRHO (5F10.0)'] #C(L04)
-    L += [L_05]                                                          #V(L05) 
-    L += [' NELM NDPT NSLP (3I5)']                                       #C(L06) 
-    L += [L_07]                                                          #V(L07)
-    L += ['KGMAX KGEQ N1EQ N2EQ N3EQ NUMB   KV KSAV (8I5)']              #C(L08)
-    L += [L_09]                                                          #V(L09)
-    L += ['      DTEQ    EQMUL1    EQMUL2    UGMAX1    UGMAX2 ' +        #C(L10)
-              'HDRX HDRY NPLX NPLY   PRINPUT (5F10.0,4I5,F10.0)']
-    L += [L_11]                                                          #V(L11)
-    L += ['EARTHQUAKE INPUT FILE NAME(S) & FORMAT(S) (* for free)  (A)'] #C(L12)
-    L += [ Q['EARTHQH'] ]                                                #V(L13)
-    L += [ Q['EQINPFMT1'] ]                                              #V(L14)
 
-    if Q['KV'] == 2:
-        L += [ Q['EARTHQV'] ]                                            #V(L15)
-        L += [ Q['EQINPFMT2'] ]                                          #V(L16)
+def gen_q4r_template(Q, elems, nodes, var_cols = ['s_num', 'Gmax', 'G', 'XL']):
+    ''' precompiles the static parts of a QUAD4M input file (.q4r)
+    
+    Purpose
+    -------
+    Across a stage, most of a .q4r file is the same from model to model (node
+    coordinates and boundary conditions, element connectivity, etc.). This
+    formats those static parts once, so that gen_q4r only has to format the
+    header lines and the element columns in "var_cols" for each realization.
+    
+    Parameters
+    ----------
+    Q : dict
+        dictionary with settings for QUAD4M analyses. See ref (1). Not used
+        here (header lines depend on Q, so gen_q4r formats them each time).
 
-    L+= [' SOUT AOUT KOUT (3I5)']                                        #C(L17)
-    L+= [L_18]                                                           #V(L18) 
+    elems : pandas DataFrame
+        DataFrame with information for elements (initialized in geometry module)
+        Minimum required columns are:
+            [ n, N1, N2, N3, N4, s_num, unit_w, po, Gmax, G, XL, LSTR ]
+        Values in "var_cols" are not used (they can be anything for now).
 
-    if Q['SOUT'] == 1:
-        L+= ['STRESS OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)']        #C(L19)
-        L+= [ Q['SHISTFMT']  ]                                           #V(L20)
-        L+= [ Q['SFILEOUT'] ]                                            #V(L21)
-        L+= [ Q['SSUFFIX']   ]                                           #V(L22)
+    nodes : pandas DataFrame
+        DataFrame with information for nodes (initialized in geometry module)
+        Minimum required columns are:
+            [ node_n, x, y, BC, OUT, X2IH, X1IH, XIH, X2IV, X1IV, XIV ]
 
-    if Q['AOUT'] == 1:
-        L+= ['ACCELERATION OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)']  #C(L23)
-        L+= [ Q['AHISTFMT']  ]                                           #V(L24)
-        L+= [ Q['AFILEOUT']  ]                                           #V(L25)
-        L+= [ Q['ASUFFIX']   ]                                           #V(L26)
+    var_cols : list of str (optional)
+        element columns that change from model to model, and so are formatted
+        in every call to gen_q4r. Defaults to ['s_num', 'Gmax', 'G', 'XL'].
 
-    if Q['KOUT'] == 1:
-        L+= ['SEISMIC COEFF OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)'] #C(L27)
-        L+= [ Q['KHISTFMT']  ]                                           #V(L28)
-        L+= [ Q['KFILEOUT'] ]                                            #V(L29)
-        L+= [ Q['KSUFFIX']   ]                                           #V(L30)
+    Returns
+    -------
+    template : dict
+        Contains the pre-formatted blocks of the file, with keys:
+            ['nelm', 'var_cols', 'elem_blocks', 'elem_header', 'node_block']
+        If error checking catches error, returns FALSE instead.
 
-    # TODO-soon:
-    #   Putting these here so I am aware of the work that still needs to be done
-    #   Don't think I'll be using the KSAV option ¯|_(ツ)_|¯
+    References
+    ----------
+    (1) Hudson, M., Idriss, I. M., & Beikae, M. (1994). User’s Manual for
+        QUAD4M. National Science Foundation.
+            See: Fortran code describing inputs (Pgs. A-3 to A-5)
+    '''
 
-    # Restart file name descriptors (Lines 31 to 32)
-    if Q['KSAV'] == 1:
-        print('The KSAV functionality has not been coded yet. Turn to 0')
+    # Check that all required node and element information is present
+    req_elem_cols = list(Q4R_ELEM_FMTS.keys())
+    req_node_cols = list(Q4R_NODE_FMTS.keys())
+
+    elems_check = check_cols(req_elem_cols, list(elems), err_subtitle = 'elems') 
+    nodes_check = check_cols(req_node_cols, list(nodes), err_subtitle = 'nodes') 
+    vars_check  = check_cols(var_cols, req_elem_cols, err_subtitle = 'var_cols')
+
+    if not all([elems_check, nodes_check, vars_check]):
+        print('Cannot create QUAD4M input file')
         return False
 
-    # Seismic coefficient lines (Lines 33 to 38) * NSLP times
-    for _ in range(Q['NSLP']):
-        print('The seismic coefficient line options have not been coded yet')
+    # Check that number of nodes and elements are within lims
+    if len(elems) > 99999:
+        print('Too many elements. Must be less than 99,999')
+        print('Cannot create QUAD4M input file')
+        return False
+
+    if len(nodes) > 99999:
+        print('Too many nodal points. Must be less than 99,999')
+        print('Cannot create QUAD4M input file')
         return False
 
-    L += [(6*'{:>5s}'+5*'{:>10s}'+'{:>5s}').format(*req_elem_cols)]      #C(L39)             
-    L += Ls_40                                                           #V(L40) 
+    # Element table: group adjacent columns into static or variable blocks
+    # (static blocks are formatted right away; variable ones are left for later)
+    elem_blocks = []
+    for col in req_elem_cols:
+        kind = 'var' if col in var_cols else 'static'
 
-    L += [('{:>5s}'+2*'{:>10s}'+2*'{:>5s}'+6*'{:>13s}'). \
-                                    format(*req_node_cols)]              #C(L41)
-    L += Ls_42                                                           #V(L42)
+        if (len(elem_blocks) == 0) or (elem_blocks[-1]['kind'] != kind):
+            elem_blocks += [{'kind': kind, 'cols': [], 'fmt': ''}]
 
-    # Print lines to a file and return 
-    # --------------------------------------------------------------------------
-    with open(out_path+out_file, 'w') as q4r_file:
-        [q4r_file.write(line + '\r\n') for line in L]
-        q4r_file.close()
+        elem_blocks[-1]['cols'] += [col]
 
-    return L
-    
+    for block in elem_blocks:
+        block['fmt'] = ','.join([Q4R_ELEM_FMTS[col] for col in block['cols']])
+        if block['kind'] == 'static':
+            block['lines'] = format_cols(elems, block['cols'], block['fmt'])
 
-def gen_dat(soil_curves, out_path, out_file):
+    # Node table (all static)
+    Ls_42 = format_cols(nodes, req_node_cols, ','.join(Q4R_NODE_FMTS.values()))
+
+    # Headers for the element and node tables
+    elem_header = (6*'{:>5s}'+5*'{:>10s}'+'{:>5s}').format(*req_elem_cols)
+    node_header = ('{:>5s}'+2*'{:>10s}'+2*'{:>5s}'+6*'{:>13s}'). \
+                                            format(*req_node_cols)
+
+    template = {'nelm'       : len(elems),
+                'var_cols'   : list(var_cols),
+                'elem_blocks': elem_blocks,
+                'elem_header': elem_header,
+                'node_block' : ''.join(L + '\r\n' for L in [node_header]+Ls_42)}
+
+    return template
+
+
+def gen_dat(soil_curves, out_path, out_file, registry = None):
     ''' generates QUAD4M soil data file (.dat) based on given soil curves.
     
     Purpose
@@ -234,6 +268,13 @@ def gen_dat(soil_curves, out_path, out_file):
     out_file : str
         name of text file to store outputs (generally ending in .dat)
 
+    registry : dict (optional)
+        Stage-level curve registry (see props_elems.add_darendeli_curves).
+        For soil curves that include the key 'S_key', the formatted lines of
+        the curves are taken from registry[S_key]['dat_lines'], or formatted
+        once and stored there if they don't exist yet. Defaults to None, so
+        that all curves are formatted each time.
+
     Returns
     -------
     L : list of str
@@ -241,8 +282,10 @@ def gen_dat(soil_curves, out_path, out_file):
         
     Notes
     -----
-    * The F70/F90 formatting may be slow because it was coded in a quick-fix
-      mindset... and when I was tired ¯|_(ツ)_|¯
+    * Curves are printed as 8F10.4 (always 4 decimals). Earlier versions
+      trimmed trailing zeros and used fewer decimals for larger numbers (ex.
+      damping of 12.3456 was printed as 12.346), so values >= 10 are now
+      printed with more precision than before.
 
     References
     ----------
@@ -281,10 +324,10 @@ def gen_dat(soil_curves, out_path, out_file):
     L = ['{:5d}'.format(NUMPROPS)]
 
     # Format specifications that will be used to create the file lines.
-    fmt01 = {'cols': 8, 'width': 10, 'space': 4}
+    fmt01 = '8F10.4'
     fmt02 = '{N:5d}  | {T:^18s} | {S:^8s} | {D:^20s} | '
     fmt03 = '{lbl}'
-    clim  = fmt01['cols'] * fmt01['width'] # max characters per line
+    clim  = 8 * 10 # max characters per line
 
     # Iterate through given soil_curves and add relevant lines
     for soil in soil_curves:
@@ -292,9 +335,16 @@ def gen_dat(soil_curves, out_path, out_file):
         S_name = soil['S_name']
         S_desc = soil['S_desc']
         G_strn = soil['G_strn']
-        G_mred = soil['G_mred']
         D_strn = soil['D_strn']
-        D_damp = soil['D_damp']
+
+        # Get formatted curves (from the registry, if they were cached there)
+        key = soil.get('S_key', None)
+        if (registry is not None) and (key in registry):
+            if 'dat_lines' not in registry[key]:
+                registry[key]['dat_lines'] = dat_curve_lines(soil, fmt01)
+            dat_lines = registry[key]['dat_lines']
+        else:
+            dat_lines = dat_curve_lines(soil, fmt01)
 
         # Add modulus reduction curve
         # ---------------------------------------------------------------------- 
@@ -304,8 +354,7 @@ def gen_dat(soil_curves, out_path, out_file):
                            D = S_desc)
 
         L += [fmt03.format(lbl = lbl) ]  # Header
-        L += [ fff.arr2str(G_strn, **fmt01) ]  # Shear strain
-        L += [ fff.arr2str(G_mred, **fmt01) ]  # G/Gmax
+        L += dat_lines[0:2]              # Shear strain and G/Gmax
 
         # Add damping curve
         # ----------------------------------------------------------------------
@@ -315,8 +364,7 @@ def gen_dat(soil_curves, out_path, out_file):
                            D = S_desc)
 
         L += [fmt03.format(lbl = lbl, W = clim) ]  # Header
-        L += [ fff.arr2str(D_strn, **fmt01) ]  # Shear strain
-        L += [ fff.arr2str(D_damp, **fmt01) ]  # Damping
+        L += dat_lines[2:4]                        # Shear strain and damping
 
 
     # Print lines to a file and return 
@@ -461,6 +509,202 @@ def check_cols(req_cols, exist_cols, err_subtitle = ''):
         return False
 
 
+def q4r_header_lines(Q):
+    ''' Helper function that creates the header lines of a .q4r file from Q
+
+    Purpose
+    -------
+    Formats lines L01 to L38 of the QUAD4M input file (everything before the
+    element table), which depend only on the settings dictionary Q.
+    
+    Parameters
+    ----------
+    Q : dict
+        dictionary with settings for QUAD4M analyses (see gen_q4r).
+
+    Returns
+    -------
+    L : list of str
+        List of strings with the header lines of the QUAD4M input file.
+        Returns FALSE if options that have not been coded yet are requested.
+    '''
+
+    # Damping settings and rock properties
+    N = [Q[s] for s in ['DRF','PRM','ROCKVP','ROCKVS','ROCKRHO']]
+    L_05 = format_line(N, 5*['{:10f}'])
+
+    # Number of elements, nodes, and seismic coefficient lines
+    N = [Q[s] for s in ['NELM','NDPT','NSLP']]
+    L_07 = format_line(N, 3*['{:5d}'])
+
+    # Computational switches
+    N = [Q[s] for s in ['KGMAX','KGEQ','N1EQ','N2EQ','N3EQ','NUMB','KV','KSAV']]
+    L_09 = format_line(N,  8*['{:5d}'])
+
+    # Earthquake file descriptors
+    N = [Q[s] for s in ['DTEQ','EQMUL1','EQMUL2','UGMAX1','UGMAX2','HDRX',
+                        'HDRY','NPLX','NPLY','PRINPUT']]
+    L_11 = format_line(N, 5*['{:10f}'] + 4*['{:5d}'] + 1*['{:10f}'])
+
+    # Output flags
+    N = [Q[s] for s in ['SOUT','AOUT','KOUT']]
+    L_18 = format_line(N, 3*['{:5d}'])
+
+    # Create list of file lines 
+    L = []
+    L += ['MODEL:' + Q['FTITLE'] + '  |  ' + Q['STITLE']]                #C(L01)
+    L += ['UNITS (E for English, S for SI): (A1)']                       #C(L02)
+    L += [Q['UNITS']]                                                    #V(L03)
+    L += ['       DRF       PRM    ROCKVP    ROCKVS   ROCKRHO (5F10.0)'] #C(L04)
+    L += [L_05]                                                          #V(L05) 
+    L += [' NELM NDPT NSLP (3I5)']                                       #C(L06) 
+    L += [L_07]                                                          #V(L07)
+    L += ['KGMAX KGEQ N1EQ N2EQ N3EQ NUMB   KV KSAV (8I5)']              #C(L08)
+    L += [L_09]                                                          #V(L09)
+    L += ['      DTEQ    EQMUL1    EQMUL2    UGMAX1    UGMAX2 ' +        #C(L10)
+              'HDRX HDRY NPLX NPLY   PRINPUT (5F10.0,4I5,F10.0)']
+    L += [L_11]                                                          #V(L11)
+    L += ['EARTHQUAKE INPUT FILE NAME(S) & FORMAT(S) (* for free)  (A)'] #C(L12)
+    L += [ Q['EARTHQH'] ]                                                #V(L13)
+    L += [ Q['EQINPFMT1'] ]                                              #V(L14)
+
+    if Q['KV'] == 2:
+        L += [ Q['EARTHQV'] ]                                            #V(L15)
+        L += [ Q['EQINPFMT2'] ]                                          #V(L16)
+
+    L+= [' SOUT AOUT KOUT (3I5)']                                        #C(L17)
+    L+= [L_18]                                                           #V(L18) 
+
+    if Q['SOUT'] == 1:
+        L+= ['STRESS OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)']        #C(L19)
+        L+= [ Q['SHISTFMT']  ]                                           #V(L20)
+        L+= [ Q['SFILEOUT'] ]                                            #V(L21)
+        L+= [ Q['SSUFFIX']   ]                                           #V(L22)
+
+    if Q['AOUT'] == 1:
+        L+= ['ACCELERATION OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)']  #C(L23)
+        L+= [ Q['AHISTFMT']  ]                                           #V(L24)
+        L+= [ Q['AFILEOUT']  ]                                           #V(L25)
+        L+= [ Q['ASUFFIX']   ]                                           #V(L26)
+
+    if Q['KOUT'] == 1:
+        L+= ['SEISMIC COEFF OUTPUT FORMAT, FILE PREFIX AND SUFFIX: (A)'] #C(L27)
+        L+= [ Q['KHISTFMT']  ]                                           #V(L28)
+        L+= [ Q['KFILEOUT'] ]                                            #V(L29)
+        L+= [ Q['KSUFFIX']   ]                                           #V(L30)
+
+    # TODO-soon:
+    #   Putting these here so I am aware of the work that still needs to be done
+    #   Don't think I'll be using the KSAV option ¯|_(ツ)_|¯
+
+    # Restart file name descriptors (Lines 31 to 32)
+    if Q['KSAV'] == 1:
+        print('The KSAV functionality has not been coded yet. Turn to 0')
+        return False
+
+    # Seismic coefficient lines (Lines 33 to 38) * NSLP times
+    for _ in range(Q['NSLP']):
+        print('The seismic coefficient line options have not been coded yet')
+        return False
+
+    return L
+
+
+def fill_elem_lines(template, elems):
+    ''' Helper function to fill element lines of a .q4r template with elems
+
+    Purpose
+    -------
+    Formats the variable columns of the element table (see gen_q4r_template)
+    from "elems", and joins them with the pre-formatted static columns.
+    
+    Parameters
+    ----------
+    template : dict
+        precompiled static parts of the file, created by gen_q4r_template.
+
+    elems : pandas DataFrame
+        DataFrame with information for elements. Must include the columns in
+        template['var_cols'], in the same row order as the template.
+
+    Returns
+    -------
+    lines : list of str
+        element table lines (L40 of the QUAD4M input file)
+    '''
+
+    blocks = []
+    for block in template['elem_blocks']:
+        if block['kind'] == 'static':
+            blocks += [block['lines']]
+        else:
+            blocks += [format_cols(elems, block['cols'], block['fmt'])]
+
+    # Only one block means there is nothing to join
+    if len(blocks) == 1:
+        return blocks[0]
+
+    lines = [''.join(parts) for parts in zip(*blocks)]
+
+    return lines
+
+
+def format_cols(df, cols, fmt):
+    ''' Helper function to format columns (cols) of a dataframe line by line
+
+    Purpose
+    -------
+    Formats the columns "cols" of "df" into one string per row, according to
+    the Fortran edit descriptor "fmt" (one field per column). All rows are
+    formatted at once by formatters.fortran_lines.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame
+        dataframe containing the columns to be formatted
+    cols : list of str
+        columns to be formatted, in order
+    fmt : str
+        Fortran edit descriptor for one row (ex. 'I5,F10.4')
+
+    Returns
+    -------
+    lines : list of str
+        One string per row of df, with cols formatted according to fmt
+    '''
+
+    lines = fff.fortran_lines(df[cols].values.astype(float), fmt)
+
+    return lines
+
+
+def dat_curve_lines(soil, fmt):
+    ''' Helper function that formats the curves of one soil for gen_dat
+
+    Purpose
+    -------
+    Formats the arrays of a soil curve dictionary (see gen_dat) into the
+    strings that are printed in the QUAD4M soil data file. 
+    
+    Parameters
+    ----------
+    soil : dict
+        soil curve, with at least keys: ['G_strn','G_mred','D_strn','D_damp']
+    fmt : str
+        Fortran edit descriptor for the lines (see formatters.fortran_format)
+
+    Returns
+    -------
+    lines : list of str
+        formatted [G_strn, G_mred, D_strn, D_damp] (in that order).
+    '''
+
+    keys  = ['G_strn', 'G_mred', 'D_strn', 'D_damp']
+    lines = [fff.fortran_format(soil[k], fmt) for k in keys]
+
+    return lines
+
+
 def format_line(nums, fmts):
     ''' Helper function to format list numbers (nums) in list of formats (fmts)
 
@@ -1,33 +1,165 @@
-''' one_line_description
+''' Plots to check QUAD4M meshes and element properties
 
 DESCRIPTION:
-Insert a paragraph-long description of the module here.
+These functions plot QUAD4M meshes, with elements colored by their properties,
+either one figure at a time (plot_mesh_elem_prop) or for many realizations of
+the same mesh at once (render_mesh_props), which is used for QA plots of whole
+stages of analyses.
 
 FUNCTIONS:
 This module contains the following (main) functions:
-    * fun_name : one_line_description
-                 (only add user-facing ones)
+    * render_mesh_props : saves mesh property figures for many realizations
+    * plot_mesh_elem_prop : plots mesh with colors mapped to an element prop
 
 '''
 import numpy as np
-import matplotlib as mpl
-import matplotlib.colors
-import matplotlib.collections
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Matplotlib is imported inside the plotting functions, so that importing this
+# module (ex. for get_verts) is cheap and doesn't need a plotting backend
 
 
 # ------------------------------------------------------------------------------
 # Main Functions
 # ------------------------------------------------------------------------------
+def render_mesh_props(elems, nodes, vals, prop, fig_path, fig_names,
+                      units = None, clim = None, figsize = (6.5, 3),
+                      mesh_kwargs = {}, cb_kwargs = {}, save_kwargs = {},
+                      nworkers = None, chunk = 100, verts = None):
+    ''' Saves figures of a mesh colored by many realizations of an element prop
+        
+    Purpose
+    -------
+    QA plots of a stage show the same mesh for every realization, and only the
+    element values change. Instead of creating each figure from scratch, the
+    realizations are split in chunks that are rendered on a process pool (with
+    the Agg backend, no pyplot). For each chunk, the figure, PolyCollection and
+    colorbar are built once with plot_mesh_elem_prop, and then for each
+    realization only the values are updated (set_array) and the figure is saved
+    with llgeo.plotting.mpl.save_figure.
+        
+    Parameters
+    ----------
+    elems, nodes : dataframe
+        Mesh information (see get_verts)
+
+    vals : numpy array
+        Array of size (nreal, nelem), where vals[k] contains the values of the
+        property for realization k (in the same order as elems).
+
+    prop : str
+        Name of the property (for the colorbar label)
+
+    fig_path : str
+        Directory where figures are saved
+
+    fig_names : list of str
+        Name of the figure for each realization (without extension)
+
+    units : str (optional)
+        Units of the property (for the colorbar label). Defaults to None.
+
+    clim : list of floats (optional)
+        Limits of the colormap [vmin, vmax], which are the same for all
+        realizations. Defaults to None, so that the min and max of vals is used.
+
+    figsize : tuple (optional)
+        Size of the figures in inches. Defaults to (6.5, 3).
+
+    mesh_kwargs, cb_kwargs : dict (optional)
+        Keyword arguments for the PolyCollection and colorbar (see
+        plot_mesh_elem_prop). Discrete colors are not supported.
+
+    save_kwargs : dict (optional)
+        Keyword arguments for save_figure (ex. png_opt, save_pdf). By default,
+        only PNGs are saved.
+
+    nworkers : int (optional)
+        Number of processes to use. Defaults to None, so that all cores are
+        used. If nworkers = 1, everything is run in this process.
+
+    chunk : int (optional)
+        Number of realizations per chunk (per figure that is built).
+        Defaults to 100.
+
+    verts : numpy array (optional)
+        Vertices of the mesh from get_verts, to reuse them across properties
+        of the same mesh. Defaults to None, so that they are built once here
+        (and shared by all chunks).
+
+    Returns
+    -------
+        Nada.
+    '''
+
+    vals = np.atleast_2d(np.asarray(vals, dtype = float))
+
+    if vals.shape != (len(fig_names), len(elems)):
+        mssg = 'Error in rendering mesh figures of ' + prop + '\n'
+        mssg+= 'vals must be of size (len(fig_names), len(elems))'
+        raise Exception(mssg)
+
+    if clim is None:
+        clim = [np.nanmin(vals), np.nanmax(vals)]
+
+    # Vertices are built once for the mesh, and only they (and the values of
+    # each chunk) are sent to the workers
+    if verts is None:
+        verts, _ = get_verts(elems, nodes)
+
+    mesh = (verts, nodes[['x', 'y']])
+    opts = {'src_name' : 'llgeo.quad4m.plots_checks', 'save_pdf' : False}
+    opts.update(save_kwargs)
+
+    args = [(mesh, vals[i : i + chunk], prop, fig_path, fig_names[i : i + chunk],
+             units, clim, figsize, mesh_kwargs, cb_kwargs, opts)
+            for i in range(0, len(fig_names), chunk)]
+
+    if nworkers == 1:
+        list(map(render_chunk, args))
+    else:
+        with ProcessPoolExecutor(max_workers = nworkers) as pool:
+            list(pool.map(render_chunk, args))
+
 
 
 # ------------------------------------------------------------------------------
 # Helper Functions
 # ------------------------------------------------------------------------------
+def render_chunk(args):
+    ''' Renders and saves figures for one chunk of realizations (runs in the
+        worker processes), building the figure only once '''
+
+    (verts, nodes), vals, prop, fig_path, fig_names, units, clim, figsize, \
+        mesh_kwargs, cb_kwargs, save_kwargs = args
+
+    # Agg canvas directly (no pyplot), so this doesn't depend on the backend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import llgeo.plotting.mpl as llgeo_mpl
+
+    fig = Figure(figsize = figsize)
+    FigureCanvasAgg(fig)
+    ax  = fig.add_subplot()
+
+    kwargs = {'clim' : clim}
+    kwargs.update(mesh_kwargs)
+    plot_mesh_elem_prop(pd.DataFrame({prop : vals[0]}), nodes, prop, fig, ax,
+                        units, mesh_kwargs = kwargs, cb_kwargs = cb_kwargs,
+                        verts = verts)
+    pc = ax.collections[0]
+
+    # Only values change from one realization to the next
+    for v, fig_name in zip(vals, fig_names):
+        pc.set_array(v)
+        llgeo_mpl.save_figure(fig, fig_path, fig_name, **save_kwargs)
+
+
 def plot_mesh(verts, verts_elems, ax, mesh_kwargs = {}):
 
+    import matplotlib.collections
+
     # Get default kwargs and update with provided mesh_kwargs
     kwargs = {}
     if 'edgecolor' not in mesh_kwargs:
@@ -37,7 +169,7 @@ def plot_mesh(verts, verts_elems, ax, mesh_kwargs = {}):
     kwargs.update(mesh_kwargs)
 
     # Plot mesh
-    pc = mpl.collections.PolyCollection(verts, **kwargs)
+    pc = matplotlib.collections.PolyCollection(verts, **kwargs)
     ax.add_collection(pc)
     ax.axis('equal')
 
@@ -55,7 +187,8 @@ def plot_mesh_node_prop(elems, nodes, prop, units, fig, ax,
 
 
 def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
-                        colors = False, mesh_kwargs = {}, cb_kwargs = {}):
+                        colors = False, mesh_kwargs = {}, cb_kwargs = {},
+                        verts = None):
     ''' Plots filled mesh with colots mapped to values of prop
         
     Purpose
@@ -65,15 +198,11 @@ def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
         
     Parameters
     ----------
-    verts : list of list of touples 
-        (see get_verts)
-        List, where each element is a list of four touples (x, y) that defines
-        the coordinates of an element in CCW order.
+    elems : dataframe
+        Information on elements (see get_verts). Must include prop.
         
-    verts_elems : list of df series
-        (see get_verts)
-        Each element contains rows from elems dataframe, in the same order as 
-        verts.
+    nodes : dataframe
+        Contains node information (see get_verts).
 
     prop : string
         Propery to be used for contour colors. Must be in verts_elems
@@ -83,6 +212,11 @@ def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
 
     kwargs : dict
         key word argumentsfor polycollection (colormap, edgecolor, etc.)
+
+    verts : numpy array (optional)
+        Vertices of the mesh from get_verts (in the same order as elems), to
+        reuse them when plotting many properties of the same mesh. Defaults to
+        None, so that they are built from elems and nodes.
         
     Returns
     -------
@@ -91,29 +225,40 @@ def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
                 
     '''
 
-    # Get vertices and elements in proper format
-    verts, verts_elems = get_verts(elems, nodes)
+    import matplotlib.colors
+    import matplotlib.ticker as ticker
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+    # Get vertices and elements in proper format (copy kwargs, which are
+    # updated below, so that the default dict isn't modified between calls)
+    if verts is None:
+        verts, verts_elems = get_verts(elems, nodes)
+    else:
+        verts_elems = elems
+
+    if len(verts) != len(verts_elems):
+        msg = 'Error in plotting mesh of '+ prop + '\n'
+        msg+= 'verts must have one row per element in elems'
+        raise Exception(msg)
+
+    mesh_kwargs = dict(mesh_kwargs)
 
     # Make sure that the property exists in elems
-    if prop not in verts_elems[0].index.to_list():
+    if prop not in verts_elems.columns:
         msg = 'Error in plotting mesh of '+ prop + '\n'
         msg+= 'the property does not exist in elems dataframe'    
         raise Exception(msg)
 
     # Get values from "verts_elems"
-    vals = np.array([float(elem[prop]) for elem in verts_elems])
+    vals = verts_elems[prop].values.astype(float)
 
     # Outline color schemes (either discrete or continuous color maps)
     if colors:
-        # Make sure colors are in RBG
-        colors = [matplotlib.colors.to_rgba(c) for c in colors]
-        unique_vals = np.sort(np.unique(vals))
-        facecolors = []
-
-        for v in vals:
-            i = np.where(v == unique_vals)[0][0]
-            idx = int(i % len(colors))
-            facecolors += [colors[idx]]
+        # Make sure colors are in RBG, and cycle through them for each unique
+        # value (in sorted order)
+        colors = np.array([matplotlib.colors.to_rgba(c) for c in colors])
+        _, i = np.unique(vals, return_inverse = True)
+        facecolors = colors[i % len(colors)]
 
         mesh_kwargs.update({'facecolors' : facecolors})
     
@@ -133,7 +278,7 @@ def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
         del kwargs['visible']
         divider = make_axes_locatable(ax)
         cax = divider.append_axes('bottom', size = '5%', pad = '2%')
-        cb  = plt.colorbar(pc, cax = cax, **kwargs)
+        cb  = fig.colorbar(pc, cax = cax, **kwargs)
                 
         # Colorbar plotting options
         if 'ticks' not in kwargs.keys():
@@ -159,14 +304,16 @@ def plot_mesh_elem_prop(elems, nodes, prop, fig, ax, units = None,
 
 
 def get_verts(elems, nodes):
-    ''' Returns list with element vertices coordinates, and list of elems.
+    ''' Returns array with element vertices coordinates, and elems dataframe.
         
     Purpose
     -------
-    This function creates a list "verts", where each element is a list of four
-    touples that defines the corners of the element. It also returns a list 
-    "verts_elems" where each row is an row of the elems dataframe, corresponding
-    to the "verts" order. 
+    This function creates an array "verts" of size (nelem, 4, 2), where
+    verts[i] contains the (x, y) coordinates of the four corners of element i
+    (in the order N1, N2, N3, N4). Vertices are looked up from the node numbers
+    with a single fancy-index. It also returns "verts_elems", which is the 
+    elems dataframe in the same order as "verts". (To plot many properties of
+    the same mesh, get verts once and reuse them).
         
     Parameters
     ----------
@@ -180,33 +327,29 @@ def get_verts(elems, nodes):
         
     Returns
     -------
-    verts : list of list of touples 
-        List, where each element is a list of four touples (x, y) that defines
-        the coordinates of an element in CCW order.
+    verts : numpy array
+        Array of size (nelem, 4, 2), with the (x, y) coordinates of the corners
+        of each element in CCW order.
         
-    verts_elems : list of df series
-        Each element contains rows from elems dataframe, in the same order as 
-        verts.
+    verts_elems : dataframe
+        elems dataframe, in the same order as verts.
         
     '''
 
-    # Make nodes be index-eable by "node_n" just in case
-    nodes_idx = nodes.set_index('node_n')
-
-    # Create list of element vertices and element rows
-    verts = []
-    verts_elems = []
-
-    for _, elem in elems.iterrows():
+    # Node numbers of the corners of each element, and node coordinates
+    corners = elems[['N1', 'N2', 'N3', 'N4']].values.astype(int)
+    node_n  = nodes['node_n'].values.astype(int)
+    node_xy = nodes[['x', 'y']].values.astype(float)
 
-        elem_vert = []
-        for nx in ['N1', 'N2', 'N3', 'N4']:
-            n = int(elem[nx])
-            elem_vert += [(nodes_idx.loc[n, 'x'], nodes_idx.loc[n, 'y'])]
+    # Position of each corner in nodes (nodes can be in any order)
+    inode = pd.Index(node_n).get_indexer(corners.ravel())
 
-        verts += [elem_vert]
-        verts_elems += [elem]
+    if np.any(inode < 0):
+        missing = np.unique(corners.ravel()[inode < 0])
+        mssg = 'Error in getting mesh vertices \n'
+        mssg+= 'elems refer to nodes that do not exist: ' + str(missing[:10])
+        raise Exception(mssg)
 
-    return(verts, verts_elems)
+    verts = node_xy[inode].reshape(-1, 4, 2)
 
-    
\ No newline at end of file
+    return verts, elems
@@ -7,8 +7,11 @@ exported to a ".q4r" file.
 '''
 
 import llgeo.props_nonlinear.darendeli_2011 as q4m_daran
+import llgeo.rand_fields.FFT as llgeo_fft
 import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
+import scipy.spatial as spatial
 
 # ------------------------------------------------------------------------------
 # Main Functions
@@ -108,7 +111,7 @@ def elem_stresses(nodes, elems, k = 0.5, unit_w = 21000):
 
 
 def add_vs_pfit(nodes, elems, pfits, rf = None, rf_type = 'ratio', 
-                unit_fix = True, unit_w = 21000):
+                unit_fix = True, unit_w = 21000, cond = None):
   ''' Adds shear-wave velocity based on power-fits and possible random field.
       
   Purpose
@@ -160,6 +163,12 @@ def add_vs_pfit(nodes, elems, pfits, rf = None, rf_type = 'ratio',
       If elems does not already have a 'unit_w' column, then a single value
       "unit_w" will be used for all the elements. Defaults to 21,000 N/m3.
 
+  cond : dict (optional)
+      If provided, the random field is conditioned to measured residuals at
+      soundings (see condition_rf), which must be of the same rf_type as rf.
+      Must have keys: 'obs_n', 'obs_vals', 'weights' (see condition_rf).
+      Defaults to None, so that the random field is unconditional.
+
   Returns
   -------
   elems : dataframe
@@ -183,6 +192,9 @@ def add_vs_pfit(nodes, elems, pfits, rf = None, rf_type = 'ratio',
     elems = map_rf(elems, 'rf', rf)
     elems['vs_mean'] = np.empty(len(elems))
 
+    if cond is not None:
+      elems = condition_rf(elems, 'rf', **cond)
+
   # Initalize new columns in dataframe
   elems['vs'] = np.empty(len(elems)) 
   elems['Gmax'] = np.empty(len(elems))
@@ -486,7 +498,8 @@ def add_watertable(j, elems, unitw_water = 9807):
 
 
 def add_darendeli_curves(elems, dec = 0, min_sigma = False, min_Gred = False,
-                         nearest_sigma = False, max_damp = False):
+                         nearest_sigma = False, max_damp = False,
+                         registry = None):
     ''' Generate Darendeli soil reduction curves and soil numbers.
         
     Purpose
@@ -519,6 +532,14 @@ def add_darendeli_curves(elems, dec = 0, min_sigma = False, min_Gred = False,
     max_damp : float
         Maximum damping to consider in % (0 to 100)
         Consider using 20%
+
+    registry : dict (optional)
+        Stage-level registry of curves that have already been computed, keyed
+        by the rounded (PI, OCR, sigma_m) and the caps min_Gred and max_damp.
+        Curves missing from the registry are computed and added to it (so the
+        dict is modified in place); all others are reused. Pass the same dict
+        for all models in a stage, and to gen_dat so that the formatted .dat
+        blocks are cached too. Defaults to None (no caching).
         
     Returns
     -------
@@ -530,6 +551,11 @@ def add_darendeli_curves(elems, dec = 0, min_sigma = False, min_Gred = False,
         Returns input dataframe except with added column: 's_num', which corr-
         esponds to the element number (+1) of the corresponding curve in curves. 
 
+    Notes
+    -----
+    * If a registry is given, each curve also includes the key 'S_key' with its
+      registry key. The registry can be saved with llgeo.utilities.files.save_pkl
+      and re-used by later stages.
     '''
     
     if not set(['PI', 'OCR', 'sigma_m']).issubset(list(elems)):
@@ -551,47 +577,35 @@ def add_darendeli_curves(elems, dec = 0, min_sigma = False, min_Gred = False,
       mask = (data[:, -1] <= min_sigma)
       data[mask, -1] = min_sigma
  
-    # Get "unique" set of data
-    uniq_data = np.unique(data, axis = 0)
-    elems['s_num'] = np.empty(len(elems))
+    # Get "unique" set of data, and assign soil numbers (must be 1-indexed)
+    uniq_data, inverse = np.unique(data, axis = 0, return_inverse = True)
+    elems['s_num'] = inverse.reshape(-1) + 1 # 1-indexed
+
+    # If no registry was given, use a throw-away one for this model only
+    if registry is None:
+      registry = {}
+      keep_keys = False
+    else:
+      keep_keys = True
+
+    # Only compute curves that have not been computed before (all at once)
+    keys = [tuple(row) + (min_Gred, max_damp) for row in uniq_data.tolist()]
+    new_idx = [i for i, key in enumerate(keys) if key not in registry]
+
+    if len(new_idx) > 0:
+      new_curves = darendeli_curves(uniq_data[new_idx], min_Gred, max_damp)
+      registry.update({keys[i]: c for i, c in zip(new_idx, new_curves)})
 
-    # Iterate through unique combination of properties to get the curves
+    # Arrange in dictionaries for output
     curves = []
-    for i  in range(len(uniq_data)):
-
-        # Assign soil number to the elements dataframe (must be 1-indexed)
-        mask = np.where((data == uniq_data[i, :]).all(axis = 1))[0]
-        elems.loc[mask, 's_num'] = i + 1 # 1-indexed
-
-        # Inputs for Darendeli curves
-        sstrn = np.outer(np.logspace(-4, 0, 5), np.arange(1,10,1)).flatten()
-        daran_inputs = {'sstrn' : sstrn,
-                        'PI'    : uniq_data[i, 0],
-                        'OCR'   : uniq_data[i, 1],
-                        'sigp_o': uniq_data[i, 2] / 101325}
-
-        # Generate description of curve
-        description = 'PI={:2.0f} OCR={:2.0f} S={:4.5f}atm'.\
-                   format(*[daran_inputs[l] for l in ['PI', 'OCR', 'sigp_o']])
-
-        # Get darandeli curves
-        Gred, D_adjs = q4m_daran.curves(**daran_inputs)
-
-        # Add minimum cap on mod reduction if one was provided
-        if min_Gred:
-          Gred[Gred < min_Gred] = min_Gred
-
-        # Add maximum cap on damping if one was provided
-        if max_damp:
-          D_adjs[D_adjs > max_damp] = max_damp
-
-        # Arrange in dictionary for output
-        curves += [{'S_name': str(i + 1),
-                    'S_desc': description,
-                    'G_strn': daran_inputs['sstrn'],
-                    'G_mred': Gred,
-                    'D_strn': daran_inputs['sstrn'],
-                    'D_damp': D_adjs}]
+    for i, key in enumerate(keys):
+        curve = {'S_name': str(i + 1)}
+        curve.update({k: registry[key][k] for k in ['S_desc', 'G_strn',
+                                                 'G_mred', 'D_strn', 'D_damp']})
+        if keep_keys:
+          curve['S_key'] = key
+
+        curves += [curve]
 
     return uniq_data, curves, elems
 
@@ -600,6 +614,46 @@ def add_darendeli_curves(elems, dec = 0, min_sigma = False, min_Gred = False,
 # Helper Functions
 # ------------------------------------------------------------------------------
 
+def darendeli_curves(uniq_data, min_Gred = False, max_damp = False):
+    ''' Helper function that gets Darendeli curves for add_darendeli_curves.
+        Each row of uniq_data is one soil state (PI, OCR, sigma_m), where 
+        sigma_m is given in pascals and transformed to atm. All curves are
+        evaluated at once. Returns list of dict (one per row) with keys:
+        ['S_desc', 'G_strn', 'G_mred', 'D_strn', 'D_damp'].
+    '''
+
+    # Inputs for Darendeli curves
+    sstrn = np.outer(np.logspace(-4, 0, 5), np.arange(1,10,1)).flatten()
+    daran_inputs = {'sstrn' : sstrn,
+                    'PI'    : uniq_data[:, 0],
+                    'OCR'   : uniq_data[:, 1],
+                    'sigp_o': uniq_data[:, 2] / 101325}
+
+    # Get darandeli curves (one row per soil state)
+    Gred, D_adjs = q4m_daran.curves(**daran_inputs)
+
+    # Add minimum cap on mod reduction if one was provided
+    if min_Gred:
+      Gred[Gred < min_Gred] = min_Gred
+
+    # Add maximum cap on damping if one was provided
+    if max_damp:
+      D_adjs[D_adjs > max_damp] = max_damp
+
+    # Generate description of curves and arrange in dictionaries
+    fmt = 'PI={:2.0f} OCR={:2.0f} S={:4.5f}atm'
+    curves = []
+    for i, state in enumerate(zip(*[daran_inputs[l].tolist() 
+                                    for l in ['PI', 'OCR', 'sigp_o']])):
+      curves += [{'S_desc': fmt.format(*state),
+                  'G_strn': sstrn,
+                  'G_mred': Gred[i],
+                  'D_strn': sstrn,
+                  'D_damp': D_adjs[i]}]
+
+    return curves
+
+
 def get_mask(locations, elems):
   ''' Determines elements mask of where locations is met
       
@@ -688,13 +742,19 @@ def get_mask(locations, elems):
   return(all_locations_mask)
 
 
-def map_rf(elems, prop, z):
+def map_rf(elems, prop, z, weights = None):
   ''' Maps a random field array (generated by simLAS) to elems dataframe.
     
     Purpose
     -------
     Given a table of elems, this function adds a column called "props" and maps
     the values in the array "z" to the appropriate elements.
+
+    By default, element (i, j) simply takes the value z(i, j). If "weights" are
+    given (see get_rf_weights), each element instead takes the interpolated
+    value "weights @ z", which allows mapping from a (finer) random field grid
+    onto non-equispaced meshes. The weights only depend on the geometry, so
+    they should be computed once and reused for all realizations.
     
     Parameters
     ----------
@@ -714,6 +774,10 @@ def map_rf(elems, prop, z):
           Z(2,1) is the next cell in the X direction (to right).
           Z(1,2) is the next cell in the Y direction (upwards).
 
+    weights : scipy sparse matrix (optional)
+        interpolation weights of size (num. elems x n1*n2) from get_rf_weights.
+        Defaults to None, so that z is mapped directly using elems i and j.
+
     Returns
     -------
     elems : pandas DataFrame
@@ -726,33 +790,288 @@ def map_rf(elems, prop, z):
       the indexing in the z array. That is:
         i starts left and moves rightwards
         j starts down and move upwards
-    * Note that Z is assumed to be equispaced, which might not be true of the
-      elements. Up to you to check.
-    *   
+    * If no weights are given, Z is assumed to be equispaced, which might not
+      be true of the elements. Up to you to check.
     '''
   
   # Do some basic error checking
-  err_check = map_rf_check_inputs(elems, prop, z)
+  err_check = map_rf_check_inputs(elems, prop, z, weights)
 
   if len(err_check) > 0:
     raise Exception('\n'.join(err_check))
 
-  # Mapping
-  mapped_z = [z[i-1, j-1] for i, j in zip(elems['i'], elems['j'])] 
-  elems[prop] = mapped_z
+  # Mapping (direct indexing, or interpolation if weights were given)
+  if weights is None:
+    elems[prop] = z[elems['i'].values - 1, elems['j'].values - 1]
+  else:
+    elems[prop] = weights @ np.reshape(z, -1)
 
   return elems
 
 
-def map_rf_check_inputs(elems, prop, z):
+def get_rf_weights(elems, xl, yl, n1, n2, method = 'bilinear', x0 = 0, y0 = 0):
+  ''' Gets weights to interpolate a random field grid onto element centroids.
+
+    Purpose
+    -------
+    Creates a sparse matrix W such that W @ z.reshape(-1) are the values of the
+    random field z (of size n1 x n2, see map_rf) at the elements in elems. This
+    way, mapping a realization onto the mesh is a single sparse mat-vec, and W
+    can be reused across all realizations with the same geometry.
+
+    Parameters
+    ----------
+    elems : pandas DataFrame
+        Contains information for elements, usually created by 'geometry.py'
+        At a *minumum*, must have columns: [xc, yc] (and [w, h] for 'average')
+
+    xl, yl : float
+        physical dimensions of the random field (same as in LAS.sim2d)
+
+    n1, n2 : int
+        number of cells in the random field in the x and y directions
+
+    method : str (optional)
+        'bilinear' : bilinear interpolation between the 4 random field cells
+                     (cell centers) that surround each element centroid.
+        'average'  : average of random field cells whose centers fall within
+                     each element (elems w x h). If none do, the closest cell.
+        Defaults to 'bilinear'
+
+    x0, y0 : float (optional)
+        coordinates of the lower left corner of the random field in the mesh
+        coordinate system. Defaults to (0, 0)
+
+    Returns
+    -------
+    weights : scipy sparse matrix (csr)
+        interpolation weights of size (num. elems x n1*n2)
+
+    Notes
+    -----
+    * Elements outside of the random field take the values at its edges.
+    '''
+
+  nelem = len(elems)
+  dx = xl / n1
+  dy = yl / n2
+
+  # Element centroids in "cell-index" units (cell k has its center at k)
+  u = (elems['xc'].values - x0) / dx - 0.5
+  v = (elems['yc'].values - y0) / dy - 0.5
+
+  if method == 'bilinear':
+
+    # Lower left cell of the 4 surrounding cells, and fractional distances
+    u = np.clip(u, 0, n1 - 1)
+    v = np.clip(v, 0, n2 - 1)
+    i0 = np.clip(np.floor(u).astype(int), 0, max(n1 - 2, 0))
+    j0 = np.clip(np.floor(v).astype(int), 0, max(n2 - 2, 0))
+    fu = u - i0
+    fv = v - j0
+
+    i1 = np.minimum(i0 + 1, n1 - 1)
+    j1 = np.minimum(j0 + 1, n2 - 1)
+
+    rows = np.tile(np.arange(nelem), 4)
+    ii   = np.concatenate([i0, i1, i0, i1])
+    jj   = np.concatenate([j0, j0, j1, j1])
+    vals = np.concatenate([(1 - fu) * (1 - fv), fu * (1 - fv),
+                           (1 - fu) * fv,       fu * fv])
+
+  elif method == 'average':
+
+    # Range of cells (centers) that fall within each element
+    hw = 0.5 * elems['w'].values / dx
+    hh = 0.5 * elems['h'].values / dy
+    i_lo = np.clip(np.ceil(u - hw),  0, n1 - 1).astype(int)
+    i_hi = np.clip(np.floor(u + hw), 0, n1 - 1).astype(int)
+    j_lo = np.clip(np.ceil(v - hh),  0, n2 - 1).astype(int)
+    j_hi = np.clip(np.floor(v + hh), 0, n2 - 1).astype(int)
+
+    # If no cell centers fall within the element, use the closest one
+    i_near = np.clip(np.round(u), 0, n1 - 1).astype(int)
+    j_near = np.clip(np.round(v), 0, n2 - 1).astype(int)
+    empty = (i_hi < i_lo) | (j_hi < j_lo)
+    i_lo[empty] = i_near[empty]; i_hi[empty] = i_near[empty]
+    j_lo[empty] = j_near[empty]; j_hi[empty] = j_near[empty]
+
+    # Expand each element into its list of cells
+    ni = i_hi - i_lo + 1
+    nj = j_hi - j_lo + 1
+    nc = ni * nj
+
+    rows = np.repeat(np.arange(nelem), nc)
+    offs = np.arange(np.sum(nc)) - np.repeat(np.cumsum(nc) - nc, nc)
+    ii   = np.repeat(i_lo, nc) + offs // np.repeat(nj, nc)
+    jj   = np.repeat(j_lo, nc) + offs %  np.repeat(nj, nc)
+    vals = 1 / np.repeat(nc, nc)
+
+  else:
+    raise Exception('method not recognized: ' + str(method))
+
+  # Duplicate entries (ex. elements on the edges) are summed up by scipy
+  weights = sparse.csr_matrix((vals, (rows, ii * n2 + jj)),
+                              shape = (nelem, n1 * n2))
+
+  return weights
+
+
+def get_krig_weights(elems, obs_n, fnc, thx, thy, nugget = 0):
+  ''' Gets simple kriging weights from sounding elements to all elements.
+
+    Purpose
+    -------
+    Computes the matrix of simple kriging weights W = C_eo * inv(C_oo), where
+    C_oo is the correlation between the elements with measurements (obs_n) and
+    C_eo is the correlation between all elements and those. W only depends on
+    the mesh, the sounding layout, and the correlation model, so it should be
+    computed once and reused for all realizations (see condition_rf).
+
+    Parameters
+    ----------
+    elems : pandas DataFrame
+        Contains information for elements, usually created by 'geometry.py'
+        At a *minumum*, must have columns: [n, xc, yc]
+
+    obs_n : list or array of int
+        element numbers (elems['n']) with measurements (see obs_to_elems)
+
+    fnc : str
+        correlation function of the random field ('dlavx2' or 'dlspx2'), same
+        as given to LAS.sim2d or FFT.sim2d
+
+    thx, thy : float
+        scales of fluctuation of the random field in the x and y directions
+
+    nugget : float (optional)
+        measurement error variance, as a fraction of the field variance.
+        Defaults to 0, so that measurements are honored exactly.
+
+    Returns
+    -------
+    weights : numpy array
+        kriging weights of size (num. elems x num. obs)
+
+    Notes
+    -----
+    * Correlations are between element centroids (points), which is a good
+      approximation for cell averages when elements are small compared to thx
+      and thy.
+    '''
+
+  # Coordinates of all elements and of those with measurements
+  xe = elems['xc'].values
+  ye = elems['yc'].values
+  idx = obs_index(elems, obs_n)
+  xo = xe[idx]
+  yo = ye[idx]
+
+  # Correlation matrices and kriging weights (solve instead of inverting)
+  C_oo = llgeo_fft.correlation(fnc, [xo[:, None] - xo, yo[:, None] - yo],
+                               [thx, thy])
+  C_oo = C_oo + nugget * np.eye(len(xo))
+  C_eo = llgeo_fft.correlation(fnc, [xe[:, None] - xo, ye[:, None] - yo],
+                               [thx, thy])
+
+  weights = np.linalg.solve(C_oo, C_eo.T).T
+
+  return weights
+
+
+def obs_to_elems(elems, xs, ys, vals):
+  ''' Assigns measurements at points (xs, ys) to the elements with the closest
+      centroids, and averages all measurements within each element.
+      Returns element numbers with measurements (obs_n) and their values.'''
+
+  # Closest element centroid to each measurement
+  tree = spatial.cKDTree(np.c_[elems['xc'].values, elems['yc'].values])
+  _, k = tree.query(np.c_[xs, ys])
+
+  # Average of measurements in each element
+  uniq, inv = np.unique(k, return_inverse = True)
+  obs_vals = np.bincount(inv, weights = vals) / np.bincount(inv)
+  obs_n = elems['n'].values[uniq]
+
+  return obs_n, obs_vals
+
+
+def condition_rf(elems, prop, obs_n, obs_vals, weights):
+  ''' Conditions a (mapped) random field to measured values at soundings.
+
+    Purpose
+    -------
+    Given an unconditional realization Zu (already mapped to elems[prop]), this
+    computes the conditional realization:
+
+        Zc = Zk(obs) + (Zu - Zk(Zu at obs)) = Zu + W @ (obs - Zu at obs)
+
+    where Zk is the simple kriging estimate from the values at the sounding
+    elements. So, Zc honors the measurements and has reduced variance near the
+    soundings. Each realization only costs one mat-vec with weights.
+
+    Parameters
+    ----------
+    elems : pandas DataFrame
+        Contains information for elements, with (at least) columns [n, prop]
+
+    prop : str
+        name of the column with the unconditional random field
+
+    obs_n : list or array of int
+        element numbers with measurements (see obs_to_elems)
+
+    obs_vals : array
+        measured values at those elements, in the same units and of the same
+        type as elems[prop] (ex. residuals, with the same mean as the field).
+
+    weights : numpy array
+        kriging weights (see get_krig_weights)
+
+    Returns
+    -------
+    elems : pandas DataFrame
+        Returns elems DataFrame that was provided, with elems[prop] conditioned.
+    '''
+
+  idx = obs_index(elems, obs_n)
+  z = elems[prop].values
+
+  elems[prop] = z + weights @ (np.asarray(obs_vals) - z[idx])
+
+  return elems
+
+
+def obs_index(elems, obs_n):
+  ''' Row positions in elems of element numbers obs_n (raises an error if any
+      of them is not in elems['n'], instead of using the wrong element) '''
+
+  idx = pd.Index(elems['n']).get_indexer(obs_n)
+
+  if np.any(idx < 0):
+    missing = np.asarray(obs_n)[idx < 0]
+    mssg = 'Elements with measurements are not in elems: ' + str(missing[:10])
+    raise Exception(mssg)
+
+  return idx
+
+
+def map_rf_check_inputs(elems, prop, z, weights = None):
   ''' Does some really basic error checking for the inputs to map_rf '''
 
   # Some (really) basic error checking
   errors = {1: 'Missing i or j in elemes table. Please add.' ,
-            2: 'Random field and q4m mesh do not have same num of is and js.'}
+            2: 'Random field and q4m mesh do not have same num of is and js.',
+            3: 'Weights do not match size of random field and elems table.'}
 
-  # Check that elems i and j exists, and that the random field is large enough
+  # If weights are given, only check that sizes agree
   err_flags = []
+  if weights is not None:
+    if weights.shape != (len(elems), np.size(z)):
+      err_flags += [3]
+    return [errors[f] for f in err_flags]
+
+  # Check that elems i and j exists, and that the random field is large enough
   try:
     max_i = np.max(elems['i'])
     max_j = np.max(elems['j'])
@@ -5,7 +5,6 @@ This module contains functions that run the executable QUAD4MU.exe automatically
 for a given set of QUAD4M input files.
 
 '''
-from memory_profiler import memory_usage
 import llgeo.utilities.files as llgeo_fls
 import llgeo.quad4m.post_process as q4m_post
 from threading import Thread
@@ -414,6 +413,8 @@ def run_QUAD4Ms_series_mem(dq4ms, dwrks, douts, fq4rs, fdats, fouts, fbugs,
                            nthreads = None):
     ''' Wrapper for run_QUAD4Ms_series that also tracks memory usage '''
 
+    from memory_profiler import memory_usage
+
     args = (dq4ms, dwrks, douts, fq4rs, fdats, fouts, fbugs)
     mem = memory_usage(proc = (runQ4Ms_series, args), interval = 0.5, 
                                 timeout = 2, include_children = True)
@@ -424,6 +425,8 @@ def run_QUAD4Ms_parallel_mem(dq4ms, dwrks, douts, fq4rs, fdats, fouts, fbugs,
                            nthreads):
     ''' Wrapper for run_QUAD4Ms_parallel that also tracks memory usage '''
 
+    from memory_profiler import memory_usage
+
     args = (dq4ms, dwrks, douts, fq4rs, fdats, fouts, fbugs, nthreads)
     mem = memory_usage(proc = (runQ4Ms_parallel, args), interval = 0.5, 
                                 timeout = 2, include_children = True)
@@ -184,4 +184,141 @@ c     Report progress, close, and end routine
       write(iout, *) 'Sim number and seed:', ii, kseed
       close(iout)
       return
-      end
\ No newline at end of file
+      end
+
+c     ******************************************************************
+c     *                                                                *
+c     *                       subroutine sim1dn                        *
+c     *                                                                *
+c     ******************************************************************
+c
+c     PURPOSE:
+c     Batched version of sim1d. Generates nsims realizations in a single
+c     call and stores them in the columns of Z(n, nsims), so that Python
+c     only calls Fortran (and opens the debugging file) once per batch.
+c     The workspace is allocated once and reused for all realizations.
+c
+c     ARGUMENTS (same as sim1d, except for):
+c        Z (input/output)
+c           real array of size n x nsims, which on output will contain
+c           one realization of the 1-D process per column. Should be
+c           created in Python as a Fortran-ordered float32 array, so
+c           that F2PY fills it in place.
+c
+c        i0 (input)
+c           Number of the first realization in this batch. Must be 1
+c           the first time this routine is called, so that LAS1G is
+c           initialized. Use i0 = 1 + (realizations done so far) to keep
+c           generating realizations of the same field in later calls.
+c
+c        nsims (input)
+c           number of realizations (inferred from Z by F2PY)
+c
+c        W (workspace)
+c           real array of size 2*n (allocated and hidden by F2PY)
+c
+c     ******************************************************************
+
+      subroutine sim1dn(Z, n, xl, zm, zv, thx, fncnam, pa, pb, kseed,
+     >                  iout, i0, nsims, W)
+
+c     -------------- variable intents and types of F2PY ----------------
+cf2py intent(in,out)     Z
+cf2py intent(in)         n
+cf2py intent(in)         xl
+cf2py intent(in)         zm
+cf2py intent(in)         zv
+cf2py intent(in)         thx
+cf2py intent(in)         fncnam
+cf2py intent(in)         pa
+cf2py intent(in)         pb
+cf2py intent(in)         kseed
+cf2py intent(in)         iout
+cf2py intent(in)         i0
+cf2py intent(in)         nsims
+cf2py intent(hide,cache) W
+
+c     ------------------------ variable definitions --------------------
+c     Basic parameters
+      parameter(MXN = 16384)
+      integer n, kseed, nbh, iout, i0, nsims, ii, ifn
+      real Z(n, nsims), W(2*n), xl
+      real*8 zm, zv, thx, pa, pb
+      character*6 fncnam
+      character*24 rdate
+      logical lcomp
+      
+c     Variance functions in GAF77      
+      real*8   dlace1, dlafr1, dlavx1, dlsmp1, dlspx1
+      external dlace1, dlafr1, dlavx1, dlsmp1, dlspx1
+      real*8         dpa, dpb, dthx, dthy, dthz
+      common/dparam/ dpa, dpb, dthx, dthy, dthz
+
+c     Format specigiers
+   1  format(a,a,a) 
+   2  format(3F5.2)
+
+c ---------------------- set-up basic parameters -----------------------
+      nbh = 3
+
+c     Export common block parameters
+      dthx = dble(thx)
+      dpa  = dble(pa)
+      dpb  = dble(pb)
+
+c ------------------------- set-up a debugging file --------------------
+      call fdate(rdate)
+      open(iout, file = 'sim1d.stats', status = 'UNKNOWN')
+      write(iout,1) rdate
+      write(iout,1) 'The common block parameters are:'
+      write(iout,2) dpa, dpb, dthx
+
+      if( n .gt. MXN ) then
+         write(iout, *) 'Process too long. Max = ', MXN, 'points\n'
+         stop
+      endif
+
+c     Figure out covariance function only once
+      if     (lcomp('dlace1', fncnam)) then
+         ifn = 1
+      elseif (lcomp('dlafr1', fncnam)) then
+         ifn = 2
+      elseif (lcomp('dlavx1', fncnam)) then
+         ifn = 3
+      elseif (lcomp('dlsmp1', fncnam)) then
+         ifn = 4
+      elseif (lcomp('dlspx1', fncnam)) then
+         ifn = 5
+      else
+         write(iout, 1) 'Unknown covariance function'
+         stop
+      endif
+      write(iout, 1) 'Using covariance function ', fncnam
+
+c --------------------- get random field realizations ------------------
+      do 60 k = 1, nsims
+         ii = i0 + k - 1
+
+         if     (ifn .eq. 1) then
+            call las1g(W, n, xl, dlace1, nbh, kseed, ii, iout)
+         elseif (ifn .eq. 2) then
+            call las1g(W, n, xl, dlafr1, nbh, kseed, ii, iout)
+         elseif (ifn .eq. 3) then
+            call las1g(W, n, xl, dlavx1, nbh, kseed, ii, iout)
+         elseif (ifn .eq. 4) then
+            call las1g(W, n, xl, dlsmp1, nbh, kseed, ii, iout)
+         else
+            call las1g(W, n, xl, dlspx1, nbh, kseed, ii, iout)
+         endif
+
+c        Scale to proper distribution (only first n are the field)
+         do 50 i = 1, n
+            Z(i, k) = zm + W(i)
+   50    continue
+   60 continue
+
+c     Report progress, close, and end routine   
+      write(iout, *) 'Sims number and seed:', i0, i0 + nsims - 1, kseed
+      close(iout)
+      return
+      end
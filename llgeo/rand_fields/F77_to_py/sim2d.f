@@ -189,4 +189,136 @@ c     Report progress, close, and end routine
       write(iout, *) 'Sim number and seed:', ii, kseed
       close(iout)
       return
-      end
\ No newline at end of file
+      end
+
+c     ******************************************************************
+c     *                                                                *
+c     *                       subroutine sim2dn                        *
+c     *                                                                *
+c     ******************************************************************
+c
+c     PURPOSE:
+c     Batched version of sim2d. Generates nsims realizations in a single
+c     call and stores them in Z(N1, N2, nsims), so that Python only calls
+c     Fortran (and opens the debugging file) once per batch. The LAS2G
+c     workspace is allocated once and reused for all realizations.
+c
+c     ARGUMENTS (same as sim2d, except for):
+c        Z (input/output)
+c           real array of size N1 x N2 x nsims, which on output will
+c           contain the realizations of the 2-D process, where Z(:,:,k)
+c           follows the same indexing as sim2d. Should be created in
+c           Python as a Fortran-ordered float32 array, so that F2PY
+c           fills it in place.
+c
+c        i0 (input)
+c           Number of the first realization in this batch. Must be 1
+c           the first time this routine is called, so that LAS2G is
+c           initialized. Use i0 = 1 + (realizations done so far) to keep
+c           generating realizations of the same field in later calls.
+c
+c        nsims (input)
+c           number of realizations (inferred from Z by F2PY)
+c
+c        W (workspace)
+c           real array of size 2 x N1 x N2 (allocated and hidden by F2PY)
+c
+c     ******************************************************************
+
+      subroutine sim2dn(Z, N1, N2, XL, YL, zm, zv, thx, thy, fncnam,
+     >                  pa, pb, kseed, outnam, i0, nsims, W)
+
+c     -------------- variable intents and types of F2PY ----------------
+cf2py intent(in,out)     Z
+cf2py intent(in)         N1
+cf2py intent(in)         N2
+cf2py intent(in)         XL
+cf2py intent(in)         YL
+cf2py intent(in)         thx
+cf2py intent(in)         thy
+cf2py intent(in)         zm
+cf2py intent(in)         zv
+cf2py intent(in)         fncnam
+cf2py intent(in)         pa
+cf2py intent(in)         pb
+cf2py intent(in)         kseed
+cf2py intent(in)         outnam
+cf2py intent(in)         i0
+cf2py intent(in)         nsims
+cf2py intent(hide,cache) W
+
+c     ----------------------- Variable Definitions ---------------------
+c     Basic parameters
+      parameter(MXN = 256)
+      integer N1, N2, kseed, iout, i0, nsims, ii
+      real    Z(N1, N2, nsims), W(2*N1*N2)
+      real*8  zm, zv, pa, pb, thx, thy, XL, YL
+      character*6 fncnam
+      character*24 rdate, outnam
+      logical lcomp, lavx2
+
+c     Variance functions in GAF77, and appropriate parameters
+      real*8   dlavx2, dlspx2
+      external dlavx2, dlspx2
+      real*8   dpa, dpb, dthx, dthy, dthz
+      common/dparam/ dpa, dpb, dthx, dthy, dthz
+      
+c     Format specifiers
+   1  format(a,a,a)
+
+c ---------------------- set-up basic parameters -----------------------
+c     Export common block parameters
+      dpa  = dble(pa)
+      dpb  = dble(pb)
+      dthx = dble(thx)
+      dthy = dble(thy)
+      
+c     ---------------------- set-up stats file -------------------------
+      iout = 8
+      i = lnblnk(outnam)
+      call fdate(rdate)
+      open(iout, file = outnam(1:i), status = 'UNKNOWN')
+      write(iout, *) rdate
+      write(iout, *) 'pa. pb. thx. thy, thz'
+      write(iout, *) dpa, dpb, dthx, dthy, dthz
+      write(iout, *) 'N1, N2, XL, YL, zm, zv'
+      write(iout, *)  N1, N2, XL, YL, zm, zv
+
+c     ---------------------------- checks-------------------------------
+c     Check field size
+      N12 = N1 * N2
+      if (N12 .gt. MXN * MXN) then
+            write(iout, 1) 'Error: Problem too big! Reduce resolution'
+            stop
+      endif
+
+c     Check covariance function (only once)
+      if(.not.(lcomp('dlavx2',fncnam) .or. lcomp('dlspx2',fncnam))) then
+            write(iout, 1) 'Error: Unkown covariance function'
+            stop
+      endif
+      lavx2 = lcomp('dlavx2', fncnam)
+      write(iout, 1) 'Using covariance function ', fncnam
+
+c     ---------- call LAS2G for each realization in the batch ----------
+      do 60 k = 1, nsims
+            ii = i0 + k - 1
+
+            if (lavx2) then
+                  call las2g(W, N1, N2, XL, YL, dlavx2, kseed, ii, iout)
+            else
+                  call las2g(W, N1, N2, XL, YL, dlspx2, kseed, ii, iout)
+            endif
+
+c           Scale to desired normal distribution (only first N1*N2)
+            do 50 j = 1, N2
+            do 50 i = 1, N1
+                  Z(i, j, k) = zm + W(i + (j - 1) * N1)
+   50       continue
+   60 continue
+
+c     Report progress, close, and end routine   
+      write(iout, *) 'Sims number and seed:', i0, i0 + nsims - 1, kseed
+      close(iout)
+      return
+      end
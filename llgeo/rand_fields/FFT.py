@@ -0,0 +1,400 @@
+''' Generate 1D and 2D random fields using FFT and circulant embedding
+
+DESCRIPTION:
+This module contains functions to generate 1D and 2D random fields using the
+circulant embedding method, as an alternative to the LAS module (which needs
+the compiled simLAS extension). The covariance matrix of the field is embedded
+in a larger circulant matrix, which is diagonalized by the FFT, so realizations
+are obtained by filtering white noise in the frequency domain. Everything is
+done with numpy, grid sizes are arbitrary (no n = k*2**m requirement), and
+many realizations are generated at once in a single (batched) real FFT.
+
+The covariance functions are the same as in LAS (GAF77 library), and by default
+the values are local averages over each cell (like LAS), so both modules should
+produce fields with the same statistics.
+
+MAIN FUNCTIONS:
+This module contains the following functions:
+    * sim1d: generates 1D realizations of a random field (same inputs as LAS)
+    * sim2d: generates 2D realizations of a random field (same inputs as LAS)
+    * sim1d_batch: same as sim1d, but returns one (nsims x n) array
+    * sim2d_batch: same as sim2d, but returns one (nsims x n1 x n2) array
+    * iter_sim1d: yields chunks of sim1d_batch realizations
+    * iter_sim2d: yields chunks of sim2d_batch realizations
+    * get_embedding: square root of eigenvalues of the circulant embedding
+    * gen_fields: generates zero-mean fields given a circulant embedding
+'''
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import numpy as np
+
+# Covariance functions available for each number of dimensions
+FNCS = {1: ['dlavx1', 'dlspx1'], 2: ['dlavx2', 'dlspx2', 'dlspx5']}
+
+# ------------------------------------------------------------------------------
+# Main functions
+# ------------------------------------------------------------------------------
+
+def sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed):
+    ''' Generates 1D realizations of a random field using circulant embedding.
+
+    Purpose
+    -------
+    Generates nsims of a normally distributed random field using the circulant
+    embedding method. Drop-in replacement for LAS.sim1d.
+
+    Parameters
+    ----------
+    n : int
+        Number of cells to discretize the field (any positive integer).
+
+    xl : float
+        Physical dimensions of the random process. Careful with units!
+
+    zm : float
+        Mean of the random process, which is assumed to be normally distributed.
+
+    zv : float
+        Point variance of the random process. Not used: like in LAS, the point
+        variance is given by pa (kept for compatibility with LAS.sim1d).
+
+    thx : float
+        Scale of fluctuation of the random process (correlation length).
+
+    fncnam : str
+        Name of the variance function. Must be one of:
+            'dlavx1' -> 1D Exponentially decaying (Markov) model.
+            'dlspx1' -> 1D Gaussian decaying correlation model.
+
+    pa : float
+       Point variance of the random process.
+
+    pb : float
+       Not used (kept for compatibility with LAS.sim1d).
+
+    nsims : int
+        Number of realizations to return.
+
+    kseed : int, numpy SeedSequence or numpy Generator
+       Seed used to initialize numpy's random number generator. If kseed = 0,
+       then a random seed will be used.
+
+    Returns
+    -------
+    Zs : list of numpy arrays
+        List with nsims elements, where each element corresponds to a random
+        field realization. Each realization is a 1D numpy array of length n.
+
+    References
+    ----------
+    (1) Dietrich & Newsam (1997). Fast and exact simulation of stationary
+        Gaussian processes through circulant embedding of the covariance
+        matrix. SIAM Journal on Scientific Computing, 18(4), 1088-1107.
+    (2) Fenton & Griffiths (2008). Risk assessment in geotechnical engineering.
+        John Wiley & Sons, Inc.
+            See: All of chapter 3
+    '''
+
+    Zs = list(sim1d_batch(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed))
+
+    return Zs
+
+
+def sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf, seed):
+    ''' Generates 2D realizations of a random field using circulant embedding.
+
+    Purpose
+    -------
+    Generates nsims of a normally distributed random field using the circulant
+    embedding method. Drop-in replacement for LAS.sim2d.
+
+    Parameters
+    ----------
+    n1 and n2 : int
+        Number of cells to discretize the field in x and y dirs, respectively.
+        Any positive integers (no n = k*2**m requirement as in LAS).
+
+    xl and yl: float
+        Physical dimensions of the random process. Careful with units!
+
+    zm : float
+        Mean of the random process, which is assumed to be normally distributed.
+
+    zv : float
+        Not used: like in LAS, the point variance is given by pa.
+
+    thx and thy: float
+        Scales of fluctuation of the random process (correlation length).
+
+    fnc : str
+        Name of the variance function. Must be one of:
+            'dlavx2' -> 2D Exponentially decaying (Markov) model.
+            'dlspx2' -> 2D Gaussian decaying correlation model.
+                        (also accepts 'dlspx5', as in the LAS docs)
+
+    pa : float
+       Point variance of the random process.
+
+    pb : float
+       Not used (kept for compatibility with LAS.sim2d).
+
+    nsims : int
+        Number of realizations to return.
+
+    outf : str
+        Not used (kept for compatibility with LAS.sim2d).
+
+    seed : int, numpy SeedSequence or numpy Generator
+       Seed used to initialize numpy's random number generator. If seed = 0,
+       then a random seed will be used.
+
+    Returns
+    -------
+    Zs : list of numpy arrays
+        List with nsims elements, where each element corresponds to a random
+        field realization. Each realization is a 2D numpy array of size n1xn2.
+        Z(1,1) is the lower left cell, Z(2,1) is the next cell in the X direct.,
+        Z(1,2) is the next cell in the Y direction (upwards).
+    '''
+
+    Zs = list(sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims,
+                          outf, seed))
+
+    return Zs
+
+
+def sim1d_batch(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed,
+                chunk = 1000, local_avg = True):
+    ''' Same as sim1d, but returns one array of size (nsims x n).
+        Realizations are generated in groups of size chunk (to limit memory).
+        If local_avg is False, values are at cell centers (not cell averages).
+    '''
+
+    Zs = np.empty((nsims, n))
+    gen = iter_sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed, chunk,
+                     local_avg)
+
+    i = 0
+    for Z in gen:
+        Zs[i : i + len(Z)] = Z
+        i += len(Z)
+
+    return Zs
+
+
+def sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+                seed, chunk = 100, local_avg = True):
+    ''' Same as sim2d, but returns one array of size (nsims x n1 x n2).
+        Realizations are generated in groups of size chunk (to limit memory).
+        If local_avg is False, values are at cell centers (not cell averages).
+    '''
+
+    Zs = np.empty((nsims, n1, n2))
+    gen = iter_sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+                     seed, chunk, local_avg)
+
+    i = 0
+    for Z in gen:
+        Zs[i : i + len(Z)] = Z
+        i += len(Z)
+
+    return Zs
+
+
+def iter_sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed,
+               chunk = 1000, local_avg = True):
+    ''' Yields nsims 1D realizations (see sim1d) in arrays of size (chunk x n).
+        The embedding is only computed once for all chunks. '''
+
+    rng = get_rng(kseed)
+    embed = get_embedding((n,), (xl,), (thx,), fncnam, pa, local_avg)
+
+    for first in range(0, nsims, chunk):
+        k = min(chunk, nsims - first)
+        yield zm + gen_fields(embed, k, rng)
+
+
+def iter_sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+               seed, chunk = 100, local_avg = True):
+    ''' Yields nsims 2D realizations (see sim2d) in arrays of size
+        (chunk x n1 x n2). The embedding is only computed once for all chunks'''
+
+    rng = get_rng(seed)
+    embed = get_embedding((n1, n2), (xl, yl), (thx, thy), fnc, pa, local_avg)
+
+    for first in range(0, nsims, chunk):
+        k = min(chunk, nsims - first)
+        yield zm + gen_fields(embed, k, rng)
+
+
+def get_embedding(ns, ls, ths, fnc, pa, local_avg = True, max_pad = 8):
+    ''' Gets the square root of the eigenvalues of the circulant embedding.
+
+    Purpose
+    -------
+    Embeds the covariance matrix of a random field with ns cells (in each dim)
+    into a (block) circulant matrix, and returns the square root of its
+    eigenvalues (as given by a real FFT). If the embedding is not positive
+    definite, the padding is increased until it is (or until max_pad).
+
+    Parameters
+    ----------
+    ns : tuple of int
+        number of cells in each direction, ex. (n1, n2)
+    ls : tuple of float
+        physical dimensions of the field in each direction, ex. (xl, yl)
+    ths : tuple of float
+        scales of fluctuation in each direction, ex. (thx, thy)
+    fnc : str
+        name of the covariance function (see sim1d and sim2d)
+    pa : float
+        point variance of the random process
+    local_avg : bool (optional)
+        if True (default), covariances are for averages over each cell (as LAS)
+        otherwise, covariances are for points at cell centers.
+    max_pad : int (optional)
+        maximum factor by which the minimum embedding size is increased.
+
+    Returns
+    -------
+    embed : dict
+        'sqrt_eigs' : square root of eigenvalues (size of rfftn of embedding)
+        'shape'     : size of the embedding
+        'ns'        : number of cells in each direction
+    '''
+
+    if fnc not in FNCS[len(ns)]:
+        mssg = 'Covariance function ' + str(fnc) + ' not available in '
+        mssg+= '{:d}D. Use one of: '.format(len(ns)) + ', '.join(FNCS[len(ns)])
+        raise Exception(mssg)
+
+    ds = [l / n for l, n in zip(ls, ns)]
+
+    # Increase padding until all eigenvalues are positive
+    pad = 1
+    while True:
+        ms = [next_fast_len(max(2 * (n - 1) * pad, 1)) for n in ns]
+
+        # Lags in the embedding (symmetric, circulant)
+        lags = [np.minimum(np.arange(m), m - np.arange(m)) * d
+                for m, d in zip(ms, ds)]
+        lags = np.meshgrid(*lags, indexing = 'ij')
+
+        if local_avg:
+            cov = pa * local_avg_corr(fnc, lags, ths, ds)
+        else:
+            cov = pa * correlation(fnc, lags, ths)
+
+        eigs = np.fft.rfftn(cov).real
+
+        if (np.min(eigs) >= -1e-8 * np.max(eigs)) or (pad >= max_pad):
+            break
+
+        pad *= 2
+
+    if np.min(eigs) < -1e-8 * np.max(eigs):
+        print('Warning: circulant embedding is not positive definite.')
+        print('         Negative eigenvalues were set to zero (approx. field)')
+
+    embed = {'sqrt_eigs': np.sqrt(np.maximum(eigs, 0)),
+             'shape'    : tuple(ms),
+             'ns'       : tuple(ns)}
+
+    return embed
+
+
+# ------------------------------------------------------------------------------
+# Helper functions
+# ------------------------------------------------------------------------------
+
+def gen_fields(embed, nsims, rng):
+    ''' Generates nsims zero-mean fields given the circulant embedding (see
+        get_embedding). All fields are generated at once by a batched real FFT
+        of white noise: Z = C^(1/2) * eps = irfft(sqrt(eigs) * rfft(eps)) '''
+
+    ms   = embed['shape']
+    axes = tuple(range(1, len(ms) + 1))
+    eps  = rng.standard_normal((nsims, *ms))
+
+    Z = np.fft.irfftn(embed['sqrt_eigs'] * np.fft.rfftn(eps, axes = axes),
+                      s = ms, axes = axes)
+
+    # Only return the first n cells (all else is padding)
+    Z = Z[(slice(None), ) + tuple(slice(0, n) for n in embed['ns'])]
+
+    return Z
+
+
+def correlation(fnc, lags, ths):
+    ''' Point correlation function "fnc" (as in GAF77) at the given lags '''
+
+    if fnc == 'dlavx1':
+        rho = np.exp(-2 * np.abs(lags[0]) / ths[0])
+
+    elif fnc == 'dlspx1':
+        rho = np.exp(-np.pi * (lags[0] / ths[0])**2)
+
+    elif fnc == 'dlavx2':
+        rho = np.exp(-2 * np.sqrt((lags[0] / ths[0])**2 +
+                                  (lags[1] / ths[1])**2))
+
+    elif fnc in ['dlspx2', 'dlspx5']:
+        rho = np.exp(-np.pi * ((lags[0] / ths[0])**2 + (lags[1] / ths[1])**2))
+
+    else:
+        raise Exception('Unknown covariance function: ' + str(fnc))
+
+    return rho
+
+
+def local_avg_corr(fnc, lags, ths, ds, ngauss = 8):
+    ''' Correlation between averages over two cells (of size ds) separated by
+        the given lags. Integrated with Gauss-Legendre (triangular weights). '''
+
+    # Quadrature for int_{-d}^{d} (1 - |s|/d)/d f(s) ds (split at 0 for kinks)
+    x, w = np.polynomial.legendre.leggauss(ngauss)
+    s = np.concatenate([(x - 1) / 2, (x + 1) / 2])
+    w = np.concatenate([w, w]) / 2 * (1 - np.abs(s))
+
+    rho = np.zeros(np.shape(lags[0]))
+
+    if len(lags) == 1:
+        for si, wi in zip(s, w):
+            rho += wi * correlation(fnc, [lags[0] + si * ds[0]], ths)
+
+    else:
+        for si, wi in zip(s, w):
+            for sj, wj in zip(s, w):
+                rho += wi * wj * correlation(fnc, [lags[0] + si * ds[0],
+                                                   lags[1] + sj * ds[1]], ths)
+
+    return rho
+
+
+def get_rng(seed):
+    ''' Returns a numpy Generator from an int seed (0 = random, as in LAS), a
+        SeedSequence, or an existing Generator. '''
+
+    if isinstance(seed, np.random.Generator):
+        return seed
+
+    if isinstance(seed, (int, np.integer)) and (seed == 0):
+        seed = None
+
+    return np.random.default_rng(seed)
+
+
+def next_fast_len(n):
+    ''' Smallest integer >= n whose only prime factors are 2, 3, and 5 '''
+
+    m = n
+    while True:
+        k = m
+        for p in [2, 3, 5]:
+            while k % p == 0:
+                k //= p
+        if k == 1:
+            return m
+        m += 1
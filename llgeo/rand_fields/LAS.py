@@ -11,6 +11,10 @@ MAIN FUNCTIONS:
 This module contains the following functions:
     * simLAS1D: generates 1D realizations of a random field using LAS
     * simLAS2D: generates 2D realizations of a random field using LAS
+    * sim1d_batch: same as sim1d, but returns one (nsims x n) array
+    * sim2d_batch: same as sim2d, but returns one (nsims x n1 x n2) array
+    * iter_sim1d: yields chunks of sim1d_batch realizations
+    * iter_sim2d: yields chunks of sim2d_batch realizations
     * plot_rf : given a random field array and axes handles, returns a plot
 
 TODO - simLAS2d: automate finding K1, K2,  m, OR just request these directly
@@ -108,12 +112,8 @@ def sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed):
         John Wiley & Sons, Inc.
             See: All of chapter 3
     '''
-    # Create random field realizations using sim1d (see F77_to_PY folder)
-    Zs = [LAS.sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, kseed, 7, i+1)
-           for i in range(nsims)]
-
-    # Only return the first n elements (all else is workspace)
-    Zs = [z[:n] for z in Zs]
+    # Create random field realizations in one batch (see sim1d_batch)
+    Zs = list(sim1d_batch(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed))
 
     return Zs
 
@@ -198,16 +198,131 @@ def sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf, seed):
         John Wiley & Sons, Inc.
             See: All of chapter 3
     '''
-    # Create random field realizations using sim1d (see F77_to_PY folder)
-    Zs = [LAS.sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, seed, outf,
-                    i+1) for i in range(nsims)]
-
-    # Only return the first n elements (all else is workspace)
-    Zs = [z[0:n1*n2].reshape(n1, n2, order = 'F') for z in Zs]
+    # Create random field realizations in one batch (see sim2d_batch)
+    Zs = list(sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims,
+                          outf, seed))
 
     return(Zs)
 
 
+def sim1d_batch(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed, first = 1):
+    ''' Generates a batch of 1D realizations of a random field using LAS.
+    
+    Purpose
+    -------
+    Same as sim1d, but all realizations are generated by a single call to the
+    Fortran routine sim1dn (see F77_to_py folder), which writes them directly
+    into one preallocated array. LAS is only initialized once (if first = 1),
+    and the workspace is reused for all realizations.
+
+    Parameters
+    ----------
+    n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed :
+        Same as sim1d.
+
+    first : int (optional)
+        Number of the first realization in this batch. Must be 1 (default) for
+        the first batch, which initializes LAS. Use 1 + (number of realizations
+        done so far) to continue generating realizations of the same field.
+        Continuing (first > 1) relies on the state that LAS keeps internally
+        from the previous call (see Notes).
+
+    Returns
+    -------
+    Zs : numpy array (float32)
+        Array of size (nsims x n), where each row is a realization.
+
+    Notes
+    -----
+    * The compiled LAS routines keep their state (random number generator and
+      initialized field) between calls, and there is only one copy per process.
+      A batch with first > 1 continues from whatever was generated last, so no
+      other LAS call (sim1d, sim2d, or another batch) may run in between.
+    '''
+
+    # Fortran-ordered output, so that F2PY fills it in place (no copies)
+    Zs = np.zeros((n, nsims), dtype = np.float32, order = 'F')
+
+    Zs = LAS.sim1dn(z = Zs, xl = xl, zm = zm, zv = zv, thx = thx,
+                    fncnam = fncnam, pa = pa, pb = pb, kseed = kseed,
+                    iout = 7, i0 = first)
+
+    return Zs.T
+
+
+def sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+                seed, first = 1):
+    ''' Generates a batch of 2D realizations of a random field using LAS.
+    
+    Purpose
+    -------
+    Same as sim2d, but all realizations are generated by a single call to the
+    Fortran routine sim2dn (see F77_to_py folder), which writes them directly
+    into one preallocated array. LAS is only initialized once (if first = 1),
+    and the workspace is reused for all realizations.
+
+    Parameters
+    ----------
+    n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf, seed :
+        Same as sim2d.
+
+    first : int (optional)
+        Number of the first realization in this batch. Must be 1 (default) for
+        the first batch, which initializes LAS. Use 1 + (number of realizations
+        done so far) to continue generating realizations of the same field.
+        Continuing (first > 1) relies on the state that LAS keeps internally
+        from the previous call (see Notes).
+
+    Returns
+    -------
+    Zs : numpy array (float32)
+        Array of size (nsims x n1 x n2), where Zs[k] is a realization indexed
+        the same way as in sim2d.
+
+    Notes
+    -----
+    * The compiled LAS routines keep their state (random number generator and
+      initialized field) between calls, and there is only one copy per process.
+      A batch with first > 1 continues from whatever was generated last, so no
+      other LAS call (sim1d, sim2d, or another batch) may run in between.
+    '''
+
+    # Fortran-ordered output, so that F2PY fills it in place (no copies)
+    Zs = np.zeros((n1, n2, nsims), dtype = np.float32, order = 'F')
+
+    Zs = LAS.sim2dn(z = Zs, xl = xl, yl = yl, zm = zm, zv = zv, thx = thx,
+                    thy = thy, fncnam = fnc, pa = pa, pb = pb, kseed = seed,
+                    outnam = outf, i0 = first)
+
+    return np.moveaxis(Zs, 2, 0)
+
+
+def iter_sim1d(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed, chunk = 1000):
+    ''' Yields nsims 1D realizations (see sim1d_batch) in chunks of size chunk.
+        All chunks are realizations of the same field (LAS initialized once).
+        Chunks continue from the state that LAS keeps between calls, so the
+        generator must be consumed before any other LAS call (no interleaving
+        of two generators, or calls to sim1d/sim2d between chunks). '''
+
+    for first in range(1, nsims + 1, chunk):
+        k = min(chunk, nsims - first + 1)
+        yield sim1d_batch(n, xl, zm, zv, thx, fncnam, pa, pb, k, kseed, first)
+
+
+def iter_sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+               seed, chunk = 100):
+    ''' Yields nsims 2D realizations (see sim2d_batch) in chunks of size chunk.
+        All chunks are realizations of the same field (LAS initialized once).
+        Chunks continue from the state that LAS keeps between calls, so the
+        generator must be consumed before any other LAS call (no interleaving
+        of two generators, or calls to sim1d/sim2d between chunks). '''
+
+    for first in range(1, nsims + 1, chunk):
+        k = min(chunk, nsims - first + 1)
+        yield sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, k,
+                          outf, seed, first)
+
+
 def plot_rf(ax, z):
     ''' given a random field array and axes handles, returns a plot '''
 
@@ -0,0 +1,207 @@
+''' Generate random fields in parallel, with reproducible seed streams
+
+DESCRIPTION:
+This module contains functions to generate large ensembles of random fields on
+several processes. Realizations are split into blocks of fixed size, and each
+block gets its own independent seed, derived from the user seed with numpy's
+SeedSequence.spawn. Since the blocks (and their seeds) do not depend on the
+number of workers, the output is identical regardless of how many processes
+are used, and streams never overlap (unlike seeds of the form kseed + i).
+
+MAIN FUNCTIONS:
+This module contains the following functions:
+    * sim1d_parallel: generates 1D realizations on a process pool
+    * sim2d_parallel: generates 2D realizations on a process pool
+    * block_seeds: independent seeds for each block of realizations
+'''
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import numpy as np
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+import llgeo.rand_fields.FFT as llgeo_fft
+
+# ------------------------------------------------------------------------------
+# Main functions
+# ------------------------------------------------------------------------------
+
+def sim1d_parallel(n, xl, zm, zv, thx, fncnam, pa, pb, nsims, kseed,
+                   nworkers = None, block = 1000, backend = 'FFT', out = None):
+    ''' Generates 1D realizations of a random field on a process pool.
+
+    Purpose
+    -------
+    Same as sim1d_batch (in FFT or LAS modules), but realizations are split in
+    blocks of size "block" that are generated in parallel, each with its own
+    seed (see block_seeds). The result does not depend on nworkers.
+
+    Parameters
+    ----------
+    n, xl, zm, zv, thx, fncnam, pa, pb, nsims :
+        Same as FFT.sim1d or LAS.sim1d
+
+    kseed : int
+        Seed from which the seeds for each block are derived. Unlike FFT and
+        LAS, a seed of 0 is just another seed (not random).
+
+    nworkers : int (optional)
+        Number of processes to use. Defaults to None, so that all cores are
+        used. If nworkers = 1, everything is run in this process.
+
+    block : int (optional)
+        Number of realizations per block. Changing this changes the output!
+
+    backend : str (optional)
+        'FFT' (default) for circulant embedding, or 'LAS' for the Fortran LAS
+        module (requires compiled simLAS).
+
+    out : numpy array (optional)
+        Array of size (nsims x n) where results are stored (ex. a memory-mapped
+        .npy file, so that large ensembles are written straight to disk).
+        Defaults to None, so that a new array is created.
+
+    Returns
+    -------
+    Zs : numpy array
+        Array of size (nsims x n), where each row is a realization.
+    '''
+
+    # Inputs for each block (embedding is only computed once for FFT)
+    if backend == 'FFT':
+        embed = llgeo_fft.get_embedding((n,), (xl,), (thx,), fncnam, pa)
+        fixed = (embed, zm)
+    elif backend == 'LAS':
+        fixed = (n, xl, zm, zv, thx, fncnam, pa, pb)
+    else:
+        raise Exception('backend not recognized: ' + str(backend))
+
+    Zs = run_blocks(backend, 1, fixed, (n,), nsims, kseed, nworkers, block, out)
+
+    return Zs
+
+
+def sim2d_parallel(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf,
+                   seed, nworkers = None, block = 100, backend = 'FFT',
+                   out = None):
+    ''' Generates 2D realizations of a random field on a process pool.
+
+    Purpose
+    -------
+    Same as sim2d_batch (in FFT or LAS modules), but realizations are split in
+    blocks of size "block" that are generated in parallel, each with its own
+    seed (see block_seeds). The result does not depend on nworkers.
+
+    Parameters
+    ----------
+    n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims, outf :
+        Same as FFT.sim2d or LAS.sim2d (outf is only used by LAS)
+
+    seed, nworkers, block, backend, out :
+        See sim1d_parallel (out must be of size nsims x n1 x n2)
+
+    Returns
+    -------
+    Zs : numpy array
+        Array of size (nsims x n1 x n2), where Zs[k] is a realization.
+    '''
+
+    # Inputs for each block (embedding is only computed once for FFT)
+    if backend == 'FFT':
+        embed = llgeo_fft.get_embedding((n1, n2), (xl, yl), (thx, thy), fnc, pa)
+        fixed = (embed, zm)
+    elif backend == 'LAS':
+        fixed = (n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, outf)
+    else:
+        raise Exception('backend not recognized: ' + str(backend))
+
+    Zs = run_blocks(backend, 2, fixed, (n1, n2), nsims, seed, nworkers, block,
+                    out)
+
+    return Zs
+
+
+def block_seeds(seed, nblocks, backend = 'FFT'):
+    ''' Independent seeds for each block of realizations.
+
+    Purpose
+    -------
+    Spawns one child SeedSequence per block from the user seed. For the FFT
+    backend these are used directly by numpy. The Fortran LAS generator needs
+    an integer seed instead, so an integer in [1, 2**31 - 1] is drawn from each
+    child (0 is avoided, since LAS treats it as "random seed").
+
+    Parameters
+    ----------
+    seed : int
+        user seed
+    nblocks : int
+        number of blocks
+    backend : str (optional)
+        'FFT' (default) or 'LAS'
+
+    Returns
+    -------
+    seeds : list
+        list of SeedSequence (FFT) or int (LAS), one per block
+    '''
+
+    children = np.random.SeedSequence(seed).spawn(nblocks)
+
+    if backend == 'LAS':
+        return [int(c.generate_state(1)[0] % (2**31 - 1)) + 1 for c in children]
+
+    return children
+
+
+# ------------------------------------------------------------------------------
+# Helper functions
+# ------------------------------------------------------------------------------
+
+def run_blocks(backend, ndim, fixed, ns, nsims, seed, nworkers, block,
+               out = None):
+    ''' Splits nsims in blocks, runs them on a process pool, and collects the
+        results in one array of size (nsims, *ns) (or in "out" if given) '''
+
+    sizes = [min(block, nsims - i) for i in range(0, nsims, block)]
+    seeds = block_seeds(seed, len(sizes), backend)
+    args  = [(backend, ndim, fixed, k, s) for k, s in zip(sizes, seeds)]
+
+    Zs = np.empty((nsims, *ns)) if out is None else out
+
+    # Pool is shut down on exit (also if a block fails)
+    pool = nullcontext() if nworkers == 1 else \
+           ProcessPoolExecutor(max_workers = nworkers)
+
+    with pool:
+        results = map(sim_block, args) if nworkers == 1 else \
+                  pool.map(sim_block, args)
+
+        # Results come back in order, regardless of which worker finished first
+        i = 0
+        for Z in results:
+            Zs[i : i + len(Z)] = Z
+            i += len(Z)
+
+    return Zs
+
+
+def sim_block(args):
+    ''' Generates one block of realizations (runs in the worker processes) '''
+
+    backend, ndim, fixed, k, seed = args
+
+    if backend == 'FFT':
+        embed, zm = fixed
+        return zm + llgeo_fft.gen_fields(embed, k, np.random.default_rng(seed))
+
+    # Each block is a new LAS initialization (first = 1) with its own seed
+    import llgeo.rand_fields.LAS as llgeo_las
+
+    if ndim == 1:
+        return llgeo_las.sim1d_batch(*fixed, k, seed)
+
+    else:
+        return llgeo_las.sim2d_batch(*fixed[:-1], k, fixed[-1], seed)
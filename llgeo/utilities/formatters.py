@@ -8,6 +8,8 @@ FUNCTIONS:
 This module contains the following functions:
     * arr2str: Converts np array to a string using F70-like formatting.
     * num2str: Converts a number to a string using F70-like formatting.
+    * fortran_format: Formats whole arrays following a Fortran edit descriptor.
+    * fortran_lines: Same as fortran_format, but returns a list of lines.
     
 '''
 # ------------------------------------------------------------------------------
@@ -15,6 +17,7 @@ This module contains the following functions:
 # ------------------------------------------------------------------------------
 
 # Standard libraries
+import re
 import numpy as np
 
 # ------------------------------------------------------------------------------
@@ -68,16 +71,10 @@ def arr2str(data, cols, width, dec = False, space = 0, eng = False):
 	* Probably not the smartest way of doing things, but I'm tired and grumpy.
     '''
 
-    # Iterate through array, figure out formatting, and concat output string
-    str_out = ''
-
-    for i, num in enumerate(data):
-
-        # Add a line break if necessary
-        if (i > 0) & (i % cols == 0):
-            str_out += '\r\n'
-        
-        str_out += num2str(num, width, dec, space, eng) 
+    # Figure out formatting of each number, then join into lines
+    nums  = [num2str(num, width, dec, space, eng) for num in data]
+    lines = [''.join(nums[i:i + cols]) for i in range(0, len(nums), cols)]
+    str_out = '\r\n'.join(lines)
 
     return(str_out)
 
@@ -196,6 +193,123 @@ def num2str(num, width, dec = False, space = 0, eng = False):
     return(str_out)
 
 
+def fortran_format(data, fmt, line_break = '\r\n'):
+    ''' Formats a whole array following a Fortran edit descriptor.
+
+    Purpose
+    -------
+    Turns an array of numbers into a fixed-width block of text, following a
+    Fortran edit descriptor (ex. '8F10.4', 'E13.7', 'I5', '5I5,2F10.2'). The
+    whole array is formatted at once, so it is much faster than arr2str.
+    See fortran_lines for details.
+    
+    Parameters
+    ----------
+    data : array
+        numbers to be formatted (see fortran_lines).
+
+    fmt : str
+        Fortran edit descriptor for one line (see fortran_lines).
+
+    line_break : str (optional)
+        characters used to separate lines. Defaults to '\r\n'.
+
+    Returns
+    -------
+    str_out : str
+        data transformed into a fixed-width block of text.
+    '''
+
+    str_out = line_break.join(fortran_lines(data, fmt))
+
+    return str_out
+
+
+def fortran_lines(data, fmt):
+    ''' Formats a whole array into lines following a Fortran edit descriptor.
+
+    Purpose
+    -------
+    Turns an array of numbers into a list of fixed-width lines, according to
+    a Fortran edit descriptor for one line (record). Supported descriptors are
+    Iw (integers), Fw.d (floating point) and Ew.d (scientific), which can be
+    repeated (ex. '8F10.4') and combined with commas (ex. '5I5,2F10.2').
+
+    Example: for '8F10.4' (8 numbers per line, width of 10 with 4 decimals):
+                fortran_lines(np.linspace(0, 1, 20), '8F10.4')
+             for a table with 3 columns: (int, float, float):
+                fortran_lines(table, 'I5,2F10.4')
+    
+    Parameters
+    ----------
+    data : array
+        numbers to be formatted. If 1D, the numbers fill each line in order.
+        If 2D, each row is one line and the number of columns must match the
+        number of fields in "fmt".
+
+    fmt : str
+        Fortran edit descriptor for one line. Parenthesis are optional.
+
+    Returns
+    -------
+    lines : list of str
+        data transformed into lines of fixed-width text.
+
+    Notes
+    -----
+    * Raises exception if a number does not fit in its field (Fortran would
+      print asterisks instead, which QUAD4M cannot read).
+    * Unlike num2str, trailing zeros are not trimmed (F10.4 is always 4 dec).
+    * E fields use python's notation (ex. 1.234e+05), not Fortran's 0.1234E+06.
+      Both are read the same way by Fortran.
+    '''
+
+    # Get format of each field in a line
+    fields = parse_fortran_fmt(fmt)
+    nfld   = len(fields)
+
+    # Check that the data and the format agree
+    data = np.asarray(data)
+    if (data.ndim == 2) and (data.shape[1] != nfld):
+        mssg = 'Number of columns in data ({:d}) '.format(data.shape[1])
+        mssg+= 'does not match number of fields in ' + fmt
+        raise Exception(mssg)
+
+    # Check for numbers that don't fit and convert each field to python types
+    flat = data.reshape(-1)
+    nums = [None] * len(flat)
+
+    for j, (kind, width, dec) in enumerate(fields):
+        vals = flat[j::nfld]
+        check_fortran_fit(vals, kind, width, dec)
+    
+        if kind == 'I':
+            nums[j::nfld] = vals.astype(int).tolist()
+        else:
+            nums[j::nfld] = vals.astype(float).tolist()
+
+    # Format all full lines at once, and then add the (incomplete) last line
+    pyfmts = [py_fmt(*field) for field in fields]
+    nfull  = len(nums) // nfld
+    
+    block = ((''.join(pyfmts) + '\n') * nfull) % tuple(nums[:nfull * nfld])
+    lines = block.split('\n')[:-1]
+
+    if len(nums) > nfull * nfld:
+        lines += [''.join(pyfmts[:len(nums) - nfull * nfld]) %
+                  tuple(nums[nfull * nfld:])]
+
+    # Final check on sizes, just in case rounding got in the way. Fields are
+    # never narrower than their width, so a wider field shows in its line
+    widths = np.cumsum([0] + [f[1] for f in fields])
+    nlast  = len(nums) - nfull * nfld
+    if len(block) != nfull * (widths[-1] + 1) or \
+       (nlast > 0 and len(lines[-1]) != widths[nlast]):
+        raise Exception('Digits > width | Use scientific?')
+
+    return lines
+
+
 def list_to_matrix(i, j, values):
     ''' Given a series of row values (i) and column values (j), and corresponding
         values, this re-formats the data into a matrix. i becomes the rows and 
@@ -226,3 +340,69 @@ def list_to_matrix(i, j, values):
     return matrix
 
 
+# ------------------------------------------------------------------------------
+# Helper Functions
+# ------------------------------------------------------------------------------
+
+def parse_fortran_fmt(fmt):
+    ''' Parses a Fortran edit descriptor (ex. '5I5,2F10.2') into a list with
+        one touple (kind, width, dec) per field. '''
+
+    fields = []
+    for item in fmt.replace('(', '').replace(')', '').split(','):
+        match = re.fullmatch(r'\s*(\d*)([FEIfei])(\d+)(?:\.(\d+))?\s*', item)
+
+        if match is None:
+            raise Exception('Fortran edit descriptor not understood: ' + fmt)
+
+        reps, kind, width, dec = match.groups()
+        reps = int(reps) if reps else 1
+        dec  = int(dec)  if dec  else 0
+        fields += reps * [(kind.upper(), int(width), dec)]
+
+    return fields
+
+
+def py_fmt(kind, width, dec):
+    ''' Returns python's %-format equivalent to a Fortran field '''
+
+    if kind == 'I':
+        return '%{:d}d'.format(width)
+
+    elif kind == 'F':
+        return '%{:d}.{:d}f'.format(width, dec)
+
+    else:
+        return '%{:d}.{:d}e'.format(width, dec)
+
+
+def check_fortran_fit(vals, kind, width, dec):
+    ''' Raises an exception if any of vals don't fit in the Fortran field '''
+
+    vals = np.asarray(vals, dtype = float)
+    vals = vals[np.isfinite(vals)]
+    sign = (vals < 0)
+
+    with np.errstate(divide = 'ignore'):
+
+        # Integers: digits and sign
+        if kind == 'I':
+            ints = np.abs(np.trunc(vals))
+            digs = np.where(ints >= 1, np.floor(np.log10(ints)) + 1, 1)
+            if np.any(digs + sign > width):
+                raise Exception('Digits > width | Use scientific?')
+
+        # Floating point: integer digits, sign, decimal point and decimals
+        elif kind == 'F':
+            ints = np.floor(np.round(np.abs(vals), dec))
+            digs = np.where(ints >= 1, np.floor(np.log10(ints)) + 1, 1)
+            if np.any(digs + sign + 1 + dec > width):
+                raise Exception('Digits + dec > width | Use scientific?')
+            
+        # Scientific: sign, mantissa, decimals and exponent (e+XX or e+XXX)
+        else:
+            mags = np.abs(vals)
+            exps = np.where(mags > 0, np.abs(np.floor(np.log10(mags))), 0)
+            exps = np.where(exps >= 100, 5, 4)
+            if np.any(sign + 1 + (dec > 0) + dec + exps > width):
+                raise Exception('cant format eng number; does not fit :( ')
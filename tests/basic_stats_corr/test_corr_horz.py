@@ -0,0 +1,53 @@
+'''
+TITLE:     test_corr_horz.py
+TASK_TYPE: test
+PURPOSE:   Check correlation coefficients between pairs of soundings (used to
+           estimate the horizontal correlation structure)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.basic_stats.corr_horz as corr_horz
+
+
+#%% Small case by hand: B = 2A and C = -A (4 depth bins in common)
+resampled = pd.DataFrame({'mean' : [1, 1, 1, 1, np.nan],
+                          'stdv' : [1, 1, 1, 1, np.nan],
+                          'A' : [1, 2, 3, 4, 5], 'B' : [2, 4, 6, 8, 10],
+                          'C' : [-1, -2, -3, -4, 0]})
+pairs = pd.DataFrame({'A' : ['A', 'A', 'B', 'A'], 'B' : ['B', 'C', 'C', 'A'],
+                      'dist' : [1, 2, 3, 0], 'angl' : 0})
+
+coeffs = corr_horz.calc_coeffs(pairs, resampled, min_pts = 2)
+
+# Average of products over n, divided by standard deviations with n - 1
+assert np.allclose(coeffs['corr_coeff'], [0.75, -0.75, -0.75, 0.75])
+assert np.array_equal(coeffs['num_pts'], [4, 4, 4, 4])
+assert np.isnan(corr_horz.calc_coeffs(pairs, resampled, 4)['corr_coeff']).all()
+print('Hand-computed coefficients are OK :)')
+
+
+#%% Random case: same as computing each pair on its own (with missing data)
+rng = np.random.default_rng(3)
+names = ['S' + str(k) for k in range(8)]
+resampled = pd.DataFrame(rng.normal(5, 2, (30, 8)), columns = names)
+resampled = resampled.mask(rng.random((30, 8)) < 0.2)
+resampled['mean'] = resampled[names].mean(axis = 1)
+resampled['stdv'] = resampled[names].std(axis = 1)
+resampled.loc[[4, 17], 'stdv'] = np.nan
+
+iA, iB = np.triu_indices(8, 1)
+pairs = pd.DataFrame({'A' : np.array(names)[iA], 'B' : np.array(names)[iB],
+                      'dist' : rng.uniform(0, 100, len(iA)), 'angl' : 0})
+
+coeffs = corr_horz.calc_coeffs(pairs, resampled, min_pts = 5)
+
+for k, (a, b) in enumerate(zip(pairs['A'], pairs['B'])):
+    pair = resampled[['mean', 'stdv', a, b]].dropna()
+    vA, vB = pair[a].values, pair[b].values
+    ref = np.mean((vA - vA.mean()) * (vB - vB.mean())) / \
+          (np.std(vA, ddof = 1) * np.std(vB, ddof = 1))
+    assert coeffs['num_pts'][k] == len(pair)
+    assert np.isclose(coeffs['corr_coeff'][k], ref)
+
+print('Coefficients match pair by pair calculations :)')
@@ -0,0 +1,95 @@
+'''
+TITLE:     test_corr_vert.py
+TASK_TYPE: test
+PURPOSE:   Check estimators of vertical correlation structure: FFT-based lag sums
+           and global correlation function from binned statistics
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.basic_stats.corr_vert as corr_vert
+
+
+#%% Equispaced data: lag sums from FFT are the sums of diagonals of R * R.T
+data = np.random.default_rng(1).normal(3, 1, 200)
+R = data.reshape(-1, 1) - np.mean(data)
+M = R * R.T / np.std(data)**2
+
+lag, rho, nonavg_rho = corr_vert.corr_fun_equisp(data, np.mean(data),
+                                                 np.std(data))
+
+assert np.allclose(nonavg_rho, [np.sum(np.diag(M, k = j)) for j in lag])
+assert np.allclose(rho, nonavg_rho / (len(data) - lag))
+print('Equispaced correlation function is OK :)')
+
+
+#%% Many processes: global function from binned sums and counts is the same as
+#   binning all the coefficients together, and doesn't depend on nworkers
+rng = np.random.default_rng(2)
+df = pd.concat([pd.DataFrame({'name'  : 'CPT' + str(k),
+                              'depth' : np.sort(rng.uniform(0, 5 + 2 * k, 50)),
+                              'qc'    : rng.lognormal(0, 1, 50)})
+                for k in range(8)])
+
+opts = {'intv' : 0.5, 'min_pts' : 10}
+coeffs, local_funs, glob_fun = corr_vert.many_corr_fun_nonequisp(
+    df, 'depth', 'qc', 'name', logT = True, fun_opts = opts, nworkers = 2,
+    cache = False)
+
+check = corr_vert.corr_fun_nonequisp(coeffs['sep_dist'].values,
+                                     coeffs['corr_coeff'].values, **opts)
+assert np.allclose(glob_fun.values, check.values, equal_nan = True)
+
+_, _, serial_fun = corr_vert.many_corr_fun_nonequisp(
+    df, 'depth', 'qc', 'name', logT = True, fun_opts = opts, nworkers = 1,
+    cache = False)
+assert np.allclose(glob_fun.values, serial_fun.values, equal_nan = True)
+print('Global correlation function from binned statistics is OK :)')
+
+
+#%% Cache is optional and bounded: re-runs give the same result, and only the
+#   most recently used processes are kept
+corr_vert.CORR_CACHE.clear()
+corr_vert.CORR_CACHE_SIZE = 5
+runs = [corr_vert.many_corr_fun_nonequisp(df, 'depth', 'qc', 'name', logT = True,
+                                          fun_opts = opts, nworkers = 1,
+                                          cache = True)[2] for _ in range(2)]
+
+assert len(corr_vert.CORR_CACHE) == 5
+assert np.allclose(runs[0].values, glob_fun.values, equal_nan = True)
+assert np.allclose(runs[1].values, glob_fun.values, equal_nan = True)
+corr_vert.CORR_CACHE.clear()
+print('Cache is bounded :)')
+
+
+#%% Fits of each process are the same as fitting each process on its own, and
+#   cached results depend on the fits that were requested
+fits = {'markov' : 1.0}
+_, local_funs, _ = corr_vert.many_corr_fun_nonequisp(
+    df, 'depth', 'qc', 'name', logT = True, fun_opts = opts, fits = fits,
+    nworkers = 1, cache = False)
+
+for name, data in df.groupby('name'):
+    dist, coeff = corr_vert.corr_coeffs_1D(data['depth'].values,
+                                           np.log(data['qc'].values))
+    fun = corr_vert.corr_fun_nonequisp(dist, coeff, **opts).dropna()
+    theta = corr_vert.markov_fun(fun['dist_mid'].values, fun['corr_fun'].values,
+                                 fits['markov'])[0]
+    local = local_funs.loc[local_funs['name'] == name, 'theta_markov']
+    assert np.allclose(local, theta)
+
+corr_vert.CORR_CACHE.clear()
+corr_vert.CORR_CACHE_SIZE = 64
+runs = [corr_vert.many_corr_fun_nonequisp(df, 'depth', 'qc', 'name',
+                                          logT = True, fun_opts = opts,
+                                          fits = f, nworkers = 1,
+                                          cache = True)[1]
+        for f in [fits, {'gaussian' : 1.0}, {}]]
+
+assert 'theta_markov' in runs[0] and 'theta_gaussian' not in runs[0]
+assert 'theta_gaussian' in runs[1] and 'theta_markov' not in runs[1]
+assert not any(c.startswith('theta_') for c in runs[2])
+assert np.allclose(runs[0]['theta_markov'], local_funs['theta_markov'])
+assert len(corr_vert.CORR_CACHE) == 3 * df['name'].nunique()
+corr_vert.CORR_CACHE.clear()
+print('Fits of each process are OK (and cached by fit) :)')
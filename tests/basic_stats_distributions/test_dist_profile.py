@@ -0,0 +1,54 @@
+'''
+TITLE:     test_dist_profile.py
+TASK_TYPE: test
+PURPOSE:   Check distributions fitted to depth bins of a profile (dist_profile)
+'''
+#%% Import modules
+import numpy as np
+import scipy.stats as stats
+import llgeo.basic_stats.distributions as llgeo_dist
+
+
+#%% Small case by hand: 3 bins of 1 m, the last one with too few points
+depth  = np.array([0.0, 0.2, 0.5, 0.9, 1.0, 1.5, 1.8, 2.5, 3.0])
+values = np.array([1.0, 2.0, 3.0, 6.0, 4.0, 4.0, 7.0, 9.0, 9.0])
+
+profile, bins = llgeo_dist.dist_profile(depth, values, 'norm', intv = 1,
+                                        min_pts = 3, perc = [0.5])
+
+# Bin 0: [1, 2, 3, 6] -> mean 3, MLE stdv sqrt(3.5) | Bin 1: [4, 4, 7] -> 5, sqrt(2)
+assert np.array_equal(profile['num_pts'], [4, 3, 1])
+assert np.allclose(profile['norm_mean'], [3, 5, np.nan], equal_nan = True)
+assert np.allclose(profile['norm_stdv'], [3.5**.5, 2**.5, np.nan],
+                   equal_nan = True)
+assert np.allclose(profile['norm_perc_50'], [3, 5, np.nan], equal_nan = True)
+assert np.array_equal(profile['bin'], [1, 2, 0])
+assert np.array_equal(bins, [1, 1, 1, 1, 2, 2, 2, 0, 0])   # 3.0 is past the edges
+print('Hand-computed profile is OK :)')
+
+
+#%% Random lognormal profile: each bin matches scipy / lognorm_MLE on its own
+rng = np.random.default_rng(5)
+depth  = rng.uniform(0, 20, 2000)
+values = rng.lognormal(np.log(100 + 5 * depth), 0.3)
+perc = [0.1, 0.5, 0.9]
+
+profile, bins = llgeo_dist.dist_profile(depth, values, 'lognorm', intv = 2,
+                                        min_pts = 10, perc = perc,
+                                        depth_lims = [0, 20])
+
+for _, row in profile.iterrows():
+    x = values[(depth >= row['from']) & (depth < row['to'])]
+    mu_lnx, std_lnx = llgeo_dist.lognorm_MLE(x)
+    mu_x, std_x = llgeo_dist.lognorm_to_norm(mu_lnx, std_lnx)
+    ppf = stats.lognorm.ppf(perc, s = std_lnx, scale = np.exp(mu_lnx))
+
+    assert row['num_pts'] == len(x)
+    assert np.isclose(row['avg'], np.mean(x))
+    assert np.allclose(row[['lognorm_mean_lnx', 'lognorm_stdv_lnx']],
+                       [mu_lnx, std_lnx])
+    assert np.allclose(row[['lognorm_mean', 'lognorm_stdv']], [mu_x, std_x])
+    assert np.allclose(row[['lognorm_perc_10', 'lognorm_perc_50',
+                            'lognorm_perc_90']].astype(float), ppf)
+
+print('Lognormal profile matches bin by bin fits :)')
@@ -0,0 +1,48 @@
+'''
+TITLE:     test_group_fits.py
+TASK_TYPE: test
+PURPOSE:   Check distributions fitted to many groups at once (get_group_fits)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+import llgeo.basic_stats.distributions as llgeo_dist
+
+
+#%% Small case by hand: lognormal MLE and normal MLE of two groups
+df = pd.DataFrame({'layer' : ['b', 'a', 'b', 'a', 'a', 'b'],
+                   'vs'    : [np.e, 1.0, np.e**3, np.e**2, np.e**3, np.nan]})
+fits = llgeo_dist.get_group_fits(df, 'vs', 'layer', nworkers = 1)
+
+# a: ln(x) = [0, 2, 3] -> mean 5/3 | b: ln(x) = [1, 3] -> mean 2, stdv 1
+assert list(fits.index) == ['a', 'b']
+assert np.array_equal(fits['num_pts'], [3, 2])
+assert np.allclose(fits['MLE_mu_lnx'], [5/3, 2])
+assert np.allclose(fits['MLE_stdv_lnx'], [np.std([0, 2, 3]), 1])
+assert np.allclose(fits['norm_mu'], [np.mean([1, np.e**2, np.e**3]),
+                                     np.mean([np.e, np.e**3])])
+print('Hand-computed fits are OK :)')
+
+
+#%% Random groups: same as get_all_fits and scipy's K-S test on each group
+rng = np.random.default_rng(6)
+df = pd.DataFrame({'site' : rng.integers(0, 6, 600)})
+df['vs'] = rng.lognormal(np.log(150 + 20 * df['site']), 0.25)
+
+fits = llgeo_dist.get_group_fits(df, 'vs', 'site', nworkers = 1)
+
+for site, x in df.groupby('site')['vs']:
+    ref = llgeo_dist.get_all_fits(x.values).iloc[0]
+    assert fits.loc[site, 'num_pts'] == len(x)
+    assert np.allclose(fits.loc[site, ref.index].astype(float), ref, rtol = 1e-6)
+
+    mu, std = fits.loc[site, ['MLE_mu_lnx', 'MLE_stdv_lnx']]
+    ks = stats.kstest(np.log(x.values), 'norm', args = (mu, std))
+    assert np.isclose(fits.loc[site, 'ks_MLE'], ks.statistic)
+    assert np.isclose(fits.loc[site, 'ks_p_MLE'], ks.pvalue)
+
+    ks = stats.kstest(x.values, 'norm', args = (np.mean(x), np.std(x)))
+    assert np.isclose(fits.loc[site, 'ks_norm'], ks.statistic)
+
+print('Group fits match group by group calculations :)')
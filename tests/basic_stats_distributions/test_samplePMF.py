@@ -11,7 +11,7 @@ pmf = [0.1, 0.2, 0.7] # probability mass function
 x   = np.arange(len(pmf))
 
 # Sample from distribution many times
-sim = llgeo_dist.sample_PMF(5000, x, pmf)
+sim = llgeo_dist.sample_PMF(5000, pmf, x)
 sim_x, sim_pmf = np.unique(sim, return_counts = True)
 sim_pmf = sim_pmf / len(sim)
 
@@ -22,4 +22,28 @@ ax.bar(sim_x, sim_pmf, color= 'r', label = 'simulated', alpha = 0.4)
 ax.legend()
 
 
+#%% Reusable sampler: large batches recover the PMF (round-off in sum is OK)
+pmf = np.full(10, 0.1) # adds up to 0.9999999999999999
+sampler = llgeo_dist.get_sampler(pmf)
+sim = llgeo_dist.draw_samples(sampler, 10**6, np.random.default_rng(0))
+
+assert np.allclose(np.bincount(sim.astype(int)) / len(sim), pmf, atol = 0.002)
+print('Sampler recovers the PMF :)')
+
+
+#%% CDF ends at exactly 1, even if cumsum / sum rounds below it, so that U
+#   close to 1 is mapped to the last value (and not out of bounds)
+from types import SimpleNamespace
+
+pmf = np.full(10, 0.1)
+assert np.cumsum(pmf)[-1] / np.sum(pmf) < 1
+assert llgeo_dist.get_sampler(pmf)['cdf'][-1] == 1
+
+U_max = SimpleNamespace(random = lambda n: np.full(n, np.nextafter(1, 0)))
+old_sampler = {'cdf' : np.cumsum(pmf) / np.sum(pmf), 'x' : np.arange(10)}
+assert np.all(llgeo_dist.draw_samples(sampler, 5, U_max) == 9)
+assert np.all(llgeo_dist.draw_samples(old_sampler, 5, U_max) == 9)
+print('Sampler handles round-off in the CDF :)')
+
+
 # %%
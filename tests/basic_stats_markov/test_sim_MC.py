@@ -0,0 +1,43 @@
+'''
+TITLE:     test_sim_MC.py
+TASK_TYPE: test
+PURPOSE:   Check simulation of Markov chains (sim_MC)
+'''
+#%% Import modules
+import numpy as np
+import llgeo.basic_stats.markov_chains as llgeo_MC
+
+
+#%% Deterministic transitions give the hand-computed chain
+P = np.array([[0, 1, 0], [0, 0, 1], [1, 0, 0]])
+I = np.array([0, 1, 0])
+xs = llgeo_MC.sim_MC(3, 7, P, I, seed = 0)
+
+for x in xs:
+    assert np.array_equal(x, [1, 2, 0, 1, 2, 0, 1])
+
+print('Deterministic chain is OK :)')
+
+
+#%% State frequencies approach the stationary distribution
+P = np.array([[0.9, 0.1], [0.3, 0.7]])     # stationary pi = [0.75, 0.25]
+I = np.array([0.5, 0.5])
+xs = np.array(llgeo_MC.sim_MC(2000, 200, P, I, seed = 1))
+
+assert abs(np.mean(xs[:, 50:] == 0) - 0.75) < 0.01
+assert abs(np.mean(xs[:, 0] == 0) - 0.5) < 0.05
+
+print('Stationary distribution is OK :)')
+
+
+#%% Without a seed, np.random.seed makes results reproducible
+np.random.seed(3)
+xs1 = llgeo_MC.sim_MC(5, 20, P, I)
+np.random.seed(3)
+xs2 = llgeo_MC.sim_MC(5, 20, P, I)
+xs3 = llgeo_MC.sim_MC(5, 20, P, I)
+
+assert all(np.array_equal(a, b) for a, b in zip(xs1, xs2))
+assert not all(np.array_equal(a, b) for a, b in zip(xs1, xs3))
+
+print('Global seed is used :)')
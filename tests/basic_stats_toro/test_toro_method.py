@@ -0,0 +1,81 @@
+'''
+TITLE:     test_toro_method.py
+TASK_TYPE: test
+PURPOSE:   Check pairing of adjacent Vs layers and interlayer correlations
+           (Toro's method)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.basic_stats.toro_method as toro
+
+
+#%% Small case by hand: pairs within each sounding (B is not sorted by depth)
+all_data = pd.DataFrame({'name'  : ['A', 'A', 'A', 'A', 'B', 'B', 'B'],
+                         'depth' : [1.0, 2.0, 3.0, 5.0, 2.5, 0.5, 1.5],
+                         'vs'    : [100, 110, 130, 150, 220, 200, 210]})
+
+paired = toro.get_paired_data(all_data, dintv_max = 1)
+
+# A: (1, 2), (2, 3), but not (3, 5) | B: (0.5, 1.5), (1.5, 2.5)
+# Pairs are in the original row order of their deeper measurement
+assert np.allclose(paired['mid_depth'], [1.5, 2.5, 2.0, 1.0])
+assert np.allclose(paired['prev_vs'], [100, 110, 210, 200])
+assert np.allclose(paired['next_vs'], [110, 130, 220, 210])
+assert np.allclose(all_data['dintv'], [np.nan, 1, 1, 2, 1, np.nan, 1],
+                   equal_nan = True)
+print('Paired data is OK :)')
+
+
+#%% Interlayer correlations are np.corrcoef of the pairs in each depth bin
+rng = np.random.default_rng(4)
+all_data = pd.concat([pd.DataFrame({'name' : 'SCPT' + str(k),
+                                    'depth' : np.arange(0.5, 20, 1.0),
+                                    'vs' : 150 + 8 * np.arange(0.5, 20, 1.0) +
+                                           np.cumsum(rng.normal(0, 15, 20))})
+                      for k in range(30)], ignore_index = True)
+dbin_edges = np.array([0, 5, 10, 15, 25])
+
+paired, IL = toro.get_IL_corr(all_data, dbin_edges, dintv_max = 1, min_pts = 10)
+
+for k, (d_from, d_to) in enumerate(zip(dbin_edges[:-1], dbin_edges[1:])):
+    mask = (paired['mid_depth'] >= d_from) & (paired['mid_depth'] < d_to)
+    ref = np.corrcoef(paired.loc[mask, 'prev_vs'], paired.loc[mask, 'next_vs'])
+    assert IL['num_pts'][k] == mask.sum()
+    assert np.isclose(IL['IL_corr_coeff'][k], ref[0, 1])
+
+# Bins with less than min_pts don't report correlations
+_, IL = toro.get_IL_corr(all_data, dbin_edges, dintv_max = 1, min_pts = 200)
+assert np.array_equal(np.isnan(IL['IL_corr_coeff']), IL['num_pts'] < 200)
+print('Interlayer correlations are OK :)')
+
+
+#%% Batched realizations: same as a per-layer loop with the same random draws
+u_lnvs = np.log(150 + 10 * np.arange(12))
+rho = np.linspace(0.9, 0.5, 11)
+sigma = 0.3
+
+Z, Vs = toro.gen_toro_realizations(u_lnvs, rho, sigma, 50, seed = 9)
+eps = np.random.default_rng(9).standard_normal((50, 12))
+
+for k in range(50):
+    z = [eps[k, 0]]
+    for i in range(11):
+        z += [rho[i] * z[i] + eps[k, i + 1] * np.sqrt(1 - rho[i]**2)]
+    assert np.allclose(Z[k], z)
+    assert np.allclose(Vs[k], np.exp(u_lnvs + np.array(z) * sigma))
+
+Z2, _ = toro.gen_toro_realizations(u_lnvs, rho, sigma, 50, seed = 9)
+assert np.array_equal(Z, Z2)
+print('Batched recurrence matches the per-layer loop :)')
+
+
+#%% Many realizations: mean and stdv of ln(Vs), and interlayer correlations
+_, Vs = toro.gen_toro_realizations(u_lnvs, rho, sigma, 100000, seed = 10)
+lnvs = np.log(Vs)
+corr = [np.corrcoef(lnvs[:, i], lnvs[:, i + 1])[0, 1] for i in range(11)]
+
+assert np.allclose(lnvs.mean(axis = 0), u_lnvs, atol = 0.005)
+assert np.allclose(lnvs.std(axis = 0), sigma, atol = 0.005)
+assert np.allclose(corr, rho, atol = 0.01)
+print('Realizations have the input statistics :)')
@@ -0,0 +1,92 @@
+'''
+TITLE:     test_cpt_batch.py
+TASK_TYPE: test
+PURPOSE:   Check batch interpretation of a directory of CPT files against the
+           interpretation of each sounding on its own
+'''
+#%% Import modules
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import llgeo.cpt_interp.cpt_interp as cpt_interp
+import llgeo.cpt_interp.cpt_batch as cpt_batch
+
+# Synthetic soundings (kPa, kN/m3, m) with numeric-looking names
+Pa, Ww, a, A = 101.325, 9.81, 0.8, 0.0
+WTDs = {'001' : 1.0, '002' : 2.5, '010' : 0.5}
+
+rng  = np.random.default_rng(1)
+path = tempfile.mkdtemp() + '/'
+for i, name in enumerate(WTDs):
+    d  = np.arange(0.1, 6 + 2 * i, 0.05)
+    qc = 2000 + 500 * d + rng.normal(0, 300, len(d)).clip(-1500)
+    fs = 20 + 5 * d + rng.normal(0, 5, len(d)).clip(-15)
+    u2 = Ww * np.maximum(d - WTDs[name], 0)
+    pd.DataFrame({'d' : d, 'qc' : qc, 'fs' : fs, 'u2' : u2}).to_csv(
+                  path + name + '.csv', index = False)
+
+
+#%% Batch results match each sounding interpreted on its own
+results = cpt_batch.interp_cpt_dir(path, Pa, Ww, WTDs, a, A, nworkers = 1,
+                                   chunk = 2)
+
+assert list(results['name'].unique()) == ['001', '002', '010']
+for name, data in cpt_batch.iter_cpt_dir(path):
+    batch = results.loc[results['name'] == name].reset_index(drop = True)
+    ref   = cpt_interp.robertson2015_interp(data['d'].values, data['qc'].values,
+                                            data['fs'].values, data['u2'].values,
+                                            Pa, Ww, WTDs[name], a, A)
+    assert np.allclose(batch[list(data)].values, data.values)
+    for col in ref:
+        assert np.allclose(batch[col].values.astype(float),
+                           ref[col].values.astype(float), equal_nan = True), col
+
+print('Batch results match single soundings :)')
+
+
+#%% Parquet output (needs pyarrow): names stay strings, re-runs are refused
+out_path = tempfile.mkdtemp() + '/out/'
+try:
+    import pyarrow
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+if has_pyarrow:
+    cpt_batch.interp_cpt_dir(path, Pa, Ww, WTDs, a, A, nworkers = 1,
+                             chunk = 2, out_path = out_path)
+    read = cpt_batch.read_cpt_parquet(out_path, columns = ['d', 'Qtn'],
+                                      names = ['001', '010'])
+    assert sorted(read['name'].unique()) == ['001', '010']
+    assert len(read) == (results['name'].isin(['001', '010'])).sum()
+
+    try:
+        cpt_batch.interp_cpt_dir(path, Pa, Ww, WTDs, a, A, nworkers = 1,
+                                 out_path = out_path)
+        raise AssertionError('re-run into the same out_path should raise')
+    except Exception as e:
+        assert 'not empty' in str(e)
+    print('Parquet output is OK :)')
+
+else:
+    try:
+        cpt_batch.interp_cpt_dir(path, Pa, Ww, WTDs, a, A, nworkers = 1,
+                                 out_path = out_path)
+        raise AssertionError('missing pyarrow should raise')
+    except Exception as e:
+        assert 'pyarrow' in str(e)
+    assert not os.path.exists(out_path)
+    print('Missing pyarrow is reported before interpreting :)')
+
+
+#%% Non-empty output directories are refused
+os.makedirs(out_path, exist_ok = True)
+open(out_path + 'old.parquet', 'w').close()
+try:
+    cpt_batch.check_out_path(out_path)
+    raise AssertionError('non-empty out_path should raise')
+except Exception as e:
+    assert 'not empty' in str(e)
+
+print('Non-empty output directories are refused :)')
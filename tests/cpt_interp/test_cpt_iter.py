@@ -0,0 +1,82 @@
+'''
+TITLE:     test_cpt_iter.py
+TASK_TYPE: test
+PURPOSE:   Check the vectorized iterative calculations of robertson2015_interp
+           against a reading-by-reading reference (including readings that
+           never converge)
+'''
+#%% Import modules
+import numpy as np
+import llgeo.cpt_interp.cpt_interp as cpt_interp
+
+def Ws_ref(Ic):
+    ''' Unit weight from Ic, one reading at a time '''
+    Ws = 19
+    if 0.00<Ic<=1.31: Ws = 20
+    if 1.31<Ic<=2.05: Ws = 19
+    if 2.04<Ic<=2.30: Ws = 18.5
+    if 2.30<Ic<=2.60: Ws = 18.0
+    if 2.60<Ic<=2.95: Ws = 17.5
+    if 2.95<Ic<=3.60: Ws = 16.6
+    if 3.60<Ic<=6.00: Ws = 11.0
+    return Ws
+
+def iter_ref(d_arr, qt_arr, fs_arr, WTD, Ww, Pa):
+    ''' Iterative calculations (Pg.108), one reading at a time. Also returns
+        the number of readings that reached the iteration limit '''
+    out = np.empty((9, len(d_arr)))
+    delta_arr = np.append(d_arr[0], d_arr[1:] - d_arr[:-1])
+    s_tot = s_eff = 1e-5
+    n_stuck = 0
+
+    for i, (d, qt, fs, delta) in enumerate(zip(d_arr, qt_arr, fs_arr, delta_arr)):
+        n_new = diff = e = 1
+        u = max(0, Ww * (d - WTD))
+        while (diff > 0.01) & (e < 5000):
+            e     += 1
+            n      = n_new
+            qn     = max(0.01, qt - s_tot)
+            Fr     = 100 * fs / qn
+            Qtn    = qn / Pa * (Pa / s_eff)**n
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                Ic = ((3.47 - np.log(Qtn))**2 + (1.22 + np.log(Fr))**2)**0.5
+            n_new  = max(0, min(1, 0.381 * Ic + 0.05 * (s_eff / Pa) - 0.15))
+            Ws     = Ws_ref(Ic)
+            s_temp = s_tot + delta * Ws
+            s_eff  = s_temp - u
+            diff   = np.abs(n - n_new)
+        n_stuck += (e == 5000)
+        s_tot = s_temp
+        out[:, i] = [Ws, s_tot, u, s_eff, Ic, n, Fr, qn, Qtn]
+
+    return out, n_stuck
+
+# Random soundings (kPa, kN/m3, m), some with odd readings (fs = 0, qc ~ 0)
+Pa, Ww, a, A = 101.3, 9.81, 0.8, 0.015
+rng = np.random.default_rng(0)
+snds = []
+for k in range(12):
+    n  = rng.integers(50, 300)
+    d  = np.cumsum(rng.uniform(0.02, 0.05, n))
+    qc = rng.lognormal(8, 1, n)
+    fs = rng.lognormal(3.5, 1, n)
+    u2 = rng.uniform(-20, 300, n)
+    if k % 4 == 0: fs[3] = 0; qc[5] = 1
+    snds += [(d, qc, fs, u2, rng.uniform(-3, 5))]
+
+
+#%% Vectorized calculations match the reading-by-reading reference exactly
+d, qc, fs, u2, WTD = [list(x) for x in zip(*snds)]
+results = cpt_interp.robertson2015_interp_many(d, qc, fs, u2, Pa, Ww, WTD, a, A)
+
+n_stuck = 0
+for j, res in enumerate(results):
+    qt = qc[j] + u2[j] * (1 - a)
+    ref, stuck = iter_ref(d[j], qt, fs[j], WTD[j], Ww, Pa)
+    n_stuck += stuck
+
+    ref = cpt_interp.interp_results(qt, fs[j], u2[j], Pa, A, tuple(ref))
+    assert res.equals(ref), 'sounding {:d} is different'.format(j)
+
+assert n_stuck > 0     # make sure that non-converging readings are checked
+print('Vectorized results are identical ({:d} stuck readings) :)'.format(n_stuck))
@@ -0,0 +1,59 @@
+'''
+TITLE:     test_import_time.py
+TASK_TYPE: test
+PURPOSE:   Check that compute modules import quickly (they are imported by every
+           worker process), and that they don't load plotting or profiling
+           packages, or change matplotlib's global style
+'''
+#%% Import modules
+import subprocess
+import sys
+
+# Modules to check, and packages that should only be loaded when needed
+modules = ['llgeo.cpt_interp.cpt_interp',
+           'llgeo.cpt_interp.cpt_batch',
+           'llgeo.quad4m.plots_checks',
+           'llgeo.quad4m.runQ4Ms']
+lazy = ['matplotlib', 'seaborn', 'memory_profiler']
+
+# Each module is imported in a fresh interpreter, after numpy and pandas (which
+# are needed for the computations anyway), and only its own cost is measured
+code = '''
+import sys, time
+import numpy, pandas
+t = time.perf_counter()
+import {:s}
+print(time.perf_counter() - t)
+print(','.join(m for m in {:s} if m in sys.modules))
+'''
+
+
+#%% Import time (best of 3, to avoid noise from a cold disk cache)
+# Target is well under 100 ms (a few ms here); lazy imports are also checked
+# through sys.modules, in case a slow machine needs a looser bound
+for module in modules:
+    times = []
+    for _ in range(3):
+        out = subprocess.run([sys.executable, '-c', code.format(module, str(lazy))],
+                             capture_output = True, text = True, check = True)
+        dt, loaded = out.stdout.split('\n')[:2]
+        times += [float(dt)]
+
+    print('{:s}: {:.3f} s'.format(module, min(times)))
+    assert min(times) < 0.1, module + ' takes {:.3f} s to import'.format(min(times))
+    assert loaded == '', module + ' loads ' + loaded + ' at import'
+
+print('Compute modules import quickly :)')
+
+
+#%% No global styling: matplotlib's rcParams are the same after import
+code = '''
+import matplotlib as mpl
+before = dict(mpl.rcParams)
+import llgeo.cpt_interp.cpt_interp
+print(dict(mpl.rcParams) == before)
+'''
+out = subprocess.run([sys.executable, '-c', code], capture_output = True,
+                     text = True, check = True)
+assert out.stdout.strip() == 'True'
+print('No global styling at import :)')
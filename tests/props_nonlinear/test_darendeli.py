@@ -13,6 +13,22 @@ import llgeo.props_nonlinear.darendeli_2011 as daren
 
 
 
+# ------------------------------------------------------------------------------
+# Check that curves for arrays of soil states match the scalar ones
+# ------------------------------------------------------------------------------
+gam = np.logspace(-4, 0, 45)
+PIs = np.array([0, 15, 30, 60])
+OCRs = np.array([1, 1, 2, 4])
+sigs = np.array([0.25, 1, 2, 4])
+
+G_many, D_many = daren.curves(gam, PIs, OCRs, sigs)
+
+for i, (PI, OCR, sig) in enumerate(zip(PIs, OCRs, sigs)):
+    G_one, D_one = daren.curves(gam, PI, OCR, sig)
+    assert np.allclose(G_one, G_many[i]) and np.allclose(D_one, D_many[i])
+
+print('Vectorized curves match scalar curves :)')
+
 # ------------------------------------------------------------------------------
 # Compare against paper figures
 # ------------------------------------------------------------------------------
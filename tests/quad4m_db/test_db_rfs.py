@@ -0,0 +1,60 @@
+'''
+TITLE:     test_db_rfs.py
+TASK_TYPE: test
+PURPOSE:   Check the random field "database" (update_db_rfs and read_rfs)
+'''
+#%% Import modules
+import tempfile
+import numpy as np
+import llgeo.quad4m.db_utils as q4m_db
+import llgeo.rand_fields.parallel as llgeo_rfs
+
+path_db = tempfile.mkdtemp() + '/'
+params  = {'fnc' : 'dlavx2', 'n1' : 24, 'n2' : 8, 'xl' : 48, 'yl' : 8,
+           'zm' : 0, 'pa' : 1, 'thx' : 10, 'thy' : 2, 'seed' : 7, 'block' : 5}
+
+
+#%% New fields are the same as those generated directly (and are stored)
+db_rfs, Zs = q4m_db.update_db_rfs(path_db, 'db_rfs.pkl', params, 10,
+                                  nworkers = 1)
+ref = llgeo_rfs.sim2d_parallel(24, 8, 48, 8, 0, 1, 10, 2, 'dlavx2', 1, 0, 10,
+                               'rfs.stats', 7, nworkers = 1, block = 5)
+
+assert isinstance(Zs, np.memmap) and Zs.shape == (10, 24, 8)
+assert np.array_equal(Zs, ref)
+assert np.array_equal(q4m_db.read_rfs(path_db, db_rfs['fname'].iloc[0]), ref)
+assert len(db_rfs) == 1 and db_rfs['nsims'].iloc[0] == 10
+print('New random fields are stored :)')
+
+
+#%% Existing entries are re-used (fewer realizations are read, not generated)
+db_rfs, Zs = q4m_db.update_db_rfs(path_db, 'db_rfs.pkl', params, 4)
+assert len(db_rfs) == 1 and np.array_equal(Zs, ref[:4])
+
+# More realizations replace the entry (same first ones, since block divides 10)
+# in a new file, so arrays from earlier calls still read the old one
+Zs_old = Zs
+old_fname = db_rfs['fname'].iloc[0]
+db_rfs, Zs = q4m_db.update_db_rfs(path_db, 'db_rfs.pkl', params, 15,
+                                  nworkers = 1)
+assert len(db_rfs) == 1 and db_rfs['nsims'].iloc[0] == 15
+assert db_rfs['fname'].iloc[0] != old_fname
+assert np.array_equal(Zs[:10], ref)
+assert np.array_equal(Zs_old, ref[:4])
+assert np.array_equal(q4m_db.read_rfs(path_db, old_fname), ref)
+
+# Other parameters make a new entry
+db_rfs, Zs = q4m_db.update_db_rfs(path_db, 'db_rfs.pkl', dict(params, seed = 8),
+                                  5, nworkers = 1)
+assert len(db_rfs) == 2 and not np.array_equal(Zs, ref[:5])
+print('Database entries are re-used :)')
+
+
+#%% Missing parameters raise an error
+try:
+    q4m_db.update_db_rfs(path_db, 'db_rfs.pkl', {'fnc' : 'dlavx2'}, 5)
+    raise AssertionError('missing parameters should raise an error')
+except Exception as e:
+    assert 'Missing random field parameters' in str(e)
+
+print('Missing parameters are caught :)')
@@ -0,0 +1,41 @@
+'''
+TITLE:     test_condition_rf.py
+TASK_TYPE: test
+PURPOSE:   Check conditioning of random fields to measurements at soundings
+           (kriging weights and condition_rf)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.quad4m.props_elems as q4m_elems
+
+# Regular mesh of 20 x 8 elements (element numbers start at 1)
+xc, yc = np.meshgrid(np.arange(20) + 0.5, np.arange(8) + 0.5)
+elems = pd.DataFrame({'n' : np.arange(1, xc.size + 1), 'xc' : xc.ravel(),
+                      'yc' : yc.ravel()})
+elems['vs'] = np.random.default_rng(0).normal(0, 1, len(elems))
+
+obs_n = np.array([3, 45, 46, 120])
+obs_vals = np.array([1.5, -0.3, 0.2, 2.0])
+
+
+#%% Without nugget, the conditioned field honors the measurements
+weights = q4m_elems.get_krig_weights(elems, obs_n, 'dlavx2', 10, 2)
+elems = q4m_elems.condition_rf(elems, 'vs', obs_n, obs_vals, weights)
+
+vs = elems.set_index('n').loc[obs_n, 'vs'].values
+assert np.allclose(vs, obs_vals)
+print('Conditioned field honors measurements :)')
+
+
+#%% Element numbers that are not in elems raise an error
+for fun, args in [(q4m_elems.get_krig_weights, ('dlavx2', 10, 2)),
+                  (q4m_elems.condition_rf, ())]:
+    try:
+        if args: fun(elems, [3, 999], *args)
+        else:    fun(elems, 'vs', [3, 999], obs_vals[:2], weights[:, :2])
+        raise AssertionError('unknown element should raise an error')
+    except Exception as e:
+        assert 'not in elems' in str(e)
+
+print('Unknown elements are caught :)')
@@ -0,0 +1,35 @@
+'''
+TITLE:     test_rf_weights.py
+TASK_TYPE: test
+PURPOSE:   Check mapping of random fields onto meshes with interpolation weights
+           (get_rf_weights and map_rf)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.quad4m.props_elems as q4m_elems
+
+# Mesh of 8 x 5 elements (2 m wide, 3 m high)
+mesh = pd.DataFrame({'i': np.repeat(np.arange(1, 9), 5),
+                     'j': np.tile(np.arange(1, 6), 8)})
+mesh['w'] = 2.0; mesh['xc'] = (mesh['i'] - 0.5) * mesh['w']
+mesh['h'] = 3.0; mesh['yc'] = (mesh['j'] - 0.5) * mesh['h']
+
+
+#%% A linear field is recovered exactly by bilinear interpolation
+X, Y = np.meshgrid((np.arange(32) + 0.5) * 0.5, (np.arange(20) + 0.5) * 0.75,
+                   indexing = 'ij')
+W = q4m_elems.get_rf_weights(mesh, 16, 15, 32, 20, method = 'bilinear')
+mesh = q4m_elems.map_rf(mesh, 'lin', 3*X - 2*Y, weights = W)
+
+assert np.allclose(mesh['lin'], 3*mesh['xc'] - 2*mesh['yc'])
+print('Bilinear interpolation is OK :)')
+
+
+#%% Cell-averages of a 4x finer grid are the averages of each 4x4 block
+Zf = np.random.default_rng(0).random((32, 20))
+W = q4m_elems.get_rf_weights(mesh, 16, 15, 32, 20, method = 'average')
+mesh = q4m_elems.map_rf(mesh, 'avg', Zf, weights = W)
+
+assert np.allclose(mesh['avg'], Zf.reshape(8, 4, 5, 4).mean(axis = (1, 3)).ravel())
+print('Cell averages are OK :)')
@@ -0,0 +1,63 @@
+'''
+TITLE:     test_extract_results.py
+TASK_TYPE: test
+PURPOSE:   Check that extract_results (all extractions in a single pass over the
+           pickle files) gives the same outputs as the get_* functions
+'''
+#%% Import modules
+import tempfile
+import numpy as np
+import pandas as pd
+import llgeo.utilities.files as llgeo_fls
+import llgeo.quad4m.extract_results as q4m_ext
+
+# Made-up results and elements of 6 models with the same geometry
+rng = np.random.default_rng(0)
+nodes, elems_n = np.arange(1, 13), np.arange(1, 9)
+results, elems = [], []
+
+for k in range(6):
+    peak_acc = pd.DataFrame({'node_n' : nodes, 'x' : nodes % 4 * 1.0,
+                             'y' : nodes // 4 * 1.0,
+                             'x_acc' : rng.lognormal(-1, 0.3, len(nodes))})
+    peak_str = pd.DataFrame({'n' : elems_n, 'sigxy' : rng.uniform(1, 5, 8)})
+    results += [{'model' : 'model' + str(k), 'peak_acc' : peak_acc,
+                 'peak_str' : peak_str, 'run_success' : True}]
+    elems += [pd.DataFrame({'n' : elems_n, 'i' : elems_n % 2, 'j' : elems_n,
+                            'xc' : elems_n * 1.0, 'yc' : elems_n * 2.0,
+                            'sigma_v' : rng.uniform(10, 50, 8),
+                            'vs' : rng.uniform(100, 300, 8)})]
+
+
+#%% Single pass over files is the same as each get_* function
+with tempfile.TemporaryDirectory() as path:
+    path += '/'
+    result_files = ['result' + str(k) + '.pkl' for k in range(6)]
+    elem_files = ['elems' + str(k) + '.pkl' for k in range(6)]
+    for k in range(6):
+        llgeo_fls.save_pkl(path, result_files[k], results[k], True)
+        llgeo_fls.save_pkl(path, elem_files[k], elems[k], True)
+
+    karg_elem_prop = {'target_col' : 'i', 'target_val' : 1,
+                      'return_col' : 'vs', 'verbose' : False}
+    karg_peak_acc = {'keep_models' : False, 'verbose' : False}
+    karg_peak_csr = {'verbose' : False}
+
+    q4m_ext.extract_results(path, result_files, elem_files, path + 'out/',
+                            'test', 'test_extract_results.py',
+                            karg_elem_prop = karg_elem_prop,
+                            karg_peak_acc = karg_peak_acc,
+                            karg_peak_csr = karg_peak_csr)
+
+    vs  = llgeo_fls.read_pkl(path + 'out/', 'vs_test.pkl')['vs']
+    pga = llgeo_fls.read_pkl(path + 'out/', 'PGA_test.pkl')['peak_acc']
+    csr = llgeo_fls.read_pkl(path + 'out/', 'CSR_test.pkl')['peak_csr']
+
+names = [result['model'] for result in results]
+assert vs.equals(q4m_ext.get_elems_prop(elems, names, 'i', 1, 'vs',
+                                        verbose = False))
+assert pga.equals(q4m_ext.get_peak_acc(results, keep_models = False,
+                                       verbose = False))
+assert csr.equals(q4m_ext.get_peak_csr(results, elems, verbose = False))
+assert list(pga) == ['x', 'y', 'mean', 'stdv', 'min', 'max']
+print('Single-pass extraction is OK :)')
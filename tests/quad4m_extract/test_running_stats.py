@@ -0,0 +1,85 @@
+'''
+TITLE:     test_running_stats.py
+TASK_TYPE: test
+PURPOSE:   Check running statistics across models (used to extract results of
+           QUAD4M analyses without keeping every model in memory)
+'''
+#%% Import modules
+import numpy as np
+import pandas as pd
+import llgeo.quad4m.extract_results as q4m_ext
+
+# Peak accelerations of 50 models at 20 nodes (a few missing values)
+rng = np.random.default_rng(0)
+nodes = np.arange(1, 21)
+vals = rng.lognormal(-1, 0.4, (50, len(nodes)))
+vals[3, 5] = np.nan
+wide = pd.DataFrame(vals.T, index = nodes)
+
+
+#%% Summary statistics are the same as for the wide dataframe
+stats = q4m_ext.init_stats(nodes, nsample = 100, quantiles = [0.5])
+for v in vals:
+    q4m_ext.update_stats(stats, pd.Series(v, index = nodes))
+
+out = q4m_ext.stats_df(stats)
+assert np.allclose(out['mean'], wide.mean(axis = 1))
+assert np.allclose(out['stdv'], wide.std(axis = 1))
+assert np.allclose(out['min'],  wide.min(axis = 1))
+assert np.allclose(out['max'],  wide.max(axis = 1))
+assert np.allclose(out['p50'],  wide.median(axis = 1)) # reservoir has all
+print('Running statistics are OK :)')
+
+
+#%% Merging statistics from two workers is the same as one pass
+a = q4m_ext.init_stats(nodes)
+b = q4m_ext.init_stats(nodes)
+for k, v in enumerate(vals):
+    q4m_ext.update_stats(a if k < 20 else b, v)
+
+merged = q4m_ext.stats_df(q4m_ext.merge_stats(a, b))
+assert np.allclose(merged.values, out[['mean', 'stdv', 'min', 'max']].values)
+print('Merged statistics are OK :)')
+
+
+#%% Rows missing from a model are NaN, but new rows raise (instead of being lost)
+stats = q4m_ext.init_stats(nodes[:10])
+q4m_ext.update_stats(stats, pd.Series(vals[0, :5], index = nodes[:5]))
+assert np.all(stats['count'] == [1] * 5 + [0] * 5)
+
+try:
+    q4m_ext.update_stats(stats, pd.Series(vals[1], index = nodes))
+    raise AssertionError('rows not in stats should raise an error')
+except Exception as e:
+    assert 'not in the statistics' in str(e)
+print('Rows of each model are checked :)')
+
+
+#%% Histograms merge exactly, and give exceedance probabilities at bin edges
+edges = np.linspace(0, 2, 201)
+a = q4m_ext.init_stats(nodes, edges = edges)
+b = q4m_ext.init_stats(nodes, edges = edges)
+for k, v in enumerate(vals):
+    q4m_ext.update_stats(a if k < 20 else b, v)
+
+merged = q4m_ext.merge_stats(a, b)
+thresholds = edges[::20]
+P_exceed = q4m_ext.exceedance(merged, thresholds)
+P_check = [(wide > x).sum(axis = 1) / wide.notna().sum(axis = 1)
+           for x in thresholds]
+
+assert np.array_equal(merged['hist'].sum(axis = 1), wide.notna().sum(axis = 1))
+assert np.allclose(P_exceed.values, np.array(P_check).T)
+print('Exceedance probabilities are OK :)')
+
+
+#%% Values exactly on the edges count as not exceeding them
+on_edges = np.array([[0.0, 0.5, 0.5, 1.0, 2.0]]).T     # 1 row, 5 models
+stats = q4m_ext.init_stats([1], edges = np.array([0, 0.5, 1, 1.5, 2]))
+for v in on_edges:
+    q4m_ext.update_stats(stats, v)
+
+P_exceed = q4m_ext.exceedance(stats, [0, 0.5, 1, 2])
+assert np.allclose(P_exceed.values, [[4/5, 2/5, 1/5, 0]])
+assert stats['hist'][0, -1] == 0                  # edges[-1] is in the last bin
+print('Values on bin edges are OK :)')
@@ -35,6 +35,80 @@ soil_curves = [{'S_name' : 'Sand'               ,
 L = q4m_files.gen_dat(soil_curves, out_path = './', out_file = 'test.dat')
 
 
+#%% Curve lines should be fixed-width (8F10.4) and read back the same numbers
+
+for line in L[2].split('\r\n'):
+    assert len(line) == 80 or line == L[2].split('\r\n')[-1]
+
+vals = np.array([float(line[i:i+10]) for line in L[2].split('\r\n')
+                                     for i in range(0, len(line), 10)])
+
+assert np.allclose(vals, np.logspace(-4, 0), atol = 5e-5)
+print('Curve lines are fixed-width :)')
+
+
+#%% Fields that get wider when rounded are caught (also in the last line)
+import llgeo.utilities.formatters as fff
+
+for data in [[-9.9996e99, 1, 2], [1, 2, -9.9996e99]]:
+    try:
+        fff.fortran_lines(data, '2E10.3')
+        raise AssertionError('overflowing field should raise an error')
+    except Exception as e:
+        assert 'Digits > width' in str(e)
+
+print('Overflow in partial lines is caught :)')
+
+
+#%% Stage-level registry: shared curves, cached .dat lines, same files
+import tempfile
+import pandas as pd
+import llgeo.quad4m.props_elems as q4m_elems
+
+out_path = tempfile.mkdtemp() + '/'
+elems = pd.DataFrame({'PI'      : [0, 0, 15, 15, 0, 30],
+                      'OCR'     : [1, 1, 1, 1, 1, 2],
+                      'sigma_m' : [50e3, 50e3, 80e3, 80e3, 120e3, 80e3]})
+registry = {}
+
+# Elements with the same soil state share one registry entry
+_, curves, _ = q4m_elems.add_darendeli_curves(elems.copy(), registry = registry)
+assert len(curves) == 4 and len(registry) == 4
+entry = registry[curves[0]['S_key']]
+
+# Files with and without the registry are byte-identical
+_, plain, _ = q4m_elems.add_darendeli_curves(elems.copy())
+q4m_files.gen_dat(plain, out_path, 'plain.dat')
+q4m_files.gen_dat(curves, out_path, 'reg.dat', registry = registry)
+
+read = lambda f: open(out_path + f, 'rb').read()
+assert read('plain.dat') == read('reg.dat')
+assert all('dat_lines' in v for v in registry.values())
+
+# A second model re-uses the entries (one new state), and their .dat lines
+elems2 = elems.assign(sigma_m = [50e3, 50e3, 80e3, 80e3, 200e3, 80e3])
+_, curves2, _ = q4m_elems.add_darendeli_curves(elems2, registry = registry)
+assert len(registry) == 5 and registry[curves[0]['S_key']] is entry
+
+dat_curve_lines = q4m_files.dat_curve_lines
+calls = []
+def count_calls(soil, fmt):
+    calls.append(soil['S_key'])
+    return dat_curve_lines(soil, fmt)
+
+q4m_files.dat_curve_lines = count_calls
+try:
+    q4m_files.gen_dat(curves2, out_path, 'reg2.dat', registry = registry)
+finally:
+    q4m_files.dat_curve_lines = dat_curve_lines
+
+assert calls == [(0.0, 1.0, 200e3, False, False)]   # only the new state
+_, plain2, _ = q4m_elems.add_darendeli_curves(elems2.copy())
+q4m_files.gen_dat(plain2, out_path, 'plain2.dat')
+assert read('plain2.dat') == read('reg2.dat')
+print('Curve registry is OK :)')
+
+
 #%% Example that shouldn't work due to missing soil_curve data
 
 incomplete = [{'S_name' : 'Sand'                ,
@@ -0,0 +1,61 @@
+'''
+TITLE:     test_q4r_template.py
+TASK_TYPE: test
+PURPOSE:   Make sure that .q4r files generated from a template are the same as
+           those generated from scratch
+'''
+#%% Import modules
+import tempfile
+import numpy as np
+import pandas as pd
+import llgeo.quad4m.genfiles as q4m_files
+
+# Small mesh of 3 x 2 elements (4 x 3 nodes)
+nx, ny = 3, 2
+xn, yn = np.meshgrid(np.arange(nx + 1) * 2.5, np.arange(ny + 1) * 1.25)
+nodes = pd.DataFrame({'node_n' : np.arange(1, xn.size + 1),
+                      'x' : xn.ravel(), 'y' : yn.ravel(),
+                      'BC' : np.where(yn.ravel() == 0, 3, 0), 'OUT' : 1})
+for col in ['X2IH', 'X1IH', 'XIH', 'X2IV', 'X1IV', 'XIV']:
+    nodes[col] = 0.0
+
+i, j = np.meshgrid(np.arange(nx), np.arange(ny))
+N1 = (j * (nx + 1) + i + 1).ravel()
+elems = pd.DataFrame({'n' : np.arange(1, nx * ny + 1),
+                      'N1' : N1, 'N2' : N1 + 1, 'N3' : N1 + nx + 2,
+                      'N4' : N1 + nx + 1, 's_num' : 1, 'unit_w' : 19000,
+                      'po' : 0.35, 'Gmax' : 8.5e7, 'G' : 8.5e7, 'XL' : 0.05,
+                      'LSTR' : 0})
+
+Q = q4m_files.gen_Q({'FTITLE' : 'test', 'STITLE' : 'template',
+                     'NELM' : len(elems), 'NDPT' : len(nodes),
+                     'KGMAX' : 1000, 'KGEQ' : 1000, 'N3EQ' : 1000,
+                     'DTEQ' : 0.01, 'HDRX' : 1, 'NPLX' : 1,
+                     'EARTHQH' : 'motion.txt', 'EQINPFMT1' : '(F10.0)',
+                     'SFILEOUT' : 'out', 'AFILEOUT' : 'out'})
+
+out_path = tempfile.mkdtemp() + '/'
+
+def read_bytes(fname):
+    with open(out_path + fname, 'rb') as f:
+        return f.read()
+
+
+#%% Files from a template are byte-identical to files from scratch
+template = q4m_files.gen_q4r_template(Q, elems, nodes)
+rng = np.random.default_rng(0)
+
+for k in range(3):
+    elems['s_num'] = rng.integers(1, 4, len(elems))
+    elems['Gmax']  = rng.lognormal(18, 0.3, len(elems))
+    elems['G']     = elems['Gmax'] * 0.8
+    elems['XL']    = rng.uniform(0.01, 0.1, len(elems))
+
+    L = q4m_files.gen_q4r(Q, elems, nodes, out_path, 'scratch.q4r')
+    ok = q4m_files.gen_q4r(Q, elems, None, out_path, 'template.q4r',
+                           template = template)
+
+    assert L and ok
+    assert read_bytes('scratch.q4r') == read_bytes('template.q4r')
+
+print('Template files are byte-identical :)')
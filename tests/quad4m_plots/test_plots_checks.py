@@ -0,0 +1,78 @@
+'''
+TITLE:     test_plots_checks.py
+TASK_TYPE: test
+PURPOSE:   Check mesh vertices from get_verts, and batch rendering of mesh
+           property figures for many realizations
+'''
+#%% Import modules
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import llgeo.quad4m.plots_checks as q4m_plots
+
+# Regular mesh with nodes in random order, and node numbers starting at 1
+nx, ny = 12, 5
+X, Y = np.meshgrid(np.arange(nx + 1.), np.arange(ny + 1.) / 2)
+ids = np.arange(1, X.size + 1).reshape(ny + 1, nx + 1)
+
+nodes = pd.DataFrame({'node_n' : ids.ravel(), 'x' : X.ravel(), 'y' : Y.ravel()})
+nodes = nodes.sample(frac = 1, random_state = 1)
+elems = pd.DataFrame({'N1' : ids[:-1, :-1].ravel(), 'N2' : ids[:-1, 1:].ravel(),
+                      'N3' : ids[1:, 1:].ravel(),   'N4' : ids[1:, :-1].ravel()})
+
+
+#%% Vertices are the node coordinates of each corner
+verts, _ = q4m_plots.get_verts(elems, nodes)
+nodes_idx = nodes.set_index('node_n')
+
+assert verts.shape == (len(elems), 4, 2)
+for i, elem in elems.iterrows():
+    for j, n in enumerate(['N1', 'N2', 'N3', 'N4']):
+        assert np.all(verts[i, j] == nodes_idx.loc[elem[n], ['x', 'y']].values)
+
+print('Mesh vertices are OK :)')
+
+
+#%% Batch rendering saves one figure per realization
+vals = np.random.default_rng(0).uniform(100, 300, (5, len(elems)))
+names = ['real_' + str(k) for k in range(len(vals))]
+
+with tempfile.TemporaryDirectory() as fig_path:
+    q4m_plots.render_mesh_props(elems, nodes, vals, 'Vs', fig_path + '/', names,
+                                units = 'm/s', nworkers = 2, chunk = 2,
+                                save_kwargs = {'png_opt' : {'dpi' : 50}})
+    saved = sorted(os.listdir(fig_path))
+
+assert saved == [n + '.png' for n in names]
+print('Batch rendering is OK :)')
+
+
+#%% Precomputed vertices are reused (get_verts is not called again)
+from matplotlib.figure import Figure
+
+get_verts = q4m_plots.get_verts
+def no_get_verts(elems, nodes):
+    raise AssertionError('vertices should be reused, not built again')
+
+q4m_plots.get_verts = no_get_verts
+try:
+    for prop in ['Vs', 'Gmax']:
+        fig = Figure()
+        ax = fig.add_subplot()
+        q4m_plots.plot_mesh_elem_prop(elems.assign(**{prop : vals[0]}), nodes,
+                                      prop, fig, ax, verts = verts)
+        paths = ax.collections[0].get_paths()
+        assert np.allclose([p.vertices[:4] for p in paths], verts)
+
+    with tempfile.TemporaryDirectory() as fig_path:
+        q4m_plots.render_mesh_props(elems, nodes, vals, 'Vs', fig_path + '/',
+                                    names, nworkers = 1, chunk = 2,
+                                    verts = verts,
+                                    save_kwargs = {'png_opt' : {'dpi' : 50}})
+        saved = sorted(os.listdir(fig_path))
+finally:
+    q4m_plots.get_verts = get_verts
+
+assert saved == [n + '.png' for n in names]
+print('Precomputed vertices are reused :)')
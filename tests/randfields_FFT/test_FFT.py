@@ -0,0 +1,67 @@
+'''
+TITLE:     test_FFT.py
+TASK_TYPE: test
+PURPOSE:   Check that random fields from circulant embedding (FFT backend) have
+           the mean, variance, and correlation expected from LAS (cell averages)
+'''
+#%% Import modules
+import numpy as np
+import llgeo.rand_fields.FFT as llgeo_fft
+
+# Variance function of the Markov model (Fenton & Griffiths 2008), which gives
+# the variance reduction of local averages over a length T
+gamma = lambda T, th: th**2 / (2 * T**2) * (2 * T / th + np.exp(-2 * T / th) - 1)
+
+
+#%% 1D Markov field: mean, variance and lag-1 covariance of cell averages
+n, xl, zm, thx, pa = 37, 30, 1.0, 5.0, 0.3
+dx = xl / n
+
+Zs = llgeo_fft.sim1d_batch(n, xl, zm, pa, thx, 'dlavx1', pa, 0, 20000, 514)
+
+var_exp = pa * gamma(dx, thx)
+cov_exp = pa / 2 * (4 * gamma(2 * dx, thx) - 2 * gamma(dx, thx))
+cov_sim = np.mean((Zs[:, :-1] - zm) * (Zs[:, 1:] - zm))
+
+assert np.abs(np.mean(Zs) - zm) < 0.01
+assert np.abs(np.var(Zs, axis = 0).mean() / var_exp - 1) < 0.03
+assert np.abs(cov_sim / cov_exp - 1) < 0.03
+print('1D Markov field statistics are OK :)')
+
+
+#%% 2D fields at points: variance and correlation in each direction
+n1, n2, xl, yl = 50, 33, 100, 20
+dx, dy = xl / n1, yl / n2
+
+for fnc, rho in [('dlspx2', lambda t, th: np.exp(-np.pi * (t / th)**2)),
+                 ('dlavx2', lambda t, th: np.exp(-2 * t / th))]:
+
+    Zs = llgeo_fft.sim2d_batch(n1, n2, xl, yl, 0, 1, 10, 4, fnc, 1, 0, 2000,
+                               '', 514, local_avg = False)
+
+    assert np.abs(np.var(Zs) - 1) < 0.03
+    assert np.abs(np.mean(Zs[:, :-1, :] * Zs[:, 1:, :]) - rho(dx, 10)) < 0.03
+    assert np.abs(np.mean(Zs[:, :, :-1] * Zs[:, :, 1:]) - rho(dy,  4)) < 0.03
+
+print('2D field statistics are OK :)')
+
+
+#%% Same seed gives the same fields, regardless of chunk size
+a = llgeo_fft.sim2d_batch(10, 12, 1, 1, 0, 1, 1, 1, 'dlavx2', 1, 0, 7, '', 42,
+                          chunk = 2)
+b = llgeo_fft.sim2d_batch(10, 12, 1, 1, 0, 1, 1, 1, 'dlavx2', 1, 0, 7, '', 42)
+
+assert np.allclose(a, b)
+print('Fields are reproducible :)')
+
+
+#%% Parallel generation gives the same fields regardless of number of workers
+import llgeo.rand_fields.parallel as llgeo_par
+
+a = llgeo_par.sim2d_parallel(20, 10, 1, 1, 0, 1, 1, 1, 'dlavx2', 1, 0, 250, '',
+                             42, nworkers = 1, block = 50)
+b = llgeo_par.sim2d_parallel(20, 10, 1, 1, 0, 1, 1, 1, 'dlavx2', 1, 0, 250, '',
+                             42, nworkers = 3, block = 50)
+
+assert np.array_equal(a, b)
+print('Parallel fields are reproducible :)')
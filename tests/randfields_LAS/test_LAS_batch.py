@@ -0,0 +1,53 @@
+'''
+TITLE:     test_LAS_batch.py
+TASK_TYPE: test
+PURPOSE:   Check that batched LAS realizations (sim1dn / sim2dn) are the same as
+           those generated one at a time by the original Fortran routines
+           (sim1d / sim2d). Skipped if simLAS is not compiled.
+'''
+#%% Import modules
+import sys
+import numpy as np
+
+try:
+    import llgeo.rand_fields.LAS as llgeo_las
+except ImportError:
+    print('simLAS is not compiled, skipping LAS batch tests')
+    sys.exit()
+
+LAS = llgeo_las.LAS   # compiled module (F77_to_py/simLAS)
+
+
+#%% 1D: sim1d_batch is the same as calling sim1d once per realization
+n, xl, zm, zv, thx, fnc, pa, pb, nsims, kseed = \
+    64, 32., 1., 0.3, 4., 'dlavx1', 0.3, 0., 20, 514
+
+# Reference first (LAS keeps its state between calls, so no interleaving)
+ref = np.array([LAS.sim1d(n, xl, zm, zv, thx, fnc, pa, pb, kseed, 7, i + 1)[:n]
+                for i in range(nsims)])
+Zs = llgeo_las.sim1d_batch(n, xl, zm, zv, thx, fnc, pa, pb, nsims, kseed,
+                           first = 1)
+
+assert Zs.shape == (nsims, n)
+assert np.array_equal(Zs, ref.astype(Zs.dtype))
+
+# Chunks continue the same field
+Zs = np.concatenate(list(llgeo_las.iter_sim1d(n, xl, zm, zv, thx, fnc, pa, pb,
+                                              nsims, kseed, chunk = 7)))
+assert np.array_equal(Zs, ref.astype(Zs.dtype))
+print('1D batches match one-at-a-time realizations :)')
+
+
+#%% 2D: sim2d_batch is the same as calling sim2d once per realization
+n1, n2, xl, yl, thx, thy, fnc, outf = 32, 16, 64., 16., 8., 2., 'dlavx2', \
+                                      'las2d.out'
+
+ref = np.array([LAS.sim2d(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, kseed,
+                          outf, i + 1)[0:n1 * n2].reshape(n1, n2, order = 'F')
+                for i in range(nsims)])
+Zs = llgeo_las.sim2d_batch(n1, n2, xl, yl, zm, zv, thx, thy, fnc, pa, pb, nsims,
+                           outf, kseed, first = 1)
+
+assert Zs.shape == (nsims, n1, n2)
+assert np.array_equal(Zs, ref.astype(Zs.dtype))
+print('2D batches match one-at-a-time realizations :)')